@@ -9,7 +9,8 @@ data_preprocessor = dict(
     pad_val=0,
     seg_pad_val=255,
     size_divisor=32,
-    test_cfg=dict(size_divisor=32))
+    test_cfg=dict(size_divisor=32),
+    non_blocking=True)
 
 model = dict(
     type='DualSiamEncoderMultiDecoder',
@@ -0,0 +1,35 @@
+_base_ = ['./ban_vit-b16-clip_mit-b0_512x512_40k_levircd.py']
+
+# Same model and schedule as the base config, with half of the samples drawn
+# among the images with change and half of the crops placed on change.
+# Compare the two runs with tools/analysis_tools/compare_convergence.py from
+# open-cd, see the README.
+crop_size = (512, 512)
+train_pipeline = [
+    dict(type='MultiImgLoadImageFromFile'),
+    dict(type='MultiImgLoadAnnotations'),
+    dict(
+        type='MultiImgRandomRotateCrop',
+        crop_size=crop_size,
+        prob=0.5,
+        degree=180,
+        cat_max_ratio=0.75,
+        positive_ratio=0.5),
+    dict(type='MultiImgRandomFlip', prob=0.5, direction='horizontal'),
+    dict(type='MultiImgRandomFlip', prob=0.5, direction='vertical'),
+    dict(
+        type='MultiImgPhotoMetricDistortion',
+        brightness_delta=10,
+        contrast_range=(0.8, 1.2),
+        saturation_range=(0.8, 1.2),
+        hue_delta=10),
+    dict(type='MultiImgPackSegInputs', compact_labels=True)
+]
+train_dataloader = dict(
+    sampler=dict(
+        _delete_=True,
+        type='ChangeAwareSampler',
+        positive_ratio=0.5,
+        tile_size=64,
+        stats_file='data/LEVIR-CD/train_change_stats.pkl'),
+    dataset=dict(pipeline=train_pipeline))
@@ -0,0 +1,31 @@
+_base_ = ['./ban_vit-b16-clip_mit-b0_512x512_40k_levircd.py']
+
+# Inference on the per-zone date pairs written by the Visualizador pipeline
+# as COGs, ``test/{A,B,label}/{zone}/{date_a}_{date_b}.tif``.
+# Predicted masks are written directly to the same keyed layout below
+# ``out_dir``, as COGs with the CRS and transform of the A image.
+dataset_type = 'ZoneCD_Dataset'
+
+test_pipeline = [
+    dict(type='MultiImgLoadImageFromFile'),
+    dict(type='MultiImgResize', scale=(1024, 1024), keep_ratio=True),
+    dict(type='MultiImgLoadAnnotations'),
+    dict(
+        type='MultiImgPackSegInputs',
+        meta_keys=('img_path', 'seg_map_path', 'ori_shape', 'img_shape',
+                   'pad_shape', 'scale_factor', 'flip', 'flip_direction',
+                   'zone', 'date_a', 'date_b'),
+        compact_labels=True)
+]
+test_dataloader = dict(
+    dataset=dict(
+        type=dataset_type,
+        img_suffix='.tif',
+        seg_map_suffix='.tif',
+        pipeline=test_pipeline))
+
+default_hooks = dict(
+    mask_writer=dict(
+        type='KeyedMaskWriterHook',
+        out_dir='../Visualizador/Archivos/Label',
+        layout='{zone}/{date_a}_{date_b}.tif'))
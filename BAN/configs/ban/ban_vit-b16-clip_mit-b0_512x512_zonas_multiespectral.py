@@ -0,0 +1,49 @@
+_base_ = ['./ban_vit-b16-clip_mit-b0_512x512_zonas.py']
+
+# Multispectral variant of the per-zone inference. Instead of the 8-bit RGB
+# composites, every sample reads the Sentinel-2 band archives of its two dates
+# (``test/{A,B}/{zone}/{date_a}_{date_b}.zip``, written by GeneradorMascaras
+# with MULTIESPECTRAL enabled) as 4-band float16 B, G, R, NIR images.
+#
+# The CLIP encoder keeps its pretrained RGB input (``encoder_bands``), the
+# side encoder of the adapter sees the 4 bands; its first patch embedding is
+# therefore not loaded from the RGB MiT-B0 checkpoint and this model needs
+# weights fine-tuned on 4-band pairs.
+bands = ('B02', 'B03', 'B04', 'B08')
+bands_per_timestamp = len(bands)
+
+# 255 / 3000 maps the usual 0-0.3 reflectance range of true colour composites
+# (Sentinel-2 L2A digital numbers / 10000) onto the 0-255 range the RGB
+# weights were trained on, without clipping the brighter pixels.
+reflectance_scale = 255 / 3000
+
+# after bgr_to_rgb the channels of each date are R, G, B, NIR
+data_preprocessor = dict(
+    mean=[122.7709, 116.7460, 104.0937, 127.5] * 2,
+    std=[68.5005, 66.6322, 70.3232, 127.5] * 2,
+    bands_per_timestamp=bands_per_timestamp)
+
+model = dict(
+    data_preprocessor=data_preprocessor,
+    bands_per_timestamp=bands_per_timestamp,
+    encoder_bands=(0, 1, 2),
+    decode_head=dict(
+        ban_cfg=dict(side_enc_cfg=dict(in_channels=bands_per_timestamp))))
+
+# no MultiImgResize: cv2.resize has no float16 support, and the tiles are
+# read at their native 10 m resolution anyway
+test_pipeline = [
+    dict(
+        type='MultiImgLoadMultispectralFromFile',
+        bands=bands,
+        scale=reflectance_scale),
+    dict(type='MultiImgLoadAnnotations'),
+    dict(
+        type='MultiImgPackSegInputs',
+        meta_keys=('img_path', 'seg_map_path', 'ori_shape', 'img_shape',
+                   'pad_shape', 'scale_factor', 'flip', 'flip_direction',
+                   'zone', 'date_a', 'date_b'),
+        compact_labels=True)
+]
+test_dataloader = dict(
+    dataset=dict(img_suffix='.zip', pipeline=test_pipeline))
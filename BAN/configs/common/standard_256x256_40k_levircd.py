@@ -7,8 +7,12 @@ crop_size = (256, 256)
 train_pipeline = [
     dict(type='MultiImgLoadImageFromFile'),
     dict(type='MultiImgLoadAnnotations'),
-    dict(type='MultiImgRandomRotate', prob=0.5, degree=180),
-    dict(type='MultiImgRandomCrop', crop_size=crop_size, cat_max_ratio=0.75),
+    dict(
+        type='MultiImgRandomRotateCrop',
+        crop_size=crop_size,
+        prob=0.5,
+        degree=180,
+        cat_max_ratio=0.75),
     dict(type='MultiImgRandomFlip', prob=0.5, direction='horizontal'),
     dict(type='MultiImgRandomFlip', prob=0.5, direction='vertical'),
     # dict(type='MultiImgExchangeTime', prob=0.5),
@@ -18,7 +22,7 @@ train_pipeline = [
         contrast_range=(0.8, 1.2),
         saturation_range=(0.8, 1.2),
         hue_delta=10),
-    dict(type='MultiImgPackSegInputs')
+    dict(type='MultiImgPackSegInputs', compact_labels=True)
 ]
 test_pipeline = [
     dict(type='MultiImgLoadImageFromFile'),
@@ -26,7 +30,7 @@ test_pipeline = [
     # add loading annotation after ``Resize`` because ground truth
     # does not need to do resize data transform
     dict(type='MultiImgLoadAnnotations'),
-    dict(type='MultiImgPackSegInputs')
+    dict(type='MultiImgPackSegInputs', compact_labels=True)
 ]
 img_ratios = [0.75, 1.0, 1.25]
 tta_pipeline = [
@@ -43,13 +47,14 @@ tta_pipeline = [
                 dict(type='MultiImgRandomFlip', prob=1., direction='horizontal')
             ],
             [dict(type='MultiImgLoadAnnotations')],
-            [dict(type='MultiImgPackSegInputs')]
+            [dict(type='MultiImgPackSegInputs', compact_labels=True)]
         ])
 ]
 train_dataloader = dict(
     batch_size=8,
     num_workers=4,
     persistent_workers=True,
+    pin_memory=True,
     sampler=dict(type='InfiniteSampler', shuffle=True),
     dataset=dict(
         type=dataset_type,
@@ -63,6 +68,7 @@ val_dataloader = dict(
     batch_size=1,
     num_workers=4,
     persistent_workers=True,
+    pin_memory=True,
     sampler=dict(type='DefaultSampler', shuffle=False),
     dataset=dict(
         type=dataset_type,
@@ -76,6 +82,7 @@ test_dataloader = dict(
     batch_size=1,
     num_workers=4,
     persistent_workers=True,
+    pin_memory=True,
     sampler=dict(type='DefaultSampler', shuffle=False),
     dataset=dict(
         type=dataset_type,
@@ -86,10 +93,8 @@ test_dataloader = dict(
             img_path_to='test/B'),
         pipeline=test_pipeline))
 
-val_evaluator = dict(type='mmseg.IoUMetric', iou_metrics=['mFscore', 'mIoU'])
-test_evaluator = dict(
-    type='mmseg.IoUMetric',
-    iou_metrics=['mFscore', 'mIoU'])
+val_evaluator = dict(type='StreamingCDMetric')
+test_evaluator = dict(type='StreamingCDMetric')
 
 # optimizer
 optimizer=dict(
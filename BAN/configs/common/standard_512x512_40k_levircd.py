@@ -4,8 +4,12 @@ crop_size = (512, 512)
 train_pipeline = [
     dict(type='MultiImgLoadImageFromFile'),
     dict(type='MultiImgLoadAnnotations'),
-    dict(type='MultiImgRandomRotate', prob=0.5, degree=180),
-    dict(type='MultiImgRandomCrop', crop_size=crop_size, cat_max_ratio=0.75),
+    dict(
+        type='MultiImgRandomRotateCrop',
+        crop_size=crop_size,
+        prob=0.5,
+        degree=180,
+        cat_max_ratio=0.75),
     dict(type='MultiImgRandomFlip', prob=0.5, direction='horizontal'),
     dict(type='MultiImgRandomFlip', prob=0.5, direction='vertical'),
     # dict(type='MultiImgExchangeTime', prob=0.5),
@@ -15,7 +19,7 @@ train_pipeline = [
         contrast_range=(0.8, 1.2),
         saturation_range=(0.8, 1.2),
         hue_delta=10),
-    dict(type='MultiImgPackSegInputs')
+    dict(type='MultiImgPackSegInputs', compact_labels=True)
 ]
 
 train_dataloader = dict(
@@ -25,6 +25,10 @@ def parse_args():
         help='directory where painted images will be saved. '
         'If specified, it will be automatically saved '
         'to the work_dir/timestamp/show_dir')
+    parser.add_argument(
+        '--out-dir',
+        help='directory where the predicted masks are written by '
+        '`KeyedMaskWriterHook`, overrides the `out_dir` of the config')
     parser.add_argument(
         '--wait-time', type=float, default=2, help='the interval of show (s)')
     parser.add_argument(
@@ -96,6 +100,13 @@ def main():
 
     cfg.load_from = args.checkpoint
 
+    if args.out_dir is not None:
+        if 'mask_writer' not in cfg.default_hooks:
+            raise RuntimeError(
+                '`--out-dir` requires `mask_writer=dict('
+                'type=\'KeyedMaskWriterHook\')` in default_hooks.')
+        cfg.default_hooks.mask_writer.out_dir = args.out_dir
+
     if args.show or args.show_dir:
         cfg = trigger_visualization_hook(cfg, args)
 
@@ -1 +1,3 @@
-from .models import *  # noqa: F401,F403
\ No newline at end of file
+from .datasets import *  # noqa: F401,F403
+from .engine import *  # noqa: F401,F403
+from .models import *  # noqa: F401,F403
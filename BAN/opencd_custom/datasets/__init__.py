@@ -0,0 +1,3 @@
+from .zone_cd import ZoneCD_Dataset
+
+__all__ = ['ZoneCD_Dataset']
@@ -0,0 +1,63 @@
+import json
+import os.path as osp
+from typing import List
+
+from opencd.datasets import LEVIR_CD_Dataset
+from opencd.registry import DATASETS
+
+
+@DATASETS.register_module()
+class ZoneCD_Dataset(LEVIR_CD_Dataset):
+    """Change detection dataset for the per-zone Sentinel-2 date pairs.
+
+    Images are expected in a keyed layout below each data prefix, i.e.
+    ``{zone}/{date_a}_{date_b}{img_suffix}``. The zone and the two dates are
+    carried with every sample as ``zone``, ``date_a`` and ``date_b``, so
+    output hooks can write results back to the same key instead of relying
+    on file ordering.
+
+    The dates are read from ``{zone}/{pairs_file}`` in the A image directory,
+    a JSON object mapping each ``{date_a}_{date_b}`` key to its
+    ``[date_a, date_b]`` (written by GeneradorMascaras), since a date name
+    may itself contain ``_``. Without that file the key is split at its only
+    ``_``, and ambiguous keys are rejected.
+
+    Args:
+        pairs_file (str): Name of the per-zone pairs file.
+            Defaults to 'pares.json'.
+    """
+
+    def __init__(self, pairs_file: str = 'pares.json', **kwargs) -> None:
+        self.pairs_file = pairs_file
+        super().__init__(**kwargs)
+
+    def load_pairs(self, zone_dir: str) -> dict:
+        """Load the ``{key: [date_a, date_b]}`` pairs file of a zone, empty
+        when the zone has none."""
+        pairs_path = osp.join(zone_dir, self.pairs_file)
+        if not osp.isfile(pairs_path):
+            return dict()
+        with open(pairs_path) as f:
+            return json.load(f)
+
+    def load_data_list(self) -> List[dict]:
+        data_list = super().load_data_list()
+        img_dir_from = self.data_prefix.get('img_path_from', None)
+        zone_pairs = dict()
+        for data_info in data_list:
+            rel_path = osp.relpath(data_info['img_path'][0], img_dir_from)
+            zone = osp.dirname(rel_path)
+            if zone not in zone_pairs:
+                zone_pairs[zone] = self.load_pairs(
+                    osp.join(img_dir_from, zone))
+            pair = osp.splitext(osp.basename(rel_path))[0]
+            if pair in zone_pairs[zone]:
+                date_a, date_b = zone_pairs[zone][pair]
+            else:
+                pairs_path = osp.join(img_dir_from, zone, self.pairs_file)
+                assert pair.count('_') == 1, (
+                    f'Cannot split "{pair}" in zone "{zone}" into two '
+                    f'dates, list it in {pairs_path}')
+                date_a, date_b = pair.split('_')
+            data_info.update(zone=zone, date_a=date_a, date_b=date_b)
+        return data_list
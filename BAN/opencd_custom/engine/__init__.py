@@ -0,0 +1 @@
+from .hooks import *
@@ -0,0 +1,3 @@
+from .keyed_mask_hook import KeyedMaskWriterHook
+
+__all__ = ['KeyedMaskWriterHook']
@@ -0,0 +1,40 @@
+import os.path as osp
+
+from opencd.engine.hooks import PredictionWriterHook
+from opencd.registry import HOOKS
+
+
+@HOOKS.register_module()
+class KeyedMaskWriterHook(PredictionWriterHook):
+    """Write predicted change masks to a keyed output layout.
+
+    Each mask is saved as ``out_dir/layout`` where ``layout`` is formatted
+    with the sample's meta information (e.g. ``zone``, ``date_a`` and
+    ``date_b`` carried by :class:`ZoneCD_Dataset`). Writing is delegated to
+    :class:`PredictionWriterHook`, so the masks are encoded by the shared
+    background writer, without any visualizer work. The extension of
+    ``layout`` selects the format: ``.png`` for single channel uint8 PNGs,
+    ``.tif`` for Cloud Optimized GeoTIFFs georeferenced like the source
+    image.
+
+    Args:
+        out_dir (str): Root directory of the written masks.
+        layout (str): Relative path template of each mask. Defaults to
+            ``'{zone}/{date_a}_{date_b}.png'``.
+        scale (int): Factor applied to the predicted class index before
+            saving, 255 writes binary masks as black/white. Defaults to 255.
+    """
+
+    def __init__(self,
+                 out_dir: str,
+                 layout: str = '{zone}/{date_a}_{date_b}.png',
+                 scale: int = 255):
+        filename_tmpl, ext = osp.splitext(layout)
+        assert ext in ('.png', '.tif', '.npz'), \
+            '`layout` should end with a ".png", ".tif" or ".npz" ' \
+            f'extension, but got {layout}'
+        super().__init__(
+            out_dir=out_dir,
+            file_format=ext[1:],
+            filename_tmpl=filename_tmpl,
+            scale=scale)
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Optional, Sequence, Tuple
 
 import torch
 import torch.nn.functional as F
@@ -62,6 +62,12 @@ class DualSiamEncoderDecoder(BaseSegmentor):
             and decode head. Defaults to False.
         encoder_resolution (float): resize scale of input images for image encoder.
             Defaults to None.
+        bands_per_timestamp (int): Number of channels of each timestamp in the
+            concatenated inputs, e.g. 4 for multispectral R, G, B and NIR.
+            Defaults to 3.
+        encoder_bands (Sequence[int], optional): Channels of each timestamp fed
+            to the image encoder, whose pretrained weights expect RGB, while
+            the decode head sees all of them. Defaults to None, all channels.
         init_cfg (dict, optional): The weight initialized config for
             :class:`BaseModule`.
     """  # noqa: E501
@@ -75,6 +81,8 @@ class DualSiamEncoderDecoder(BaseSegmentor):
                  pretrained: Optional[str] = None,
                  asymetric_input: bool = True,
                  encoder_resolution: OptConfigType = None,
+                 bands_per_timestamp: int = 3,
+                 encoder_bands: Optional[Sequence[int]] = None,
                  init_cfg: OptMultiConfig = None):
         super().__init__(
             data_preprocessor=data_preprocessor, init_cfg=init_cfg)
@@ -90,6 +98,9 @@ class DualSiamEncoderDecoder(BaseSegmentor):
                 'clip_resolution must be a certain value'
         self.asymetric_input = asymetric_input
         self.encoder_resolution = encoder_resolution
+        self.bands_per_timestamp = bands_per_timestamp
+        self.encoder_bands = list(encoder_bands) \
+            if encoder_bands is not None else None
         self.image_encoder = MODELS.build(image_encoder)
         self._init_decode_head(decode_head)
 
@@ -105,6 +116,23 @@ class DualSiamEncoderDecoder(BaseSegmentor):
         self.num_classes = self.decode_head.num_classes
         self.out_channels = self.decode_head.out_channels
 
+    def split_inputs(self, inputs: Tensor) -> Tuple[Tensor, ...]:
+        """Split the concatenated inputs into the images of both timestamps,
+        for the decode head, and their image encoder inputs, restricted to
+        ``encoder_bands`` and resized to ``encoder_resolution``."""
+        img_from, img_to = torch.split(inputs, self.bands_per_timestamp, dim=1)
+
+        fm_img_from, fm_img_to = img_from, img_to
+        if self.encoder_bands is not None:
+            fm_img_from = fm_img_from[:, self.encoder_bands]
+            fm_img_to = fm_img_to[:, self.encoder_bands]
+        if self.asymetric_input:
+            fm_img_from = F.interpolate(
+                fm_img_from, **self.encoder_resolution)
+            fm_img_to = F.interpolate(
+                fm_img_to, **self.encoder_resolution)
+        return img_from, img_to, fm_img_from, fm_img_to
+
     def extract_feat(self, inputs: Tensor) -> List[Tensor]:
         """Extract visual features from images."""
         x = self.image_encoder(inputs)
@@ -118,14 +146,7 @@ class DualSiamEncoderDecoder(BaseSegmentor):
         Then decode the class embedding and visual feature into a semantic
         segmentation map of the same size as input.
         """
-        img_from, img_to = torch.split(inputs, 3, dim=1)
-
-        fm_img_from, fm_img_to = img_from, img_to
-        if self.asymetric_input:
-            fm_img_from = F.interpolate(
-                fm_img_from, **self.encoder_resolution)
-            fm_img_to = F.interpolate(
-                fm_img_to, **self.encoder_resolution)
+        img_from, img_to, fm_img_from, fm_img_to = self.split_inputs(inputs)
         fm_feat_from = self.image_encoder(fm_img_from)
         fm_feat_to = self.image_encoder(fm_img_to)
         seg_logits = self.decode_head.predict([img_from, img_to, fm_feat_from, fm_feat_to],
@@ -156,14 +177,7 @@ class DualSiamEncoderDecoder(BaseSegmentor):
         Returns:
             dict[str, Tensor]: a dictionary of loss components
         """
-        img_from, img_to = torch.split(inputs, 3, dim=1)
-
-        fm_img_from, fm_img_to = img_from, img_to
-        if self.asymetric_input:
-            fm_img_from = F.interpolate(
-                fm_img_from, **self.encoder_resolution)
-            fm_img_to = F.interpolate(
-                fm_img_to, **self.encoder_resolution)
+        img_from, img_to, fm_img_from, fm_img_to = self.split_inputs(inputs)
         fm_feat_from = self.image_encoder(fm_img_from)
         fm_feat_to = self.image_encoder(fm_img_to)
 
@@ -226,14 +240,7 @@ class DualSiamEncoderDecoder(BaseSegmentor):
         Returns:
             Tensor: Forward output of model without any post-processes.
         """
-        img_from, img_to = torch.split(inputs, 3, dim=1)
-
-        fm_img_from, fm_img_to = img_from, img_to
-        if self.asymetric_input:
-            fm_img_from = F.interpolate(
-                fm_img_from, **self.encoder_resolution)
-            fm_img_to = F.interpolate(
-                fm_img_to, **self.encoder_resolution)
+        img_from, img_to, fm_img_from, fm_img_to = self.split_inputs(inputs)
         fm_feat_from = self.extract_feat(fm_img_from)
         fm_feat_to = self.extract_feat(fm_img_to)
         return self.decode_head.forward([img_from, img_to, fm_feat_from, fm_feat_to])
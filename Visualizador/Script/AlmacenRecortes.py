@@ -0,0 +1,183 @@
+import json
+import os
+import sqlite3
+
+# Almacén indexado de recortes. Reemplaza al antiguo recortes.json: cada recorte
+# es una fila y la búsqueda por (zona, fecha_a, fecha_b) usa un índice, por lo
+# que ni el arranque ni la memoria crecen con el número total de recortes.
+# Los polígonos de cambio (PoligonosCambio) se guardan con sus medidas y un
+# índice espacial R*Tree sobre su caja: "cambios de más de X m² cerca de Y" es
+# una búsqueda en el índice y no una nueva lectura de las máscaras.
+
+COLUMNAS = ("Rec_A", "Rec_B", "Rec_L", "Eti_A", "Eti_B")
+# PRAGMA user_version de una base a la que ya se migró recortes.json
+VERSION_MIGRADA = 1
+COLUMNAS_POLIGONOS = ("Zona", "Clave", "Clase", "Area", "Perimetro", "X", "Y")
+
+def formar_clave(fecha_a, fecha_b):
+    return f"{fecha_a}_{fecha_b}"
+
+def conectar(ruta_db):
+    # Abre (o crea) la base de datos y garantiza que exista el esquema
+    conexion = sqlite3.connect(ruta_db)
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS recortes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            zona TEXT NOT NULL,
+            clave TEXT NOT NULL,
+            rec_a TEXT NOT NULL,
+            rec_b TEXT NOT NULL,
+            rec_l TEXT NOT NULL,
+            eti_a TEXT,
+            eti_b TEXT
+        )""")
+    conexion.execute(
+        "CREATE INDEX IF NOT EXISTS idx_recortes_zona_clave ON recortes (zona, clave)")
+    conexion.execute("""
+        CREATE TABLE IF NOT EXISTS poligonos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            zona TEXT NOT NULL,
+            clave TEXT NOT NULL,
+            clase INTEGER NOT NULL,
+            area REAL NOT NULL,
+            perimetro REAL NOT NULL,
+            cx REAL NOT NULL,
+            cy REAL NOT NULL,
+            crs TEXT,
+            geometria TEXT NOT NULL
+        )""")
+    conexion.execute(
+        "CREATE INDEX IF NOT EXISTS idx_poligonos_zona_clave ON poligonos (zona, clave, area)")
+    # Misma id que en poligonos; caja en las unidades del CRS de la máscara
+    conexion.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS rtree_poligonos USING rtree (id, minx, maxx, miny, maxy)")
+    return conexion
+
+def _reemplazar_recortes(conexion, zona, clave, detalles):
+    # Los recortes de un par se guardan como un bloque: volver a recortar el par
+    # sustituye sus filas (las rutas crop_{j}.png se reescriben) en lugar de duplicarlas
+    conexion.execute("DELETE FROM recortes WHERE zona = ? AND clave = ?", (zona, clave))
+    conexion.executemany(
+        "INSERT INTO recortes (zona, clave, rec_a, rec_b, rec_l, eti_a, eti_b) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(zona, clave, d["Rec_A"], d["Rec_B"], d["Rec_L"], d.get("Eti_A"), d.get("Eti_B"))
+         for d in detalles])
+
+def guardar_recortes(ruta_db, zona, clave, detalles):
+    # Escribe solo las filas del par de fechas, sin leer ni reescribir el resto
+    conexion = conectar(ruta_db)
+    try:
+        with conexion:
+            _reemplazar_recortes(conexion, zona, clave, detalles)
+    finally:
+        conexion.close()
+
+def obtener_recortes(ruta_db, zona, fecha_a, fecha_b):
+    # Búsqueda por índice de los recortes de un par de fechas de una zona
+    conexion = conectar(ruta_db)
+    try:
+        filas = conexion.execute(
+            "SELECT rec_a, rec_b, rec_l, eti_a, eti_b FROM recortes "
+            "WHERE zona = ? AND clave = ? ORDER BY id",
+            (zona, formar_clave(fecha_a, fecha_b))).fetchall()
+    finally:
+        conexion.close()
+    return [dict(zip(COLUMNAS, fila)) for fila in filas]
+
+def guardar_etiquetas(ruta_db, zona, clave, detalles):
+    # Actualiza las clases de recortes ya guardados (identificados por su Rec_A)
+    conexion = conectar(ruta_db)
+    try:
+        with conexion:
+            conexion.executemany(
+                "UPDATE recortes SET eti_a = ?, eti_b = ? WHERE zona = ? AND clave = ? AND rec_a = ?",
+                [(d["Eti_A"], d["Eti_B"], zona, clave, d["Rec_A"]) for d in detalles])
+    finally:
+        conexion.close()
+
+def importar_json(ruta_db, ruta_json):
+    # Migración única desde el recortes.json monolítico, en una sola
+    # transacción. PRAGMA user_version marca la base como migrada: una
+    # migración interrumpida no deja nada a medias y, si el visualizador y
+    # RecortesLabel arrancan a la vez, BEGIN IMMEDIATE hace que el segundo
+    # espere al primero y encuentre la marca
+    conexion = conectar(ruta_db)
+    conexion.isolation_level = None
+    try:
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            version = conexion.execute("PRAGMA user_version").fetchone()[0]
+            # Bases anteriores a la marca con filas: la migración ya se hizo
+            vacia = conexion.execute("SELECT 1 FROM recortes LIMIT 1").fetchone() is None
+            if version < VERSION_MIGRADA and vacia and os.path.exists(ruta_json):
+                with open(ruta_json, 'r') as f:
+                    zonas = json.load(f)
+                vistas = set()
+                for zona in zonas:
+                    for recorte in zona['recortes']:
+                        for clave, detalles in recorte.items():
+                            # Como obtener_valores, vale la primera aparición de cada par
+                            if (zona['zona'], clave) not in vistas:
+                                vistas.add((zona['zona'], clave))
+                                _reemplazar_recortes(conexion, zona['zona'], clave, detalles)
+            if version < VERSION_MIGRADA:
+                conexion.execute(f"PRAGMA user_version = {VERSION_MIGRADA}")
+            conexion.execute("COMMIT")
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+    finally:
+        conexion.close()
+
+def guardar_poligonos(ruta_db, zona, clave, crs, poligonos):
+    # Sustituye los polígonos de un par de fechas (volver a vectorizar un par
+    # no los duplica) y los añade al índice espacial
+    conexion = conectar(ruta_db)
+    try:
+        with conexion:
+            conexion.execute(
+                "DELETE FROM rtree_poligonos WHERE id IN "
+                "(SELECT id FROM poligonos WHERE zona = ? AND clave = ?)", (zona, clave))
+            conexion.execute("DELETE FROM poligonos WHERE zona = ? AND clave = ?", (zona, clave))
+            for p in poligonos:
+                cursor = conexion.execute(
+                    "INSERT INTO poligonos (zona, clave, clase, area, perimetro, cx, cy, crs, geometria) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (zona, clave, p["clase"], p["area"], p["perimetro"], *p["centroide"], crs,
+                     json.dumps(p["geometria"])))
+                minx, miny, maxx, maxy = p["caja"]
+                conexion.execute(
+                    "INSERT INTO rtree_poligonos (id, minx, maxx, miny, maxy) VALUES (?, ?, ?, ?, ?)",
+                    (cursor.lastrowid, minx, maxx, miny, maxy))
+    finally:
+        conexion.close()
+
+def buscar_cambios(ruta_db, area_minima=0.0, cerca_de=None, radio=0.0, zona=None, fecha_a=None, fecha_b=None):
+    # Polígonos de más de `area_minima` (m²). Con `cerca_de` = (x, y), en el CRS
+    # de las máscaras, solo los que tocan el cuadrado de lado 2 * radio centrado
+    # en el punto según el índice espacial, ordenados por distancia del centroide
+    condiciones, parametros = ["p.area >= ?"], [area_minima]
+    origen = "poligonos p"
+    if cerca_de is not None:
+        x, y = cerca_de
+        origen += " JOIN rtree_poligonos r ON r.id = p.id"
+        condiciones += ["r.maxx >= ?", "r.minx <= ?", "r.maxy >= ?", "r.miny <= ?"]
+        parametros += [x - radio, x + radio, y - radio, y + radio]
+    if zona is not None:
+        condiciones.append("p.zona = ?")
+        parametros.append(zona)
+    if fecha_a is not None and fecha_b is not None:
+        condiciones.append("p.clave = ?")
+        parametros.append(formar_clave(fecha_a, fecha_b))
+    orden = "(p.cx - ?) * (p.cx - ?) + (p.cy - ?) * (p.cy - ?)" if cerca_de is not None else "p.area DESC"
+    if cerca_de is not None:
+        parametros += [x, x, y, y]
+
+    conexion = conectar(ruta_db)
+    try:
+        filas = conexion.execute(
+            f"SELECT p.zona, p.clave, p.clase, p.area, p.perimetro, p.cx, p.cy FROM {origen} "
+            f"WHERE {' AND '.join(condiciones)} ORDER BY {orden}", parametros).fetchall()
+    finally:
+        conexion.close()
+    return [dict(zip(COLUMNAS_POLIGONOS, fila)) for fila in filas]
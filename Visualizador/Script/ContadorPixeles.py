@@ -1,6 +1,36 @@
+import numpy as np
 from PIL import Image
 
+# Colores de Label2 (viridis) que se cuentan
+MORADO = (68, 1, 84)
+AMARILLO = (253, 231, 36)
+TURQUESA = (48, 103, 141)
+
+def contar_pixeles_raster(imagen):
+    # Label2 en COG guarda la clase de cada píxel con una paleta: se cuentan las
+    # clases por bloques con bincount y se traducen a colores con la paleta
+    import rasterio
+
+    with rasterio.open(imagen) as src:
+        conteo = np.zeros(256, dtype=np.int64)
+        for _, ventana in src.block_windows(1):
+            conteo += np.bincount(src.read(1, window=ventana).ravel(), minlength=256)
+        colores = src.colormap(1)
+        total_pixeles = src.width * src.height
+
+    def pixeles(color):
+        return int(sum(conteo[valor] for valor, c in colores.items() if tuple(c[:3]) == color))
+
+    morado, amarillo, turquesa = pixeles(MORADO), pixeles(AMARILLO), pixeles(TURQUESA)
+    return [morado, amarillo, turquesa,
+            (morado / total_pixeles) * 100,
+            (amarillo / total_pixeles) * 100,
+            (turquesa / total_pixeles) * 100]
+
 def contar_pixeles_por_color(imagen):
+    if imagen.lower().endswith(('.tif', '.tiff')):
+        return contar_pixeles_raster(imagen)
+
     # Abre la imagen
     img = Image.open(imagen)
 
@@ -1,11 +1,19 @@
-import rasterio
-import numpy as np
-import matplotlib.pyplot as plt
+import argparse
+import json
 import zipfile
 import os
 import tempfile
 from tqdm import tqdm
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+import rasterio
+
+from MotorNDVI import PALETA_CLASES, listar_pares
+from PlanificadorPares import procesar_zona
+from VentanasRaster import (MEMORIA_MB, convertir_cog, crear_salida,
+                            filas_por_ventana, rutas_bandas, ventanas)
 
 
 # Rutas a archivos
@@ -15,87 +23,129 @@ image_a_path = '../BAN - copia/data/LEVIR-CD/test/A/'
 image_b_path = '../BAN - copia/data/LEVIR-CD/test/B/'
 label_path = '../BAN - copia/data/LEVIR-CD/test/label/'
 
-# Función para cargar las bandas 8, 4, 3 y 2 desde un directorio
-def load_bands_from_dir(directory):
-    band_8 = None
-    band_4 = None
-    band_3 = None
-    band_2 = None
-    for filename in os.listdir(directory):
-        if 'B08' in filename and ('tif' in filename or 'tiff' in filename):
-            with rasterio.open(os.path.join(directory, filename)) as src:
-                band_8 = src.read(1)
-        elif 'B04' in filename and ('tif' in filename or 'tiff' in filename):
-            with rasterio.open(os.path.join(directory, filename)) as src:
-                band_4 = src.read(1)
-        elif 'B03' in filename and ('tif' in filename or 'tiff' in filename):
-            with rasterio.open(os.path.join(directory, filename)) as src:
-                band_3 = src.read(1)
-        elif 'B02' in filename and ('tif' in filename or 'tiff' in filename):
-            with rasterio.open(os.path.join(directory, filename)) as src:
-                band_2 = src.read(1)
-    return band_8, band_4, band_3, band_2
-
-# Función para calcular el NDVI
-def calculate_ndvi(band_8, band_4):
-    ndvi = (band_8 - band_4) / (band_8 + band_4)
-    return ndvi
-
-# Obtener la lista de archivos ZIP en la carpeta de imágenes
-zip_files = [f for f in os.listdir(images_path) if f.endswith('.zip')]
-
-# Iterar sobre cada zona (carpeta dentro de images_path)
-counter = 0
-val=True
-for zone_folder in os.listdir(images_path):
+# Con MULTIESPECTRAL=1 las imágenes A y B no son las composiciones RGB de 8 bits:
+# se enlazan los ZIP de cada fecha como {zona}/{fecha_a}_{fecha_b}.zip y BAN lee
+# las bandas B02, B03, B04 y B08 sin pérdida (MultiImgLoadMultispectralFromFile,
+# configs/ban/ban_vit-b16-clip_mit-b0_512x512_zonas_multiespectral.py)
+MULTIESPECTRAL = os.environ.get('MULTIESPECTRAL', '0') == '1'
+
+# Función para dejar un archivo de una fecha en la ruta de un par sin duplicarlo
+def enlazar(origen, destino):
+    if os.path.exists(destino):
+        os.remove(destino)
+    try:
+        os.link(origen, destino)
+    except OSError:  # otro volumen o sistema de archivos sin enlaces duros
+        shutil.copyfile(origen, destino)
+
+# Umbral de |ΔNDVI| para marcar un cambio
+threshold = 0.2  # Ajusta este valor según tus necesidades
+
+def listar_zonas():
+    # Grafo de tareas completo antes de empezar: por zona, sus fechas y los
+    # pares (i, j) a etiquetar. Cada par se guarda con la clave
+    # {zona}/{fecha_a}_{fecha_b}, la misma que usa BAN (ZoneCD_Dataset) para
+    # escribir la máscara predicha en ./Archivos/Label/
+    zonas = []
+    for zone_folder in os.listdir(images_path):
+        zone_path = os.path.join(images_path, zone_folder)
+        if not os.path.isdir(zone_path):  # Saltar si no es una carpeta
+            continue
+        # Orden cronológico ('Zona #-yyyy-mm-dd.zip'): la fecha anterior va primero en la clave
+        zip_files = sorted(f for f in os.listdir(zone_path) if f.endswith('.zip'))
+        if not zip_files:
+            continue
+        fechas = [f.split(".")[0] for f in zip_files]
+        pares = listar_pares(len(zip_files))
+        claves = [fechas[i] + "_" + fechas[j] for i, j in pares]
+        zonas.append((zone_folder, zip_files, fechas, pares, claves))
+    return zonas
+
+def generar_zona(zone_folder, zip_files, fechas, pares, claves, trabajadores, memoria_mb, progreso):
+    # Las salidas son COG con el CRS de las bandas de origen; se calculan franja
+    # a franja (VentanasRaster) en un pool de procesos (PlanificadorPares), así
+    # la memoria no depende del tamaño de la escena
     zone_path = os.path.join(images_path, zone_folder)
-    if not os.path.isdir(zone_path):  # Saltar si no es una carpeta
-        continue
-    zip_files = [f for f in os.listdir(zone_path) if f.endswith('.zip')]
-    os.makedirs("./Archivos/Zonas RGB/"+zone_folder, exist_ok=True)
-    os.makedirs("./Archivos/Label2/"+zone_folder, exist_ok=True)
-    for i in tqdm(range(len(zip_files))):
-        with tempfile.TemporaryDirectory() as temp_dir_a:
-            with zipfile.ZipFile(os.path.join(zone_path, zip_files[i]), 'r') as zip_ref:
-                zip_ref.extractall(temp_dir_a)
-            band_8_a, band_4_a, _, _ = load_bands_from_dir(temp_dir_a)
-            ndvi_a = calculate_ndvi(band_8_a, band_4_a)
-            
-            for j in range(i + 1, len(zip_files)):
-                with tempfile.TemporaryDirectory() as temp_dir_b:
-                    with zipfile.ZipFile(os.path.join(zone_path, zip_files[j]), 'r') as zip_ref:
-                        zip_ref.extractall(temp_dir_b)
-                    band_8_b, band_4_b, _, _ = load_bands_from_dir(temp_dir_b)
-                    ndvi_b = calculate_ndvi(band_8_b, band_4_b)
-                    diff = np.abs(ndvi_a - ndvi_b)
-                    threshold = 0.2  # Ajusta este valor según tus necesidades
-                    binary_diff = (diff > threshold).astype(np.uint8)
-
-                    # Generar la etiqueta de cambio con los colores solicitados
-                    label_class = np.zeros_like(binary_diff, dtype=np.uint8)
-                    change_mask = ndvi_a > ndvi_b
-                    label_class[binary_diff == 1] = change_mask[binary_diff == 1].astype(np.uint8) * 2
-                    label_class[binary_diff == 1] += 1
-                    label_class[binary_diff == 0] = 0  # Sin cambio (negro)
-
-                    # Cargar y normalizar las bandas RGB para visualización
-                    _, band_4_a, band_3_a, band_2_a = load_bands_from_dir(temp_dir_a)
-                    _, band_4_b, band_3_b, band_2_b = load_bands_from_dir(temp_dir_b)
-
-                    # Normalización y composición de las bandas RGB
-                    image_a = np.dstack([np.interp(band, (band.min(), band.max()), (0, 1)) for band in [band_4_a, band_3_a, band_2_a]])
-                    image_b = np.dstack([np.interp(band, (band.min(), band.max()), (0, 1)) for band in [band_4_b, band_3_b, band_2_b]])
-
-                    # Guardar las imágenes A, B y la etiqueta (cambio)
-                    plt.imsave(os.path.join(image_a_path, f'{counter}.png'), image_a)
-                    plt.imsave(os.path.join(image_b_path, f'{counter}.png'), image_b)
-                    plt.imsave(os.path.join(label_path, f'{counter}.png'), binary_diff, cmap='gray')
-                    plt.imsave(os.path.join('./Archivos/Label2/'+zone_folder, f'{counter}.png'), label_class, cmap='viridis')
-                    if val:
-                        plt.imsave(os.path.join("./Archivos/Zonas RGB/"+zone_folder, zip_files[i].split(".")[0]+'.png'), image_a)
-                        plt.imsave(os.path.join("./Archivos/Zonas RGB/"+zone_folder, zip_files[j].split(".")[0]+'.png'), image_b)
-                        
-                    counter += 1
-            val=False
-
-print("Ejecución correcta")
\ No newline at end of file
+    ruta_rgb = "./Archivos/Zonas RGB/"+zone_folder
+    ruta_label2 = "./Archivos/Label2/"+zone_folder
+    os.makedirs(ruta_rgb, exist_ok=True)
+    os.makedirs(ruta_label2, exist_ok=True)
+    for ruta in [image_a_path, image_b_path, label_path]:
+        os.makedirs(os.path.join(ruta, zone_folder), exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Las salidas se escriben por franjas en temporales y al final se copian
+        # como COG a su ruta definitiva: (temporal, definitiva, remuestreo, predictor)
+        cogs_rgb = [(os.path.join(temp_dir, 'rgb_'+fecha+'.tif'), os.path.join(ruta_rgb, fecha+'.tif'), 'average', True) for fecha in fechas]
+        cogs_label = [(os.path.join(temp_dir, 'label_'+clave+'.tif'), os.path.join(label_path, zone_folder, clave+'.tif'), 'nearest', False) for clave in claves]
+        cogs_label2 = [(os.path.join(temp_dir, 'label2_'+clave+'.tif'), os.path.join(ruta_label2, clave+'.tif'), 'nearest', False) for clave in claves]
+
+        # Cada fecha se descomprime una vez; los trabajadores abren sus bandas
+        rutas_fechas = []
+        for k in range(len(zip_files)):
+            temp_fecha = os.path.join(temp_dir, str(k))
+            with zipfile.ZipFile(os.path.join(zone_path, zip_files[k]), 'r') as zip_ref:
+                zip_ref.extractall(temp_fecha)
+            rutas_fechas.append(rutas_bandas(temp_fecha))
+
+        # Un pool por zona: las bandas abiertas y la memoria compartida de cada
+        # trabajador se liberan al terminarla
+        with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+            with ExitStack() as pila:
+                ref = pila.enter_context(rasterio.open(rutas_fechas[0]['B08']))
+                filas = filas_por_ventana(ref, len(zip_files), len(pares), trabajadores, memoria_mb)
+
+                # Una composición RGB por fecha; etiqueta binaria (BAN) y de clases
+                # (Label2, con la paleta viridis) por par
+                salidas_rgb = [crear_salida(tmp, ref, 3, pila) for tmp, *_ in cogs_rgb]
+                salidas_label = [crear_salida(tmp, ref, 1, pila) for tmp, *_ in cogs_label]
+                salidas_label2 = [crear_salida(tmp, ref, 1, pila, colores=PALETA_CLASES) for tmp, *_ in cogs_label2]
+
+                procesar_zona(rutas_fechas, pares, list(ventanas(ref, filas)), filas, ref.width, threshold,
+                              salidas_rgb, salidas_label, salidas_label2, pool, progreso)
+
+            # Con los temporales cerrados, copia a COG (vistas reducidas
+            # incluidas); cada copia es independiente y se reparte en el pool
+            list(pool.map(convertir_cog, *zip(*(cogs_rgb + cogs_label + cogs_label2))))
+
+    # Una composición antigua en PNG de la misma fecha aparecería dos veces en el visualizador
+    for fecha in fechas:
+        if os.path.isfile(os.path.join(ruta_rgb, fecha+'.png')):
+            os.remove(os.path.join(ruta_rgb, fecha+'.png'))
+
+    # Entradas A y B de BAN de cada par
+    for (i, j), clave in zip(pares, claves):
+        if MULTIESPECTRAL:
+            enlazar(os.path.join(zone_path, zip_files[i]), os.path.join(image_a_path, zone_folder, f'{clave}.zip'))
+            enlazar(os.path.join(zone_path, zip_files[j]), os.path.join(image_b_path, zone_folder, f'{clave}.zip'))
+        else:
+            # Las imágenes A y B de un par son las composiciones RGB de sus fechas
+            enlazar(os.path.join(ruta_rgb, fechas[i]+'.tif'), os.path.join(image_a_path, zone_folder, f'{clave}.tif'))
+            enlazar(os.path.join(ruta_rgb, fechas[j]+'.tif'), os.path.join(image_b_path, zone_folder, f'{clave}.tif'))
+    # Fechas de cada clave para BAN (ZoneCD_Dataset): una fecha puede contener
+    # '_', así que la clave no se vuelve a partir
+    with open(os.path.join(image_a_path, zone_folder, 'pares.json'), 'w') as f:
+        json.dump({clave: [fechas[i], fechas[j]] for (i, j), clave in zip(pares, claves)}, f, indent=1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Composiciones RGB y etiquetas de cambio NDVI de cada zona')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='procesos que calculan las franjas (por defecto, uno por núcleo)')
+    parser.add_argument('--memoria-mb', type=int, default=MEMORIA_MB,
+                        help='presupuesto de memoria de las franjas en MB')
+    args = parser.parse_args()
+    trabajadores = max(1, args.workers)
+
+    zonas = listar_zonas()
+    # Una tarea por fecha y por par de cada zona; tqdm da el avance y el tiempo restante
+    with tqdm(total=sum(len(fechas) + len(pares) for _, _, fechas, pares, _ in zonas),
+              unit='tarea', bar_format='{l_bar}{bar}| {n:.0f}/{total_fmt} [{elapsed}<{remaining}]') as progreso:
+        for zone_folder, zip_files, fechas, pares, claves in zonas:
+            progreso.set_description(zone_folder)
+            generar_zona(zone_folder, zip_files, fechas, pares, claves, trabajadores, args.memoria_mb, progreso)
+
+    print("Ejecución correcta")
+
+# Necesario para el pool de procesos en Windows (los trabajadores importan este módulo)
+if __name__ == '__main__':
+    main()
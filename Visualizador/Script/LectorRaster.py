@@ -0,0 +1,37 @@
+import numpy as np
+from PIL import Image
+
+# Lectura de las imágenes del visualizador al tamaño en que se muestran. Las
+# salidas de GeneradorMascaras son COG: al pedir una lectura reducida, GDAL
+# usa la vista reducida interna más cercana y solo descomprime sus teselas, en
+# lugar de decodificar la escena completa para luego reducirla.
+
+EXTENSIONES_RASTER = ('.tif', '.tiff')
+
+def es_raster(ruta):
+    return ruta.lower().endswith(EXTENSIONES_RASTER)
+
+def leer_miniatura(ruta, tam):
+    # Devuelve una imagen PIL de tam = (ancho, alto)
+    if not es_raster(ruta):
+        return Image.open(ruta).resize(tam)
+
+    import rasterio
+    from rasterio.enums import ColorInterp, Resampling
+
+    ancho, alto = tam
+    with rasterio.open(ruta) as src:
+        paleta = src.count == 1 and src.colorinterp[0] == ColorInterp.palette
+        # Las clases y máscaras no se interpolan
+        remuestreo = Resampling.bilinear if src.count >= 3 else Resampling.nearest
+        datos = src.read(out_shape=(src.count, alto, ancho), resampling=remuestreo)
+        colores = src.colormap(1) if paleta else None
+
+    if colores is not None:
+        tabla = np.zeros((256, 3), dtype=np.uint8)
+        for valor, color in colores.items():
+            tabla[valor] = color[:3]
+        return Image.fromarray(tabla[datos[0]])
+    if datos.shape[0] == 1:
+        return Image.fromarray(datos[0])
+    return Image.fromarray(np.ascontiguousarray(np.moveaxis(datos[:3], 0, -1)))
@@ -0,0 +1,62 @@
+import numpy as np
+
+# Motor de NDVI de GeneradorMascaras. Trabaja sobre una franja de la escena
+# (ver VentanasRaster): el NDVI de cada fecha se calcula una sola vez en
+# float32 y cada par de fechas se umbraliza y etiqueta con clasificar_par a
+# partir de esos NDVI. PlanificadorPares reparte las fechas y los pares de cada
+# franja entre los procesos trabajadores.
+
+# Clases de cambio de la etiqueta (Label2)
+SIN_CAMBIO = 0
+GANANCIA = 1  # el NDVI sube de la fecha anterior a la posterior
+PERDIDA = 3   # el NDVI baja
+
+# Colores de cada clase en Label2 (viridis, los que cuenta ContadorPixeles)
+PALETA_CLASES = {
+    SIN_CAMBIO: (68, 1, 84, 255),
+    GANANCIA: (48, 103, 141, 255),
+    PERDIDA: (253, 231, 36, 255),
+}
+
+def calcular_ndvi(band_8, band_4, salida=None):
+    # Las bandas llegan como uint16: se pasan a float32 antes de restar para
+    # que B08 - B04 no dé la vuelta cuando el rojo supera al infrarrojo.
+    # Donde B08 + B04 es 0 (sin datos) el NDVI queda en NaN, como en el cálculo
+    # original, para que clasificar_par no marque ahí ningún cambio
+    nir = band_8.astype(np.float32)
+    rojo = band_4.astype(np.float32)
+    suma = nir + rojo
+    resta = np.subtract(nir, rojo, out=nir)
+    if salida is None:
+        salida = np.empty(band_8.shape, dtype=np.float32)
+    salida[...] = np.nan
+    np.divide(resta, suma, out=salida, where=suma != 0)
+    return salida
+
+def listar_pares(num_fechas):
+    # Pares (anterior, posterior) en el mismo orden que el bucle i -> j original
+    return [(i, j) for i in range(num_fechas) for j in range(i + 1, num_fechas)]
+
+def clasificar_par(anterior, posterior, umbral, salida, diferencia=None):
+    # Clase de cambio de un par en `salida` (uint8). |ΔNDVI| > umbral y el
+    # sentido del cambio en la misma expresión: anterior - posterior > umbral
+    # es pérdida, < -umbral es ganancia. Un píxel sin datos (NDVI NaN) en
+    # cualquiera de las dos fechas queda siempre SIN_CAMBIO
+    diferencia = np.subtract(anterior, posterior, out=diferencia)
+    with np.errstate(invalid='ignore'):
+        salida[...] = (diferencia > umbral) * np.uint8(PERDIDA) \
+            + (diferencia < -umbral) * np.uint8(GANANCIA)
+    salida[np.isnan(diferencia)] = SIN_CAMBIO
+    return salida
+
+def componer_rgb(bandas, rangos):
+    # Composición RGB uint8 (3 x alto x ancho) de una franja, con estiramiento
+    # mínimo-máximo por banda en float32; `rangos` son el (mínimo, máximo) de
+    # cada banda en toda la escena, así todas las franjas usan la misma escala
+    rgb = np.empty((3,) + bandas[0].shape, dtype=np.uint8)
+    for capa, banda, (minimo, maximo) in zip(rgb, bandas, rangos):
+        valores = banda.astype(np.float32)
+        valores -= minimo
+        valores *= 255.0 / max(float(maximo) - float(minimo), 1.0)
+        capa[...] = valores
+    return rgb
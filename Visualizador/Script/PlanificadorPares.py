@@ -0,0 +1,135 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from MotorNDVI import SIN_CAMBIO, calcular_ndvi, clasificar_par, componer_rgb
+from VentanasRaster import FRANJAS_EN_VUELO, rango_bandas
+
+# Planificador de GeneradorMascaras. Para cada zona se arma el grafo de tareas
+# (fecha, franja) -> (i, j, franja) y se reparte en un ProcessPoolExecutor:
+#   - tarea_fecha lee las bandas de una fecha en una franja y deja su NDVI y su
+#     composición RGB en memoria compartida. Cada trabajador abre las bandas de
+#     una fecha una sola vez y las reutiliza en todas las franjas.
+#   - tarea_par umbraliza y etiqueta un par leyendo el NDVI compartido, sin
+#     copiarlo, y escribe la clase también en memoria compartida.
+# Un único hilo escritor del proceso principal pasa cada franja terminada a los
+# GeoTIFF de salida, mientras los trabajadores ya calculan la siguiente (hay
+# FRANJAS_EN_VUELO huecos de memoria compartida que se alternan).
+
+# Estado propio de cada proceso trabajador, vive lo que dura el pool de la zona
+_bandas_abiertas = {}
+_memorias = {}
+
+def _dataset(ruta):
+    src = _bandas_abiertas.get(ruta)
+    if src is None:
+        src = _bandas_abiertas[ruta] = rasterio.open(ruta)
+    return src
+
+def _vista(spec):
+    # Vista numpy de un bloque de memoria compartida creado por el principal
+    nombre, forma, dtype = spec
+    memoria = _memorias.get(nombre)
+    if memoria is None:
+        memoria = _memorias[nombre] = shared_memory.SharedMemory(name=nombre)
+        if os.name == 'posix':
+            # El bloque es del proceso principal, que lo libera al terminar la
+            # zona: el trabajador no debe registrarlo ni borrarlo al salir
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(memoria._name, 'shared_memory')
+    return np.ndarray(forma, dtype=dtype, buffer=memoria.buf)
+
+def crear_compartido(forma, dtype):
+    # Bloque de memoria compartida, su vista en el principal y la
+    # especificación (nombre, forma, dtype) que reciben las tareas
+    dtype = np.dtype(dtype)
+    memoria = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(forma)) * dtype.itemsize))
+    return memoria, np.ndarray(forma, dtype=dtype, buffer=memoria.buf), (memoria.name, tuple(forma), dtype.str)
+
+def liberar_compartido(memoria):
+    memoria.close()
+    memoria.unlink()
+
+def tarea_rango(rutas, filas):
+    # (mínimo, máximo) de B04, B03 y B02 de una fecha
+    return rango_bandas([_dataset(rutas[banda]) for banda in ('B04', 'B03', 'B02')], filas)
+
+def tarea_fecha(rutas, ventana, rango, k, hueco, spec_ndvi, spec_rgb):
+    ventana = Window(*ventana)
+    alto = ventana.height
+    band_4 = _dataset(rutas['B04']).read(1, window=ventana)
+    calcular_ndvi(_dataset(rutas['B08']).read(1, window=ventana), band_4,
+                  salida=_vista(spec_ndvi)[hueco, k, :alto])
+    _vista(spec_rgb)[hueco, k, :, :alto] = componer_rgb(
+        [band_4, _dataset(rutas['B03']).read(1, window=ventana), _dataset(rutas['B02']).read(1, window=ventana)], rango)
+
+def tarea_par(p, i, j, alto, umbral, hueco, spec_ndvi, spec_clases):
+    ndvi = _vista(spec_ndvi)[hueco]
+    clasificar_par(ndvi[i, :alto], ndvi[j, :alto], umbral, _vista(spec_clases)[hueco, p, :alto])
+
+def procesar_zona(rutas_fechas, pares, franjas, filas, ancho, umbral,
+                  salidas_rgb, salidas_label, salidas_label2, pool, progreso):
+    # Calcula todas las franjas de una zona con el pool de procesos y las
+    # escribe con un hilo escritor dedicado. `progreso` (tqdm) avanza en
+    # tareas de fecha y de par; cada franja suma su fracción de la escena
+    n, altura = len(rutas_fechas), sum(v.height for v in franjas)
+    memorias = []
+    ndvi = rgb = clases = None
+    try:
+        memoria, ndvi, spec_ndvi = crear_compartido((FRANJAS_EN_VUELO, n, filas, ancho), np.float32)
+        memorias.append(memoria)
+        memoria, rgb, spec_rgb = crear_compartido((FRANJAS_EN_VUELO, n, 3, filas, ancho), np.uint8)
+        memorias.append(memoria)
+        memoria, clases, spec_clases = crear_compartido((FRANJAS_EN_VUELO, len(pares), filas, ancho), np.uint8)
+        memorias.append(memoria)
+
+        # El estiramiento RGB necesita el rango de toda la escena
+        rangos = list(pool.map(tarea_rango, rutas_fechas, [filas] * n))
+
+        def escribir_franja(hueco, ventana):
+            alto = ventana.height
+            for k, salida in enumerate(salidas_rgb):
+                salida.write(rgb[hueco, k, :, :alto], window=ventana)
+            for p in range(len(pares)):
+                clase = clases[hueco, p, :alto]
+                salidas_label[p].write(((clase != SIN_CAMBIO) * np.uint8(255))[None], window=ventana)
+                salidas_label2[p].write(clase[None], window=ventana)
+
+        def lanzar_fechas(s):
+            ventana, hueco = franjas[s], s % FRANJAS_EN_VUELO
+            # el hueco no se reutiliza hasta que el escritor termina con él
+            if escrituras[hueco] is not None:
+                escrituras[hueco].result()
+            limites = (ventana.col_off, ventana.row_off, ventana.width, ventana.height)
+            return [pool.submit(tarea_fecha, rutas_fechas[k], limites, rangos[k], k, hueco, spec_ndvi, spec_rgb)
+                    for k in range(n)]
+
+        with ThreadPoolExecutor(max_workers=1) as escritor:
+            escrituras = [None] * FRANJAS_EN_VUELO
+            fechas_en_curso = lanzar_fechas(0)
+            for s, ventana in enumerate(franjas):
+                hueco, alto = s % FRANJAS_EN_VUELO, ventana.height
+                for futuro in fechas_en_curso:
+                    futuro.result()
+                progreso.update(n * alto / altura)
+                # Los pares de esta franja se solapan con las fechas de la siguiente
+                pares_en_curso = [pool.submit(tarea_par, p, i, j, alto, umbral, hueco, spec_ndvi, spec_clases)
+                                  for p, (i, j) in enumerate(pares)]
+                if s + 1 < len(franjas):
+                    fechas_en_curso = lanzar_fechas(s + 1)
+                for futuro in pares_en_curso:
+                    futuro.result()
+                progreso.update(len(pares) * alto / altura)
+                escrituras[hueco] = escritor.submit(escribir_franja, hueco, ventana)
+            for escritura in escrituras:
+                if escritura is not None:
+                    escritura.result()
+    finally:
+        # las vistas deben soltarse antes de cerrar la memoria compartida
+        ndvi = rgb = clases = None
+        for memoria in memorias:
+            liberar_compartido(memoria)
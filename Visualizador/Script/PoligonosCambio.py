@@ -0,0 +1,85 @@
+import numpy as np
+import rasterio
+from rasterio.features import shapes
+from rasterio.transform import Affine
+
+# Vectorización de las máscaras de cambio. Cada región de la máscara pasa a un
+# polígono (con sus huecos) en una sola pasada de rasterio.features.shapes, y
+# el área, el perímetro, el centroide y la caja de todos los polígonos se
+# calculan a la vez con NumPy sobre todos sus vértices. Las medidas quedan en
+# las unidades del CRS de la máscara (m y m² en las escenas de Sentinel-2, que
+# vienen en UTM) y se guardan en el almacén (AlmacenRecortes) con un índice
+# espacial, así las consultas por área o por cercanía no vuelven a leer imágenes.
+
+def georreferencia(src, ruta_referencia=None):
+    # CRS y transformación de la máscara. Las máscaras PNG de BAN no tienen:
+    # se toman de la imagen de la fecha anterior, ajustando el tamaño de píxel
+    # si la máscara tiene otra resolución
+    if src.crs is not None or ruta_referencia is None:
+        return src.crs, src.transform
+    with rasterio.open(ruta_referencia) as ref:
+        if ref.crs is None:
+            return None, src.transform
+        escala = Affine.scale(ref.width / src.width, ref.height / src.height)
+        return ref.crs, ref.transform * escala
+
+def medir_poligonos(geometrias):
+    # Área, perímetro, centroide y caja (GeoJSON Polygon, anillos cerrados) de
+    # todos los polígonos con operaciones sobre el conjunto de sus vértices
+    anillos = [np.asarray(anillo, dtype=np.float64) for g in geometrias for anillo in g['coordinates']]
+    num_anillos = [len(g['coordinates']) for g in geometrias]
+    poligono = np.repeat(np.arange(len(geometrias)), num_anillos)
+    exterior = np.zeros(len(anillos), dtype=bool)
+    exterior[np.cumsum([0] + num_anillos[:-1])] = True
+
+    puntos = np.concatenate(anillos)
+    inicios = np.cumsum([0] + [len(a) for a in anillos[:-1]])
+    x0, y0 = puntos[:-1].T
+    x1, y1 = puntos[1:].T
+    # El tramo entre el último punto de un anillo y el primero del siguiente no existe
+    valido = np.ones(len(x0), dtype=bool)
+    valido[inicios[1:] - 1] = False
+    cruz = (x0 * y1 - x1 * y0) * valido
+    tramos = np.hypot(x1 - x0, y1 - y0) * valido
+
+    # Fórmula del área de Gauss por anillo; el exterior suma y los huecos
+    # restan, sea cual sea el sentido en que viene cada anillo
+    doble_area = np.add.reduceat(cruz, inicios)
+    signo = np.where(exterior, 1.0, -1.0) * np.sign(doble_area)
+    area = np.bincount(poligono, weights=signo * doble_area) / 2
+    divisor = np.where(area > 0, 6 * area, 1.0)
+    cx = np.bincount(poligono, weights=signo * np.add.reduceat((x0 + x1) * cruz, inicios)) / divisor
+    cy = np.bincount(poligono, weights=signo * np.add.reduceat((y0 + y1) * cruz, inicios)) / divisor
+    perimetro = np.bincount(poligono, weights=np.add.reduceat(tramos, inicios))
+
+    # La caja de un polígono es la de su anillo exterior
+    caja = np.stack([np.minimum.reduceat(puntos[:, 0], inicios), np.minimum.reduceat(puntos[:, 1], inicios),
+                     np.maximum.reduceat(puntos[:, 0], inicios), np.maximum.reduceat(puntos[:, 1], inicios)], axis=1)
+    return area, perimetro, cx, cy, caja[exterior]
+
+def vectorizar_mascara(ruta_mascara, ruta_referencia=None, area_minima=0.0):
+    # Polígonos de las regiones distintas de 0 de una máscara (binaria de BAN o
+    # de clases de Label2), con la misma conectividad 8 que los recortes.
+    # Devuelve el CRS (WKT, None si la máscara no está georreferenciada) y una
+    # lista de diccionarios con la clase, la geometría y sus medidas
+    with rasterio.open(ruta_mascara) as src:
+        crs, transformacion = georreferencia(src, ruta_referencia)
+        mascara = src.read(1)
+    regiones = list(shapes(mascara, mask=mascara != 0, connectivity=8, transform=transformacion))
+    crs = crs.to_wkt() if crs is not None else None
+    if not regiones:
+        return crs, []
+
+    geometrias = [geometria for geometria, _ in regiones]
+    area, perimetro, cx, cy, caja = medir_poligonos(geometrias)
+    poligonos = []
+    for k in np.nonzero(area >= area_minima)[0]:
+        poligonos.append({
+            "clase": int(regiones[k][1]),
+            "geometria": geometrias[k],
+            "area": float(area[k]),
+            "perimetro": float(perimetro[k]),
+            "centroide": (float(cx[k]), float(cy[k])),
+            "caja": tuple(float(v) for v in caja[k]),
+        })
+    return crs, poligonos
@@ -1,97 +1,129 @@
-import json
 import os
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 import numpy as np
 import cv2
-import matplotlib.pyplot as plt
-from keras.models import load_model
+import torch
+from torchvision.ops import roi_align
 
-def proceso_imagen_redimensionada(anteriorA, posteriorB, etiqueta, ubi_rec_A, ubi_rec_B, ubi_rec_Eti, fecha_unida):
+from AlmacenRecortes import guardar_poligonos, guardar_recortes, importar_json
+from PoligonosCambio import vectorizar_mascara
+from ServicioClasificador import clasificar_lote
+
+# Tamaño mínimo (ancho y alto, en píxeles) de una región de cambio para recortarla
+tam_minimo = 50
+# Tamaño de los recortes que recibe el clasificador
+tam_recorte = 64
+# Píxeles alrededor de cada caja que se leen para interpolar sus bordes
+margen = 2
+
+def proceso_imagen_redimensionada(anteriorA, posteriorB, etiqueta, ubi_rec_A, ubi_rec_B, ubi_rec_Eti):
     # Cargar imágenes
-    anterior = Image.open(anteriorA)
-    posterior = Image.open(posteriorB)
-    label_a = Image.open(etiqueta).convert('L')  # Convertir a blanco y negro
+    anterior = np.asarray(Image.open(anteriorA).convert('RGB'))
+    posterior = np.asarray(Image.open(posteriorB).convert('RGB'))
+    label_array = np.asarray(Image.open(etiqueta).convert('L'))  # Convertir a blanco y negro
 
     # crear direcctorios no existentes
     os.makedirs(ubi_rec_A, exist_ok=True)
     os.makedirs(ubi_rec_B, exist_ok=True)
     os.makedirs(ubi_rec_Eti, exist_ok=True)
 
-    # Convertir imagen de etiqueta a array de numpy y umbralizar
-    label_array = np.array(label_a)
+    # Umbralizar la etiqueta
     _, thresholded = cv2.threshold(label_array, 127, 255, cv2.THRESH_BINARY)
 
-    # Encontrar contornos
-    contornos, _ = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # Como findContours con RETR_EXTERNAL, solo cuentan las regiones exteriores:
+    # se rellenan los huecos (fondo que no conecta con el borde) para que una
+    # región dentro del hueco de otra forme parte de ella
+    rellena = cv2.copyMakeBorder(thresholded, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    cv2.floodFill(rellena, None, (0, 0), 255)
+    rellena = cv2.bitwise_or(thresholded, cv2.bitwise_not(rellena[1:-1, 1:-1]))
+
+    # Cajas de todas las regiones de cambio en una sola pasada
+    _, _, stats, _ = cv2.connectedComponentsWithStats(rellena, connectivity=8)
+    del rellena
+    x, y, w, h = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP], stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+    # El componente 0 es el fondo
+    regiones = np.nonzero((w > tam_minimo) & (h > tam_minimo))[0]
+    regiones = regiones[regiones > 0]
+    if len(regiones) == 0:
+        return [], None, None
+
+    # Cada región se remuestrea a 64x64 para A, B y etiqueta (3 + 3 + 1 canales)
+    # con una llamada a roi_align sobre su propia ventana, con un margen para
+    # la interpolación en los bordes de la caja. Las imágenes completas siguen
+    # en uint8; solo las ventanas pasan a float
+    alto, ancho = label_array.shape
+    recortes = np.empty((len(regiones), tam_recorte, tam_recorte, 7), dtype=np.uint8)
+    for k, j in enumerate(regiones):
+        x0, y0 = max(0, x[j] - margen), max(0, y[j] - margen)
+        x1, y1 = min(ancho, x[j] + w[j] + margen), min(alto, y[j] + h[j] + margen)
+        ventana = np.dstack([anterior[y0:y1, x0:x1], posterior[y0:y1, x0:x1], label_array[y0:y1, x0:x1]])
+        pila = torch.from_numpy(ventana).permute(2, 0, 1)[None].float()
+        caja = torch.tensor([[0, x[j] - x0, y[j] - y0, x[j] - x0 + w[j], y[j] - y0 + h[j]]], dtype=torch.float32)
+        recorte = roi_align(pila, caja, output_size=(tam_recorte, tam_recorte), aligned=True)
+        recortes[k] = recorte[0].round().clamp(0, 255).to(torch.uint8).permute(1, 2, 0).numpy()
 
     detalles_cortes = []
-    # Recortar cada polígono detectado en todas las imágenes
-    for j, contour in enumerate(contornos):
-        x, y, w, h = cv2.boundingRect(contour)
-        if w > 50 and h > 50:
-            rec_anterior = anterior.crop((x, y, x+w, y+h))
-            rec_posterior = posterior.crop((x, y, x+w, y+h))
-            rec_label = label_a.crop((x, y, x+w, y+h))
-
-            # Redimensionar los recortes a 64x64 píxeles
-            resize_anterior = rec_anterior.resize((64, 64))
-            resize_posterior = rec_posterior.resize((64, 64))
-            resize_label = rec_label.resize((64, 64))
-
-            ant = os.path.join(ubi_rec_A, f'crop_{j}.png')
-            post = os.path.join(ubi_rec_B, f'crop_{j}.png')
-            etiq = os.path.join(ubi_rec_Eti, f'crop_{j}.png')
-
-            # Guardar los recortes en las carpetas correspondientes
-            resize_anterior.save(ant)
-            resize_posterior.save(post)
-            resize_label.save(etiq)
-
-            eti_A = clasificar(ant)
-            eti_B = clasificar(post)
-
-            detalle = {
-                "Rec_A": ant,
-                "Rec_B": post,
-                "Rec_L": etiq,
-                "Eti_A": eti_A,
-                "Eti_B": eti_B
-            }
-            detalles_cortes.append(detalle)
-    return {
-        fecha_unida : detalles_cortes
-    }
-        
-
-# Diccionario de etiquetas
-# etiquetas = {'AnnualCrop': 0, 'Forest': 1, 'HerbaceousVegetation': 2, 'Highway': 3, 'Industrial': 4, 'Pasture': 5, 'PermanentCrop': 6, 'Residential': 7, 'River': 8, 'SeaLake': 9}
-etiquetas = {'Cultivo Anual': 0, 'Bosque': 1, 'Vegetación Herbácea': 2, 'Carretera': 3, 'Industrial': 4, 'Pastos': 5, 'Cultivo Permanente': 6, 'Residencial': 7 , 'Río': 8, 'Arboleda': 9}
-# Función para obtener la etiqueta a partir de la predicción
-def obtener_etiqueta(prediccion, etiquetas):
-    clase_predicha = np.argmax(prediccion)
-    for etiqueta, indice in etiquetas.items():
-        if indice == clase_predicha:
-            return etiqueta
-    return None
-
-def clasificar(ruta_imagen):
-    # Cargar la imagen de tamaño 64x64 en modo RGB
-    imagen = plt.imread(ruta_imagen)
-    if imagen.shape[-1] == 4:  # Comprobar si la imagen tiene un cuarto canal
-        imagen = imagen[:, :, :3]  # Eliminar el cuarto canal (canal alfa)
-
-    # Hacer predicciones con ambos modelos
-    pred_modelo_3 = modelo_1.predict(np.expand_dims(imagen, axis=0))
-    etiqueta_predicha= obtener_etiqueta(pred_modelo_3, etiquetas)
-    return etiqueta_predicha
+    for j, recorte in zip(regiones, recortes):
+        ant = os.path.join(ubi_rec_A, f'crop_{j}.png')
+        post = os.path.join(ubi_rec_B, f'crop_{j}.png')
+        etiq = os.path.join(ubi_rec_Eti, f'crop_{j}.png')
+
+        # Guardar los recortes solo para mostrarlos en el visualizador
+        Image.fromarray(recorte[..., 0:3]).save(ant)
+        Image.fromarray(recorte[..., 3:6]).save(post)
+        Image.fromarray(recorte[..., 6]).save(etiq)
+
+        detalle = {
+            "Rec_A": ant,
+            "Rec_B": post,
+            "Rec_L": etiq
+        }
+        detalles_cortes.append(detalle)
+
+    # Los recortes se clasifican desde memoria: RGB en float32 dentro de [0, 1]
+    recortes_A = recortes[..., 0:3].astype(np.float32) / 255.0
+    recortes_B = recortes[..., 3:6].astype(np.float32) / 255.0
+    return detalles_cortes, recortes_A, recortes_B
+
+def clasificar_recortes(detalles_cortes, recortes_A, recortes_B):
+    # Una sola predicción para todos los recortes anteriores y posteriores del par
+    if detalles_cortes:
+        etiquetas_predichas = clasificar_lote(np.concatenate([recortes_A, recortes_B]))
+        n = len(detalles_cortes)
+        for detalle, eti_A, eti_B in zip(detalles_cortes, etiquetas_predichas[:n], etiquetas_predichas[n:]):
+            detalle["Eti_A"] = str(eti_A)
+            detalle["Eti_B"] = str(eti_B)
+    return detalles_cortes
+
+def iniciar_proceso():
+    # Cada proceso usa un solo hilo de torch para no competir por los núcleos
+    torch.set_num_threads(1)
+
+def extraer_recortes(tarea):
+    # Recortes del par y polígonos de su máscara, georreferenciados con la
+    # imagen anterior si la máscara no lo está
+    anteriorA, _, etiqueta = tarea[:3]
+    return proceso_imagen_redimensionada(*tarea), vectorizar_mascara(etiqueta, anteriorA)
 
 def obtener_numero(archivo):
     return int(archivo.split('.')[0])
 
-# Listar zonas y fechas de cada zona
-def detalles_recortes_JSON(ruta_base):
-    zonas = []
-    
+# Las máscaras se guardan como {fecha_a}_{fecha_b}.tif (GeneradorMascaras) o
+# .png (BAN); si no existe ninguna, se usa el nombre numerado por posición de
+# los datos antiguos
+def nombre_label(ruta_label, clave, legado, j):
+    for extension in (".tif", ".png"):
+        if os.path.isfile(os.path.join(ruta_label, clave + extension)):
+            return clave + extension
+    if j >= len(legado):
+        return clave + ".png"
+    return legado[j]
+
+# Listar los pares de fechas de cada zona a recortar
+def listar_tareas(ruta_base):
+    claves = []
+    tareas = []
     # Listar todas las carpetas en el directorio base
     for subca in subcarpetas:
         ruta_carpeta = os.path.join(ruta_base, subca)
@@ -103,60 +135,56 @@ def detalles_recortes_JSON(ruta_base):
                 ruta_archivo = os.path.join(ruta_carpeta, archivo)
                 if os.path.isfile(ruta_archivo):
                     fechas.append(archivo)
-            arc_label = []
-            for label in os.listdir(ruta_label):
-                ruta_archivo = os.path.join(ruta_label, label)
-                if os.path.isfile(ruta_archivo):
-                    arc_label.append(label)
-            
-            recortes = []
+            fechas.sort()
+            # Etiquetas numeradas por posición (datos generados antes de la salida con clave)
+            a_l = sorted([l for l in os.listdir(ruta_label) if l.split('.')[0].isdigit()], key=obtener_numero)
+
             i = 1
             j = 0
-            a_l = sorted(arc_label, key=obtener_numero)
-           
+
             for fe in fechas:
                 for x in fechas[i:]:
                     fechasJoin = fe.split(".")[0] + "_"+ x.split(".")[0]
-                    # Generar recortes en Anterior
-                    aux = proceso_imagen_redimensionada(ruta_carpeta+"/"+fe,ruta_carpeta+"/"+x,ruta_label+"/"+a_l[j],ruta_guardar+subca+"/"+fechasJoin+"/Rec_A/",ruta_guardar+subca+"/"+fechasJoin+"/Rec_B/",ruta_guardar+subca+"/"+fechasJoin+"/Rec_L/",fechasJoin)
-                    recortes.append(aux)
+                    claves.append((subca, fechasJoin))
+                    tareas.append((ruta_carpeta+"/"+fe,ruta_carpeta+"/"+x,ruta_label+"/"+nombre_label(ruta_label, fechasJoin, a_l, j),ruta_guardar+subca+"/"+fechasJoin+"/Rec_A/",ruta_guardar+subca+"/"+fechasJoin+"/Rec_B/",ruta_guardar+subca+"/"+fechasJoin+"/Rec_L/"))
                     j+=1
                 i+=1
-            zona = {
-                "zona": subca,
-                "recortes": recortes
-            }
-            zonas.append(zona)
-    return zonas
+    return claves, tareas
+
+# Generar los recortes de cada par de fechas y anexarlos al almacén
+def detalles_recortes(ruta_base):
+    claves, tareas = listar_tareas(ruta_base)
+    # Los pares se recortan en paralelo; este proceso clasifica y guarda cada
+    # par en cuanto llega, mientras los demás procesos siguen recortando
+    with ProcessPoolExecutor(max_workers=num_procesos, initializer=iniciar_proceso) as pool:
+        for (subca, fechasJoin), (resultado, (crs, poligonos)) in zip(claves, pool.map(extraer_recortes, tareas)):
+            detalles = clasificar_recortes(*resultado)
+            guardar_recortes(archivo_db, subca, fechasJoin, detalles)
+            guardar_poligonos(archivo_db, subca, fechasJoin, crs, poligonos)
 
 ruta_base = "./Archivos/Zonas RGB/"
 ruta_Label = "./Archivos/Label/"
 ruta_guardar = "./Archivos/Recortes/"
-ruta_modelo = './Modelos/ResNet152V2.h5'
 directorio_origen = './Archivos/Subidos/'
-modelo_1 = load_model(ruta_modelo)
+# Cada proceso tiene en memoria las imágenes A, B y la etiqueta de un par
+# (unos 850 MB en uint8 para una escena de 10980 x 10980); se puede cambiar
+# con PROCESOS_RECORTES
+num_procesos = int(os.environ.get('PROCESOS_RECORTES', min(4, os.cpu_count())))
 
-# Cargar datos ya almacenados
+# Almacén de recortes (se migra una sola vez el JSON antiguo si existe)
 archivo = "./Archivos/recortes.json"
-with open(archivo, 'r') as f:
-    recortes = json.load(f)
-
-# Obtener todos los nombres de los elementos en el directorio de origen
-elementos = os.listdir(directorio_origen)
-# elementos = os.listdir(ruta_base)
-
-# Filtrar solo los nombres de las carpetas
-subcarpetas = [nombre.split(".")[0] for nombre in elementos if os.path.isdir(os.path.join(directorio_origen, nombre))]
-# subcarpetas = [nombre.split(".")[0] for nombre in elementos if os.path.isdir(os.path.join(ruta_base, nombre))]
-
-# procesamiento de recortes.
-json_salida = detalles_recortes_JSON(ruta_base)
+archivo_db = "./Archivos/recortes.db"
 
-# with open('./Archivos/recortes.json', 'w') as json_file:
-#     json.dump(json_salida, json_file, indent=4)
+if __name__ == '__main__':
+    importar_json(archivo_db, archivo)
 
+    # Obtener todos los nombres de los elementos en el directorio de origen
+    elementos = os.listdir(directorio_origen)
+    # elementos = os.listdir(ruta_base)
 
-total_recortes = recortes + json_salida
+    # Filtrar solo los nombres de las carpetas
+    subcarpetas = [nombre.split(".")[0] for nombre in elementos if os.path.isdir(os.path.join(directorio_origen, nombre))]
+    # subcarpetas = [nombre.split(".")[0] for nombre in elementos if os.path.isdir(os.path.join(ruta_base, nombre))]
 
-with open('./Archivos/recortes.json', 'w') as json_file:
-    json.dump(total_recortes, json_file, indent=4)
+    # procesamiento de recortes: cada par (recortes y polígonos) se anexa al almacén al terminar.
+    detalles_recortes(ruta_base)
@@ -0,0 +1,138 @@
+import os
+import secrets
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+# Servicio local de clasificación. Mantiene ResNet152V2 cargado en un proceso de
+# larga duración y atiende lotes de recortes 64x64 enviados por el pipeline de
+# recortes o por el visualizador, cada cliente en su propio hilo, de modo que
+# la carga del modelo se paga una vez por despliegue y no en cada ejecución.
+#
+# Iniciar el servicio (desde la carpeta Visualizador):
+#     python Script/ServicioClasificador.py
+
+ruta_modelo = './Modelos/ResNet152V2.h5'
+direccion = ('localhost', int(os.environ.get('PUERTO_CLASIFICADOR', 6001)))
+# multiprocessing.connection deserializa lo que recibe: la clave no puede estar
+# en el repositorio. Se toma de CLAVE_CLASIFICADOR o, si no está definida, de
+# un archivo propio del despliegue que el servicio genera con permisos 0600
+ruta_clave = os.environ.get('RUTA_CLAVE_CLASIFICADOR', './Archivos/.clave_clasificador')
+# Segundos que se espera la respuesta de un lote antes de clasificarlo aquí
+espera_respuesta = float(os.environ.get('ESPERA_CLASIFICADOR', 300))
+
+# Máximo de recortes por pasada de la red dentro de una misma llamada a predict
+tam_lote = 256
+
+# Nombres de las clases ordenados por el índice de salida del modelo
+# etiquetas = ['AnnualCrop', 'Forest', 'HerbaceousVegetation', 'Highway', 'Industrial', 'Pasture', 'PermanentCrop', 'Residential', 'River', 'SeaLake']
+etiquetas = np.array(['Cultivo Anual', 'Bosque', 'Vegetación Herbácea', 'Carretera', 'Industrial', 'Pastos', 'Cultivo Permanente', 'Residencial', 'Río', 'Arboleda'])
+
+_modelo = None
+_bloqueo_modelo = threading.Lock()
+_conexion = None
+_bloqueo_conexion = threading.Lock()
+
+def leer_clave(crear=False):
+    # Clave de autenticación; None si no hay ninguna y no se pide crearla
+    if os.environ.get('CLAVE_CLASIFICADOR'):
+        return os.environ['CLAVE_CLASIFICADOR'].encode()
+    if crear and not os.path.exists(ruta_clave):
+        try:
+            descriptor = os.open(ruta_clave, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass  # otro proceso la acaba de crear
+        else:
+            with os.fdopen(descriptor, 'w') as f:
+                f.write(secrets.token_hex(32))
+    try:
+        with open(ruta_clave) as f:
+            return f.read().strip().encode()
+    except FileNotFoundError:
+        return None
+
+def cargar_modelo():
+    # Carga diferida: solo la primera vez que realmente se necesita el modelo
+    global _modelo
+    if _modelo is None:
+        from keras.models import load_model
+        _modelo = load_model(ruta_modelo)
+    return _modelo
+
+def predecir(imagenes):
+    # Clasificar un lote (N, 64, 64, 3) float32 en [0, 1] con una sola llamada
+    # al modelo. Las llamadas de distintos hilos se hacen de una en una
+    with _bloqueo_modelo:
+        predicciones = cargar_modelo().predict(imagenes, batch_size=min(len(imagenes), tam_lote), verbose=0)
+    return etiquetas[np.argmax(predicciones, axis=1)].tolist()
+
+def atender(conexion):
+    # Un hilo por cliente: el pipeline de recortes y el visualizador pueden
+    # tener su conexión abierta a la vez
+    with conexion:
+        # Una conexión puede enviar varios lotes seguidos
+        while True:
+            try:
+                imagenes = conexion.recv()
+            except EOFError:
+                break
+            try:
+                conexion.send(predecir(np.asarray(imagenes, dtype=np.float32)))
+            except Exception as e:
+                conexion.send(e)
+
+def servir():
+    cargar_modelo()
+    with Listener(direccion, authkey=leer_clave(crear=True)) as listener:
+        print(f"Servicio de clasificación escuchando en {direccion[0]}:{direccion[1]}")
+        while True:
+            try:
+                conexion = listener.accept()
+            except AuthenticationError:
+                continue
+            threading.Thread(target=atender, args=(conexion,), daemon=True).start()
+
+def clasificar_lote(imagenes):
+    # Envía el lote al servicio; si no está en ejecución se clasifica en este
+    # mismo proceso cargando el modelo una única vez. La conexión es una por
+    # proceso y los hilos (sesiones de Streamlit) la usan de uno en uno
+    if len(imagenes) == 0:
+        return []
+    with _bloqueo_conexion:
+        respuesta = _enviar(imagenes)
+    if respuesta is None:
+        return predecir(imagenes)
+    if isinstance(respuesta, Exception):
+        raise respuesta
+    return respuesta
+
+def _enviar(imagenes):
+    # Respuesta del servicio, o None si no está disponible o no responde a tiempo
+    global _conexion
+    clave = leer_clave()
+    if clave is None:
+        return None  # sin clave el servicio no se ha iniciado nunca
+    for _ in range(2):
+        try:
+            if _conexion is None:
+                _conexion = Client(direccion, authkey=clave)
+            _conexion.send(imagenes)
+            if not _conexion.poll(espera_respuesta):
+                # Servicio colgado: se abandona la conexión para no bloquear
+                # al visualizador
+                _conexion.close()
+                _conexion = None
+                return None
+            return _conexion.recv()
+        except (ConnectionRefusedError, FileNotFoundError, AuthenticationError):
+            _conexion = None
+            return None
+        except (EOFError, OSError):
+            # El servicio se reinició: reintentar con una conexión nueva
+            _conexion = None
+    return None
+
+if __name__ == '__main__':
+    servir()
@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.env import GDALVersion
+from rasterio.shutil import copy as copiar_raster
+from rasterio.windows import Window
+
+# Lectura y escritura por ventanas para GeneradorMascaras. Una banda de
+# Sentinel-2 de 10980 x 10980 ocupa unos 240 MB en uint16, así que las escenas
+# no se leen enteras: se recorren en franjas de filas alineadas con los bloques
+# de origen, con un alto calculado a partir de un presupuesto de memoria, y cada
+# franja se escribe en cuanto se calcula en GeoTIFF teselados. El pico de
+# memoria depende del presupuesto y no del tamaño de la escena. Al terminar,
+# cada GeoTIFF se copia como COG (GeoTIFF optimizado para la nube: teselas,
+# vistas reducidas internas y compresión sin pérdida), así el visualizador y
+# las herramientas SIG leen solo la ventana o el nivel de detalle que necesitan.
+
+BANDAS = ('B08', 'B04', 'B03', 'B02')
+# Lado de las teselas de los GeoTIFF de salida
+TESELA = 256
+# Memoria para las franjas (MB), se puede cambiar con MEMORIA_MB
+MEMORIA_MB = int(os.environ.get('MEMORIA_MB', 512))
+
+# Bytes por píxel de una fila de franja. En memoria compartida, con dos franjas
+# en vuelo (una se calcula mientras la otra se escribe): por fecha el NDVI
+# float32 y la composición RGB uint8, por par la clase uint8. Además, cada
+# proceso trabajador tiene sus temporales: 4 bandas uint16 y los float32 del
+# NDVI y de la composición RGB
+BYTES_COMPARTIDOS_FECHA = 4 + 3
+BYTES_COMPARTIDOS_PAR = 1
+BYTES_TRABAJADOR = 4 * 2 + 3 * 4 + 3 * 4
+FRANJAS_EN_VUELO = 2
+
+def rutas_bandas(directorio):
+    # Ruta de cada banda de una fecha descomprimida
+    rutas = {}
+    for filename in os.listdir(directorio):
+        if not ('tif' in filename or 'tiff' in filename):
+            continue
+        for banda in BANDAS:
+            if banda in filename:
+                rutas[banda] = os.path.join(directorio, filename)
+    faltan = [banda for banda in BANDAS if banda not in rutas]
+    if faltan:
+        raise FileNotFoundError(f"Faltan las bandas {faltan} en {directorio}")
+    return rutas
+
+def filas_por_ventana(src, num_fechas, num_pares, trabajadores=1, memoria_mb=MEMORIA_MB):
+    # Alto de franja que cabe en el presupuesto, múltiplo del alto de bloque de
+    # origen (y de la tesela de salida cuando cabe más de una)
+    compartidos = FRANJAS_EN_VUELO * (num_fechas * BYTES_COMPARTIDOS_FECHA + num_pares * BYTES_COMPARTIDOS_PAR)
+    bytes_fila = src.width * (compartidos + trabajadores * BYTES_TRABAJADOR)
+    filas = max(1, memoria_mb * 2**20 // bytes_fila)
+    alto_bloque = src.block_shapes[0][0]
+    paso = TESELA if filas >= TESELA else alto_bloque
+    return int(max(alto_bloque, filas // paso * paso))
+
+def ventanas(src, filas):
+    # Franjas de `filas` filas a todo el ancho; agrupan los bloques de
+    # src.block_windows() de las mismas filas
+    for fila in range(0, src.height, filas):
+        yield Window(0, fila, src.width, min(filas, src.height - fila))
+
+def rango_bandas(srcs, filas):
+    # Mínimo y máximo de cada banda recorriendo la escena por franjas (para el
+    # estiramiento RGB, que necesita el rango completo antes de escribir)
+    minimos = [np.inf] * len(srcs)
+    maximos = [-np.inf] * len(srcs)
+    for ventana in ventanas(srcs[0], filas):
+        for k, src in enumerate(srcs):
+            datos = src.read(1, window=ventana)
+            minimos[k] = min(minimos[k], datos.min())
+            maximos[k] = max(maximos[k], datos.max())
+    return list(zip(minimos, maximos))
+
+def perfil_teselado(src, count):
+    # GeoTIFF uint8 teselado y comprimido sin pérdida, con el CRS y la
+    # transformación de la banda de origen
+    return dict(
+        driver='GTiff', width=src.width, height=src.height, count=count,
+        dtype='uint8', crs=src.crs, transform=src.transform,
+        tiled=True, blockxsize=TESELA, blockysize=TESELA,
+        compress='deflate', predictor=2, BIGTIFF='IF_SAFER')
+
+def crear_salida(ruta, src, count, pila, colores=None):
+    # Abre un GeoTIFF de salida que se irá rellenando por ventanas
+    dst = pila.enter_context(rasterio.open(ruta, 'w', **perfil_teselado(src, count)))
+    if colores is not None:
+        dst.write_colormap(1, colores)
+    return dst
+
+def niveles_vistas(src):
+    # Factores de reducción hasta que la vista cabe en una tesela
+    niveles = []
+    factor = 2
+    while max(src.width, src.height) / factor >= TESELA:
+        niveles.append(factor)
+        factor *= 2
+    return niveles
+
+def convertir_cog(ruta_tmp, ruta, remuestreo='nearest', predictor=False):
+    # Copia un GeoTIFF teselado escrito por franjas a COG y borra el temporal.
+    # La copia la hace GDAL por bloques, sin cargar la imagen. `remuestreo` es
+    # el de las vistas reducidas: 'average' para imágenes, 'nearest' para clases
+    if GDALVersion.runtime().at_least('3.1'):
+        copiar_raster(ruta_tmp, ruta, driver='COG', COMPRESS='DEFLATE',
+                      PREDICTOR='YES' if predictor else 'NO', BLOCKSIZE=TESELA,
+                      OVERVIEW_RESAMPLING=remuestreo.upper(), BIGTIFF='IF_SAFER')
+    else:
+        # GDAL sin controlador COG: vistas construidas en el temporal y copiadas
+        # delante de los datos, que es la misma disposición
+        with rasterio.open(ruta_tmp, 'r+') as src:
+            src.build_overviews(niveles_vistas(src), Resampling[remuestreo])
+        copiar_raster(ruta_tmp, ruta, driver='GTiff', tiled=True,
+                      blockxsize=TESELA, blockysize=TESELA, compress='deflate',
+                      predictor=2 if predictor else 1, copy_src_overviews=True,
+                      BIGTIFF='IF_SAFER')
+    os.remove(ruta_tmp)
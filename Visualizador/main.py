@@ -1,13 +1,16 @@
 import streamlit as st
+import numpy as np
 import requests
 from streamlit_lottie import st_lottie
 from PIL import Image
 import os
 import time
 import shutil
-import json
 
 from Script.ContadorPixeles import contar_pixeles_por_color
+from Script.LectorRaster import leer_miniatura
+from Script.AlmacenRecortes import buscar_cambios, guardar_etiquetas, importar_json, obtener_recortes
+from Script.ServicioClasificador import clasificar_lote
 
 # -------FUNCIONES -----------------------------------------------------------------------------------------------
 # Animación de carga
@@ -27,6 +30,17 @@ def eliminar_archivos(directory_path):
 def obtener_numero(archivo):
     return int(archivo.split('.')[0])
 
+# Las máscaras se guardan como {fecha_a}_{fecha_b}.tif (GeneradorMascaras) o
+# .png (BAN); si no existe ninguna, se usa el nombre numerado por posición de
+# los datos antiguos
+def nombre_label(ruta_label, clave, legado, j):
+    for extension in (".tif", ".png"):
+        if os.path.isfile(os.path.join(ruta_label, clave + extension)):
+            return clave + extension
+    if j >= len(legado):
+        return clave + ".png"
+    return legado[j]
+
 # Listar zonas y fechas de cada zona
 def listar_carpetas_con_subcarpetas(ruta_base):
     zonas = []
@@ -43,29 +57,22 @@ def listar_carpetas_con_subcarpetas(ruta_base):
                 ruta_archivo = os.path.join(ruta_carpeta, archivo)
                 if os.path.isfile(ruta_archivo):
                     fechas.append(archivo)
-            arc_label = []
-            for label in os.listdir(ruta_label):
-                ruta_archivo = os.path.join(ruta_label, label)
-                if os.path.isfile(ruta_archivo):
-                    arc_label.append(label)
-            arc_label2 = []
-            for label2 in os.listdir(ruta_label2):
-                ruta_archivo = os.path.join(ruta_label2, label2)
-                if os.path.isfile(ruta_archivo):
-                    arc_label2.append(label2)
+            fechas.sort()
+            # Etiquetas numeradas por posición (datos generados antes de la salida con clave)
+            a_l = sorted([l for l in os.listdir(ruta_label) if l.split('.')[0].isdigit()], key=obtener_numero)
+            a_l2 = sorted([l for l in os.listdir(ruta_label2) if l.split('.')[0].isdigit()], key=obtener_numero)
             unionFechas = []
             i = 1
             j = 0
-            a_l = sorted(arc_label, key=obtener_numero)
-            a_l2 = sorted(arc_label2, key=obtener_numero)
 
             for fe in fechas:
                 for x in fechas[i:]:
                     fechasJoin = fe + ":"+ x
+                    clave = fe.split(".")[0] + "_" + x.split(".")[0]
                     aux = {
                         "union": fechasJoin,
-                        "Label": a_l[j],
-                        "Label2": a_l2[j]
+                        "Label": nombre_label(ruta_label, clave, a_l, j),
+                        "Label2": nombre_label(ruta_label2, clave, a_l2, j)
                     }
                     unionFechas.append(aux)
                     j+=1
@@ -90,6 +97,22 @@ def obtener_label_por_union(data, union_buscada, label):
             return fechas_unidas[label]
     return None
 
+# Clasifica con el servicio los recortes que aún no tienen clase (por ejemplo,
+# los migrados de un recortes.json sin Eti_A/Eti_B) y la guarda en el almacén
+def completar_etiquetas(zona, clave, detalles):
+    pendientes = [d for d in detalles if d["Eti_A"] is None or d["Eti_B"] is None]
+    if not pendientes:
+        return detalles
+    recortes = [np.asarray(Image.open(d[ruta]).convert('RGB').resize((64, 64)), dtype=np.float32) / 255.0
+                for ruta in ("Rec_A", "Rec_B") for d in pendientes]
+    etiquetas_predichas = clasificar_lote(np.stack(recortes))
+    n = len(pendientes)
+    for detalle, eti_A, eti_B in zip(pendientes, etiquetas_predichas[:n], etiquetas_predichas[n:]):
+        detalle["Eti_A"] = str(eti_A)
+        detalle["Eti_B"] = str(eti_B)
+    guardar_etiquetas(archivo_db, zona, clave, pendientes)
+    return detalles
+
 # Función para simular un proceso y actualizar la barra de progreso
 def simulate_process(bar, percent_complete, text):
     for _ in range(percent_complete):
@@ -100,22 +123,6 @@ def resaltar_texto(mensaje, color):
     texto_resaltado = f'<span style="background-color: {color}; color:{color}">{mensaje}</span>'
     return texto_resaltado
 
-def obtener_valores(detalle, zonaActual, fecha1, fecha2):
-    # Recorre cada zona en el JSON
-    for zona in detalle:
-        # Comprueba si la zona actual es la misma que la zona que estamos buscando
-        if zona['zona'] == zonaActual:
-            # Recorre cada recorte en la zona
-            for recorte in zona['recortes']:
-                # Forma la clave a buscar en los recortes
-                clave = f"{fecha1}_{fecha2}"
-                # Comprueba si la clave existe en los recortes
-                if clave in recorte:
-                    # Devuelve los valores correspondientes a la clave
-                    return recorte[clave]
-    # Si no se encuentra, devuelve None
-    return None
-
 def guardar_archivo(archivo_subir, ruta):
     with open(ruta, "wb") as f:
         f.write(archivo_subir.getbuffer())
@@ -144,11 +151,12 @@ ruta_Label = "./Archivos/Label/"
 ruta_Label2 = "./Archivos/Label2/"
 
 archivo = "./Archivos/recortes.json"
+archivo_db = "./Archivos/recortes.db"
 
 # -------VARIABLES BASES------------------------------------------------------------------------------------------
 carpetas = listar_carpetas_con_subcarpetas(ruta_base)
-with open(archivo, 'r') as f:
-    recortes = json.load(f)
+# Migra una sola vez el JSON antiguo al almacén indexado
+importar_json(archivo_db, archivo)
 
 
 # Título fijo
@@ -255,12 +263,12 @@ with st.container():
                 c1, c2, c3 = st.columns(3)
                 with c1: 
                     st.subheader("Imagen anterior")
-                    img1 = Image.open(ruta_base+zona_seleccionada+"/"+selected_rows[0])
-                    st.image(img1.resize((350, 350)),caption=selected_rows[0].split(".")[0])
+                    img1 = leer_miniatura(ruta_base+zona_seleccionada+"/"+selected_rows[0], (350, 350))
+                    st.image(img1,caption=selected_rows[0].split(".")[0])
                 with c2:
                     st.subheader("Imagen posterior")
-                    img2 = Image.open(ruta_base+zona_seleccionada+"/"+selected_rows[1])
-                    st.image(img2.resize((350, 350)), caption=selected_rows[1].split(".")[0])
+                    img2 = leer_miniatura(ruta_base+zona_seleccionada+"/"+selected_rows[1], (350, 350))
+                    st.image(img2, caption=selected_rows[1].split(".")[0])
 
                 with c3:
                     label = carpetas[indice]['fechasUnidas']
@@ -268,12 +276,23 @@ with st.container():
                     aux = obtener_label_por_union(label,f_join,"Label")
                     st.subheader(":red[_Cambios Detectados_]")
                     rutaEti = ruta_Label+zona_seleccionada+"/"+aux
-                    img3L = Image.open(rutaEti)
-                    st.image(img3L.resize((350, 350)), caption=aux)
+                    img3L = leer_miniatura(rutaEti, (350, 350))
+                    st.image(img3L, caption=aux)
             
+            with st.container():
+                # Polígonos de cambio del par desde el índice del almacén (RecortesLabel)
+                area_minima = st.number_input("Área mínima (m²)", min_value=0.0, value=0.0, step=100.0)
+                poligonos = buscar_cambios(archivo_db, area_minima, zona=zona_seleccionada,
+                                           fecha_a=selected_rows[0].split(".")[0], fecha_b=selected_rows[1].split(".")[0])
+                st.write("Polígonos: {} ➡️ Metros cuadrados: {}".format(len(poligonos), round(sum(p["Area"] for p in poligonos), 2)))
+                if poligonos:
+                    st.dataframe([{"Área (m²)": round(p["Area"], 2), "Perímetro (m)": round(p["Perimetro"], 2),
+                                   "X": round(p["X"], 2), "Y": round(p["Y"], 2)} for p in poligonos])
+
             with st.container():
                 # Recortar las imágenes.
-                temp = obtener_valores(recortes,zona_seleccionada,selected_rows[0].split(".")[0],selected_rows[1].split(".")[0])
+                temp = obtener_recortes(archivo_db,zona_seleccionada,selected_rows[0].split(".")[0],selected_rows[1].split(".")[0])
+                temp = completar_etiquetas(zona_seleccionada, selected_rows[0].split(".")[0]+"_"+selected_rows[1].split(".")[0], temp)
 
                 cols = st.columns(3)
 
@@ -304,18 +323,18 @@ with st.container():
             with col1:
                 st.subheader("Imagen pasada")
                 #img1 = Image.open(ruta_base+zona_seleccionada+"/"+selected_rows[0])
-                st.image(img1.resize((350, 350)),caption=selected_rows[0].split(".")[0])
+                st.image(img1,caption=selected_rows[0].split(".")[0])
             with col2:
                 st.subheader("Imagen posterior")
                 #img2 = Image.open(ruta_base+zona_seleccionada+"/"+selected_rows[1])
-                st.image(img2.resize((350, 350)), caption=selected_rows[1].split(".")[0])
+                st.image(img2, caption=selected_rows[1].split(".")[0])
             with col3:
                 label2 = carpetas[indice]['fechasUnidas']
                 f_join = selected_rows[0]+":"+selected_rows[1]
                 aux = obtener_label_por_union(label2,f_join,"Label2")
                 st.subheader(":red[_Cambios Detectados_]")
-                img3L2 = Image.open(ruta_Label2+zona_seleccionada+"/"+aux)
-                st.image(img3L2.resize((350, 350)))
+                img3L2 = leer_miniatura(ruta_Label2+zona_seleccionada+"/"+aux, (350, 350))
+                st.image(img3L2)
                 
 
             with st.container():
@@ -10,6 +10,7 @@ from mmcv.transforms import Compose
 
 from mmseg.utils import ConfigType
 from mmseg.apis import MMSegInferencer
+from opencd.utils import get_async_writer
 
 class OpenCDInferencer(MMSegInferencer):
     """Change Detection inferencer, provides inference and visualization
@@ -44,6 +45,14 @@ class OpenCDInferencer(MMSegInferencer):
         palette = palette if palette else self.model.dataset_meta.palette
         self.visualizer.set_dataset_meta(classes, palette, dataset_name)
 
+    def __call__(self, inputs, *args, **kwargs) -> dict:
+        """Call the inferencer. Rendered images are written in the background
+        while the next batch is inferred; all of them are on disk when this
+        returns."""
+        results = super().__call__(inputs, *args, **kwargs)
+        get_async_writer().flush()
+        return results
+
     def _inputs_to_list(self, inputs: Union[str, np.ndarray]) -> list:
         """Preprocess the inputs to a list.
 
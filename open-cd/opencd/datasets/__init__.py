@@ -5,12 +5,15 @@ from .clcd import CLCD_Dataset
 from .dsifn import DSIFN_Dataset
 from .landsat import Landsat_Dataset
 from .levir_cd import LEVIR_CD_Dataset
+from .packed_cd import PackedCDDataset
 from .rsipac_cd import RSIPAC_CD_Dataset
 from .s2looking import S2Looking_Dataset
+from .samplers import ChangeAwareSampler
 from .second import SECOND_Dataset
 from .svcd import SVCD_Dataset
 from .whu_cd import WHU_CD_Dataset
 
 __all__ = ['_BaseCDDataset', 'BaseSCDDataset', 'LEVIR_CD_Dataset', 'S2Looking_Dataset', 
            'SVCD_Dataset', 'RSIPAC_CD_Dataset', 'CLCD_Dataset', 'DSIFN_Dataset', 
-           'SECOND_Dataset', 'Landsat_Dataset', 'BANDON_Dataset', 'WHU_CD_Dataset']
+           'SECOND_Dataset', 'Landsat_Dataset', 'BANDON_Dataset', 'WHU_CD_Dataset',
+           'PackedCDDataset', 'ChangeAwareSampler']
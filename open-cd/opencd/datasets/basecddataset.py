@@ -1,5 +1,6 @@
 # Copyright (c) Open-CD. All rights reserved.
 import copy
+import os
 import os.path as osp
 from typing import Callable, Dict, List, Optional, Sequence, Union
 
@@ -11,6 +12,51 @@ from mmengine.dataset import BaseDataset, Compose
 from mmseg.registry import DATASETS
 
 
+def _scan_dir(root: str, suffix: str, cached: Optional[dict] = None) -> dict:
+    """Index the files ending with ``suffix`` below ``root`` in one
+    ``os.scandir`` pass per directory.
+
+    Directories whose mtime matches ``cached`` are not listed again, their
+    cached entries are reused, so only new or changed directories are
+    scanned. Like ``fileio.list_dir_or_file``, hidden files are skipped.
+
+    Returns:
+        dict: Relative directory to ``dict(mtime, files, subdirs)``, where
+            ``files`` holds ``(name, size, mtime_ns)`` tuples.
+    """
+    cached = cached or {}
+    tree = {}
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        dir_path = osp.join(root, rel_dir)
+        mtime = os.stat(dir_path).st_mtime_ns
+        entry = cached.get(rel_dir, None)
+        if entry is None or entry['mtime'] != mtime:
+            files, subdirs = [], []
+            with os.scandir(dir_path) as it:
+                for item in it:
+                    if not item.name.startswith('.') and item.is_file():
+                        if item.name.endswith(suffix):
+                            stat = item.stat()
+                            files.append(
+                                (item.name, stat.st_size, stat.st_mtime_ns))
+                    elif item.is_dir():
+                        subdirs.append(item.name)
+            entry = dict(mtime=mtime, files=files, subdirs=subdirs)
+        tree[rel_dir] = entry
+        stack.extend(osp.join(rel_dir, d) for d in entry['subdirs'])
+    return tree
+
+
+def _list_files(tree: dict) -> set:
+    """Relative paths of all files of a ``_scan_dir`` index."""
+    return {
+        osp.join(rel_dir, name)
+        for rel_dir, entry in tree.items() for name, _, _ in entry['files']
+    }
+
+
 @DATASETS.register_module()
 class _BaseCDDataset(BaseDataset):
     """Custom datasets for change detection. An example of file structure
@@ -48,6 +94,12 @@ class _BaseCDDataset(BaseDataset):
         format_seg_map (str): If `format_seg_map`='to_binary', the binary 
             change detection label will be formatted as 0 (<128) or 1 (>=128).
             Default: None
+        index_cache (str, optional): Without ``ann_file``, path of a file
+            caching the directory listing of ``img_path_from`` and
+            ``img_path_to`` (file names, sizes and mtimes per directory).
+            On the next construction only directories whose mtime changed
+            are listed again. Relative to ``data_root`` when it is given.
+            Only used for local paths. Default: None
         filter_cfg (dict, optional): Config for filter data. Defaults to None.
         indices (int or Sequence[int], optional): Support using first few
             data in annotation file to facilitate training/testing on a smaller
@@ -82,6 +134,7 @@ class _BaseCDDataset(BaseDataset):
                  img_suffix='.jpg',
                  seg_map_suffix='.png',
                  format_seg_map=None,
+                 index_cache: Optional[str] = None,
                  metainfo: Optional[dict] = None,
                  data_root: Optional[str] = None,
                  data_prefix: dict = dict(img_path='', seg_map_path=''),
@@ -99,6 +152,10 @@ class _BaseCDDataset(BaseDataset):
         self.img_suffix = img_suffix
         self.seg_map_suffix = seg_map_suffix
         self.format_seg_map = format_seg_map
+        self.index_cache = index_cache
+        if (index_cache is not None and data_root is not None
+                and not osp.isabs(index_cache)):
+            self.index_cache = osp.join(data_root, index_cache)
         self.ignore_index = ignore_index
         self.reduce_zero_label = reduce_zero_label
         self.backend_args = backend_args.copy() if backend_args else None
@@ -253,29 +310,7 @@ class _BaseCDDataset(BaseDataset):
                 data_info['seg_fields'] = []
                 data_list.append(data_info)
         else:
-            file_list_from = fileio.list_dir_or_file(
-                    dir_path=img_dir_from,
-                    list_dir=False,
-                    suffix=self.img_suffix,
-                    recursive=True,
-                    backend_args=self.backend_args)
-            file_list_to = fileio.list_dir_or_file(
-                    dir_path=img_dir_to,
-                    list_dir=False,
-                    suffix=self.img_suffix,
-                    recursive=True,
-                    backend_args=self.backend_args)
-
-            assert sorted(list(file_list_from)) == sorted(list(file_list_to)), \
-                'The images in `img_path_from` and `img_path_to` are not ' \
-                    'one-to-one correspondence'
-
-            for img in fileio.list_dir_or_file(
-                    dir_path=img_dir_from,
-                    list_dir=False,
-                    suffix=self.img_suffix,
-                    recursive=True,
-                    backend_args=self.backend_args):
+            for img in self._list_img_pairs(img_dir_from, img_dir_to):
                 data_info = dict(img_path=\
                                  [osp.join(img_dir_from, img), \
                                   osp.join(img_dir_to, img)])
@@ -287,5 +322,48 @@ class _BaseCDDataset(BaseDataset):
                 data_info['reduce_zero_label'] = self.reduce_zero_label
                 data_info['seg_fields'] = []
                 data_list.append(data_info)
-            data_list = sorted(data_list, key=lambda x: x['img_path'])
         return data_list
+
+    def _list_img_pairs(self, img_dir_from: str, img_dir_to: str) -> List[str]:
+        """Sorted relative paths of the images found in both directories.
+
+        Local directories are indexed with one ``os.scandir`` pass each,
+        reusing ``index_cache`` when given; other backends are listed with
+        ``fileio.list_dir_or_file``.
+        """
+        backend = fileio.get_file_backend(
+            img_dir_from, backend_args=self.backend_args)
+        if not isinstance(backend, fileio.LocalBackend):
+            file_list_from, file_list_to = (set(
+                fileio.list_dir_or_file(
+                    dir_path=img_dir,
+                    list_dir=False,
+                    suffix=self.img_suffix,
+                    recursive=True,
+                    backend_args=self.backend_args))
+                for img_dir in (img_dir_from, img_dir_to))
+        else:
+            cache = {}
+            if self.index_cache is not None and osp.isfile(self.index_cache):
+                cache = mmengine.load(self.index_cache, file_format='pkl')
+                if cache.get('suffix', None) != self.img_suffix:
+                    cache = {}
+            trees = {
+                img_dir: _scan_dir(img_dir, self.img_suffix,
+                                   cache.get(osp.abspath(img_dir), None))
+                for img_dir in (img_dir_from, img_dir_to)
+            }
+            new_cache = {osp.abspath(k): v for k, v in trees.items()}
+            new_cache['suffix'] = self.img_suffix
+            if self.index_cache is not None and new_cache != cache:
+                # write then rename, other ranks may be reading it
+                tmp_file = f'{self.index_cache}.{os.getpid()}.tmp'
+                mmengine.dump(new_cache, tmp_file, file_format='pkl')
+                os.replace(tmp_file, self.index_cache)
+            file_list_from = _list_files(trees[img_dir_from])
+            file_list_to = _list_files(trees[img_dir_to])
+
+        assert file_list_from == file_list_to, \
+            'The images in `img_path_from` and `img_path_to` are not ' \
+                'one-to-one correspondence'
+        return sorted(file_list_from)
@@ -0,0 +1,4 @@
+# Copyright (c) Open-CD. All rights reserved.
+from .change_aware_sampler import ChangeAwareSampler, change_stats
+
+__all__ = ['ChangeAwareSampler', 'change_stats']
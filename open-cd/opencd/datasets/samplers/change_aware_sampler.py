@@ -0,0 +1,205 @@
+# Copyright (c) Open-CD. All rights reserved.
+import itertools
+import os
+import os.path as osp
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Sized
+
+import mmengine
+import numpy as np
+from mmengine.dist import barrier, get_dist_info, sync_random_seed
+from mmengine.logging import print_log
+from torch.utils.data import Sampler
+
+from opencd.registry import DATA_SAMPLERS
+from ..transforms import MultiImgLoadAnnotations
+
+
+def change_stats(dataset: Sized,
+                 tile_size: Optional[int] = None,
+                 ignore_index: int = 255,
+                 num_workers: int = 8) -> dict:
+    """Change pixel statistics of every sample of a change detection dataset.
+
+    The label maps are loaded with :class:`MultiImgLoadAnnotations`, so the
+    label map, ``reduce_zero_label`` and ``format_seg_map`` of the dataset
+    apply. Every label other than 0 and ``ignore_index`` counts as change.
+
+    Args:
+        dataset (Sized): Dataset with ``get_data_info``, e.g.
+            :class:`_BaseCDDataset`.
+        tile_size (int, optional): Also record, for every
+            ``tile_size x tile_size`` tile of the label map, whether it
+            contains change. Defaults to None.
+        ignore_index (int): The label index to be ignored. Default: 255
+        num_workers (int): Threads decoding the label maps. Defaults to 8.
+
+    Returns:
+        dict: ``seg_map_paths``, ``density`` (fraction of the valid pixels
+            that changed, per sample), ``tile_size`` and ``tile_masks`` (a
+            boolean array per sample, None without ``tile_size``).
+    """
+    loader = MultiImgLoadAnnotations(
+        backend_args=getattr(dataset, 'backend_args', None))
+
+    def stats(idx):
+        results = loader(dict(dataset.get_data_info(idx)))
+        seg_map = results['gt_seg_map']
+        valid = seg_map != ignore_index
+        changed = valid & (seg_map != 0)
+        density = changed.sum() / max(valid.sum(), 1)
+        tile_mask = None
+        if tile_size is not None:
+            h, w = changed.shape
+            pad_h, pad_w = -h % tile_size, -w % tile_size
+            changed = np.pad(changed, ((0, pad_h), (0, pad_w)))
+            tile_mask = changed.reshape(
+                (h + pad_h) // tile_size, tile_size,
+                (w + pad_w) // tile_size, tile_size).any(axis=(1, 3))
+        return results.get('seg_map_path', None), float(density), tile_mask
+
+    with ThreadPoolExecutor(num_workers) as pool:
+        seg_map_paths, density, tile_masks = zip(
+            *pool.map(stats, range(len(dataset))))
+    return dict(
+        seg_map_paths=list(seg_map_paths),
+        density=np.array(density, dtype=np.float32),
+        tile_size=tile_size,
+        tile_masks=list(tile_masks) if tile_size is not None else None)
+
+
+@DATA_SAMPLERS.register_module()
+class ChangeAwareSampler(Sampler):
+    """Infinite sampler drawing a fixed share of samples that contain change.
+
+    Change detection datasets are dominated by unchanged pixels, so with a
+    uniform sampler most iterations see little or no change. This sampler
+    measures the change of every label map once, when it is built, and then
+    draws a fraction ``positive_ratio`` of the indices among the samples
+    with change, the rest uniformly from the whole dataset. Like
+    :class:`mmengine.dataset.InfiniteSampler` it yields an endless stream,
+    split between the ranks, for ``IterBasedTrainLoop``.
+
+    With ``tile_size`` the positive samples are weighted by their number of
+    tiles containing change instead of uniformly, which approximates
+    drawing a changed tile uniformly over the dataset: a sample with one
+    small changed building is drawn less often than one with a whole new
+    district. To also make the crop land on the change, set
+    ``positive_ratio`` of :class:`MultiImgRandomCrop` or
+    :class:`MultiImgRandomRotateCrop`.
+
+    Measuring decodes every label map, ``stats_file`` caches the result;
+    it is rebuilt when the label map paths or ``tile_size`` differ.
+
+    Args:
+        dataset (Sized): The dataset, e.g. :class:`_BaseCDDataset`.
+        positive_ratio (float): Fraction of the indices drawn among the
+            samples with change. Defaults to 0.5.
+        tile_size (int, optional): Size of the tiles weighting the positive
+            samples. Defaults to None, every positive sample weighs the same.
+        min_density (float): Fraction of changed pixels from which a sample
+            counts as positive. Defaults to 0, any changed pixel.
+        stats_file (str, optional): Pickle file caching the change
+            statistics. Defaults to None.
+        seed (int, optional): Random seed. If None, set a random seed.
+            Defaults to None.
+        num_workers (int): Threads decoding the label maps while measuring.
+            Defaults to 8.
+    """
+
+    def __init__(self,
+                 dataset: Sized,
+                 positive_ratio: float = 0.5,
+                 tile_size: Optional[int] = None,
+                 min_density: float = 0.,
+                 stats_file: Optional[str] = None,
+                 seed: Optional[int] = None,
+                 num_workers: int = 8) -> None:
+        assert 0 <= positive_ratio <= 1
+        rank, world_size = get_dist_info()
+        self.rank = rank
+        self.world_size = world_size
+
+        self.dataset = dataset
+        self.positive_ratio = positive_ratio
+        self.tile_size = tile_size
+        self.min_density = min_density
+        if seed is None:
+            seed = sync_random_seed()
+        self.seed = seed
+        self.size = len(dataset)
+
+        stats = self._load_stats(stats_file, num_workers)
+        self.density = stats['density']
+        weights = (self.density > min_density).astype(np.float64)
+        if tile_size is not None:
+            weights *= [mask.sum() for mask in stats['tile_masks']]
+        self.positives = np.flatnonzero(weights)
+        self.positive_probs = None
+        if len(self.positives) > 0:
+            self.positive_probs = weights[self.positives] / weights.sum()
+        print_log(
+            f'ChangeAwareSampler: {len(self.positives)} of {self.size} '
+            'samples contain change', logger='current')
+
+        self.indices = self._indices_of_rank()
+
+    def _load_stats(self, stats_file: Optional[str],
+                    num_workers: int) -> dict:
+        """Load the change statistics from ``stats_file`` or measure them."""
+        ignore_index = getattr(self.dataset, 'ignore_index', 255)
+        if stats_file is None:
+            return change_stats(self.dataset, self.tile_size, ignore_index,
+                                num_workers)
+
+        seg_map_paths = [
+            self.dataset.get_data_info(idx).get('seg_map_path', None)
+            for idx in range(self.size)
+        ]
+        if self.rank == 0:
+            stats = None
+            if osp.isfile(stats_file):
+                stats = mmengine.load(stats_file, file_format='pkl')
+                if stats['seg_map_paths'] != seg_map_paths or \
+                        stats['tile_size'] != self.tile_size:
+                    stats = None
+            if stats is None:
+                stats = change_stats(self.dataset, self.tile_size,
+                                     ignore_index, num_workers)
+                tmp_file = f'{stats_file}.{os.getpid()}.tmp'
+                mmengine.dump(stats, tmp_file, file_format='pkl')
+                os.replace(tmp_file, stats_file)
+        barrier()
+        if self.rank != 0:
+            stats = mmengine.load(stats_file, file_format='pkl')
+        return stats
+
+    def _infinite_indices(self) -> Iterator[int]:
+        """Infinitely yield a sequence of indices."""
+        rng = np.random.default_rng(self.seed)
+        while True:
+            indices = rng.integers(self.size, size=self.size)
+            if self.positive_probs is not None:
+                positive = rng.random(self.size) < self.positive_ratio
+                indices[positive] = rng.choice(
+                    self.positives,
+                    size=int(positive.sum()),
+                    p=self.positive_probs)
+            yield from indices.tolist()
+
+    def _indices_of_rank(self) -> Iterator[int]:
+        """Slice the infinite indices by rank."""
+        yield from itertools.islice(self._infinite_indices(), self.rank, None,
+                                    self.world_size)
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterate the indices."""
+        yield from self.indices
+
+    def __len__(self) -> int:
+        """Length of base dataset."""
+        return self.size
+
+    def set_epoch(self, epoch: int) -> None:
+        """Not supported in iteration-based runner."""
+        pass
@@ -1,14 +1,20 @@
 # Copyright (c) Open-CD. All rights reserved.
 from .formatting import MultiImgPackSegInputs
+from .fused_transforms import (MultiImgFusedPhotoMetricDistortion,
+                               MultiImgFusedRandomCrop,
+                               MultiImgFusedRandomFlip,
+                               MultiImgFusedRandomRotate)
 from .loading import (MultiImgLoadAnnotations, MultiImgLoadImageFromFile,
                       MultiImgLoadInferencerLoader,
-                      MultiImgLoadLoadImageFromNDArray)
+                      MultiImgLoadLoadImageFromNDArray,
+                      MultiImgLoadMultispectralFromFile)
 # yapf: disable
 from .transforms import (MultiImgAdjustGamma, MultiImgAlbu, MultiImgCLAHE,
                          MultiImgExchangeTime, MultiImgNormalize, MultiImgPad,
                          MultiImgPhotoMetricDistortion, MultiImgRandomCrop,
                          MultiImgRandomCutOut, MultiImgRandomFlip,
                          MultiImgRandomResize, MultiImgRandomRotate,
+                         MultiImgRandomRotateCrop,
                          MultiImgRandomRotFlip, MultiImgRerange,
                          MultiImgResize, MultiImgResizeShortestEdge,
                          MultiImgResizeToMultiple, MultiImgRGB2Gray)
@@ -22,5 +28,7 @@ __all__ = [
     'MultiImgPhotoMetricDistortion', 'MultiImgRandomCutOut', 'MultiImgRandomRotFlip',
     'MultiImgResizeShortestEdge', 'MultiImgExchangeTime', 'MultiImgResize', 
     'MultiImgRandomResize', 'MultiImgNormalize', 'MultiImgRandomFlip', 'MultiImgPad', 
-    'MultiImgAlbu'
+    'MultiImgAlbu', 'MultiImgFusedRandomRotate', 'MultiImgFusedRandomCrop',
+    'MultiImgFusedRandomFlip', 'MultiImgFusedPhotoMetricDistortion',
+    'MultiImgRandomRotateCrop', 'MultiImgLoadMultispectralFromFile'
 ]
@@ -38,14 +38,27 @@ class MultiImgPackSegInputs(BaseTransform):
             Default: ``('img_path', 'ori_shape',
             'img_shape', 'pad_shape', 'scale_factor', 'flip',
             'flip_direction')``
+        compact_labels (bool): Whether to keep the label maps uint8 instead
+            of casting them to int64. Labels then cross the dataloader
+            worker queues at 1/8 of the size and are cast to int64 on device
+            by :class:`DualInputSegDataPreProcessor`. Only valid when every
+            label value, ``ignore_index`` included, fits in uint8.
+            Default: False.
     """
 
     def __init__(self,
                  meta_keys=('img_path', 'seg_map_path', 'seg_map_path_from', 
                             'seg_map_path_to', 'ori_shape','img_shape', 
                             'pad_shape', 'scale_factor', 'flip',
-                            'flip_direction')):
+                            'flip_direction'),
+                 compact_labels=False):
         self.meta_keys = meta_keys
+        self.compact_labels = compact_labels
+
+    def _pack_label(self, label: np.ndarray) -> np.ndarray:
+        dtype = np.uint8 if self.compact_labels else np.int64
+        # copies only if needed, e.g. after a flip (negative strides)
+        return np.ascontiguousarray(label[None, ...], dtype=dtype)
 
     def transform(self, results: dict) -> dict:
         """Method to pack the input data.
@@ -65,7 +78,8 @@ class MultiImgPackSegInputs(BaseTransform):
             def _transform_img(img):
                 if len(img.shape) < 3:
                     img = np.expand_dims(img, -1)
-                if not img.flags.c_contiguous:
+                # read-only images (decoded cache views) are copied here too
+                if not img.flags.c_contiguous or not img.flags.writeable:
                     img = to_tensor(np.ascontiguousarray(img.transpose(2, 0, 1)))
                 else:
                     img = img.transpose(2, 0, 1)
@@ -79,26 +93,22 @@ class MultiImgPackSegInputs(BaseTransform):
         data_sample = SegDataSample()
         if 'gt_seg_map' in results:
             gt_sem_seg_data = dict(
-                data=to_tensor(results['gt_seg_map'][None,
-                                                     ...].astype(np.int64)))
+                data=to_tensor(self._pack_label(results['gt_seg_map'])))
             data_sample.gt_sem_seg = PixelData(**gt_sem_seg_data)
 
         if 'gt_edge_map' in results:
             gt_edge_data = dict(
-                data=to_tensor(results['gt_edge_map'][None,
-                                                      ...].astype(np.int64)))
+                data=to_tensor(self._pack_label(results['gt_edge_map'])))
             data_sample.set_data(dict(gt_edge_map=PixelData(**gt_edge_data)))
         
         if 'gt_seg_map_from' in results:
             gt_sem_seg_data_from = dict(
-                data=to_tensor(results['gt_seg_map_from'][None,
-                                                     ...].astype(np.int64)))
+                data=to_tensor(self._pack_label(results['gt_seg_map_from'])))
             data_sample.set_data(dict(gt_sem_seg_from=PixelData(**gt_sem_seg_data_from)))
 
         if 'gt_seg_map_to' in results:
             gt_sem_seg_data_to = dict(
-                data=to_tensor(results['gt_seg_map_to'][None,
-                                                     ...].astype(np.int64)))
+                data=to_tensor(self._pack_label(results['gt_seg_map_to'])))
             data_sample.set_data(dict(gt_sem_seg_to=PixelData(**gt_sem_seg_data_to)))
 
         img_meta = {}
@@ -112,5 +122,6 @@ class MultiImgPackSegInputs(BaseTransform):
 
     def __repr__(self) -> str:
         repr_str = self.__class__.__name__
-        repr_str += f'(meta_keys={self.meta_keys})'
+        repr_str += f'(meta_keys={self.meta_keys}, '
+        repr_str += f'compact_labels={self.compact_labels})'
         return repr_str
@@ -0,0 +1,327 @@
+# Copyright (c) Open-CD. All rights reserved.
+"""Bi-temporal transforms working on the A/B images as one array.
+
+The transforms in ``transforms.py`` loop over ``results['img']`` and call
+OpenCV once per timestamp. The ones here concatenate the images along the
+channel axis into a single ``(H, W, 3 * N)`` array, so that a rotation is a
+single ``cv2.warpAffine`` call, a flip or a crop a single view, and the
+photometric distortion a few vectorised numpy ops plus one colour conversion
+for all timestamps. ``results['img']`` is still a list of per-timestamp
+images, the stacked array is kept under ``img_stack`` and reused by the next
+fused transform as long as the list was not replaced in between.
+
+They take the same arguments as their per-image counterparts and can be
+swapped in a pipeline by type name only.
+"""
+from typing import List
+
+import cv2
+import numpy as np
+from mmcv.image.geometric import cv2_border_modes, cv2_interp_codes
+from numpy import random
+
+from opencd.registry import TRANSFORMS
+from .transforms import (MultiImgPhotoMetricDistortion, MultiImgRandomCrop,
+                         MultiImgRandomFlip, MultiImgRandomRotate,
+                         rotation_matrix)
+
+
+def is_stackable(imgs: List[np.ndarray]) -> bool:
+    """Whether ``imgs`` are ``(H, W, C)`` arrays of the same size and dtype,
+    otherwise the fused transforms process them one by one."""
+    return all(img.ndim == 3 for img in imgs) and \
+        len({(img.shape[:2], img.dtype) for img in imgs}) == 1
+
+
+def stack_imgs(results: dict) -> np.ndarray:
+    """Get the images of ``results`` stacked along the channel axis.
+
+    Args:
+        results (dict): Result dict holding the ``img`` list.
+
+    Returns:
+        np.ndarray: The ``(H, W, sum(C))`` array, the one left by the previous
+            fused transform when ``results['img']`` still holds its views.
+    """
+    imgs = results['img']
+    stacked = results.get('img_stack', None)
+    if stacked is not None:
+        stack, views = stacked
+        if len(views) == len(imgs) and all(
+                view is img for view, img in zip(views, imgs)):
+            return stack
+    return np.concatenate(imgs, axis=2)
+
+
+def unstack_imgs(results: dict, stack: np.ndarray,
+                 channels: List[int]) -> None:
+    """Split ``stack`` back into ``results['img']`` as views.
+
+    Args:
+        results (dict): Result dict to update.
+        stack (np.ndarray): Stacked ``(H, W, sum(C))`` images.
+        channels (list[int]): Number of channels of each image.
+    """
+    imgs, start = [], 0
+    for num_channels in channels:
+        imgs.append(stack[..., start:start + num_channels])
+        start += num_channels
+    results['img'] = imgs
+    results['img_stack'] = (stack, list(imgs))
+    results['img_shape'] = imgs[0].shape
+
+
+def warp_stack(stack: np.ndarray, matrix: np.ndarray, size: tuple,
+               interpolation: str, border_value) -> np.ndarray:
+    """``cv2.warpAffine`` of an array with any number of channels.
+
+    OpenCV repeats the 4 values of ``border_value`` over the channels, so
+    only a scalar border keeps every channel consistent.
+    """
+    if stack.ndim == 3 and stack.shape[2] == 1:
+        stack = stack[..., 0]
+    warped = cv2.warpAffine(
+        np.ascontiguousarray(stack),
+        matrix,
+        size,
+        flags=cv2_interp_codes[interpolation],
+        borderMode=cv2_border_modes['constant'],
+        borderValue=border_value)
+    if warped.ndim == 2:
+        warped = warped[..., None]
+    return warped
+
+
+def stack_seg_maps(results: dict) -> tuple:
+    """Stack the ``seg_fields`` of ``results`` along a new channel axis."""
+    keys = list(results.get('seg_fields', []))
+    if not keys:
+        return keys, None
+    segs = [results[key] for key in keys]
+    if len({(seg.shape, seg.dtype) for seg in segs}) != 1 or \
+            segs[0].ndim != 2:
+        return keys, None
+    return keys, np.stack(segs, axis=2)
+
+
+@TRANSFORMS.register_module()
+class MultiImgFusedRandomRotate(MultiImgRandomRotate):
+    """Rotate the images & seg, all timestamps in one warp.
+
+    Same arguments and behaviour as :class:`MultiImgRandomRotate`, but the
+    images are rotated with a single ``cv2.warpAffine`` call on their channel
+    stack and all the segmentation maps with another one. ``pad_val`` must be
+    a scalar.
+    """
+
+    def transform(self, results: dict) -> dict:
+        """Call function to rotate image, semantic segmentation maps.
+
+        Args:
+            results (dict): Result dict from loading pipeline.
+
+        Returns:
+            dict: Rotated results.
+        """
+        if not is_stackable(results['img']) or \
+                not np.isscalar(self.pal_val):
+            return super().transform(results)
+
+        rotate, degree = self.generate_degree()
+        if not rotate:
+            return results
+
+        stack = stack_imgs(results)
+        matrix, (w, h) = rotation_matrix(stack.shape, degree, self.center,
+                                         self.auto_bound)
+
+        channels = [img.shape[2] for img in results['img']]
+        stack = warp_stack(stack, matrix, (w, h), 'bilinear', self.pal_val)
+        unstack_imgs(results, stack, channels)
+
+        keys, segs = stack_seg_maps(results)
+        if segs is not None:
+            segs = warp_stack(segs, matrix, (w, h), 'nearest',
+                              self.seg_pad_val)
+            for i, key in enumerate(keys):
+                results[key] = segs[..., i]
+        else:
+            for key in keys:
+                results[key] = warp_stack(results[key], matrix, (w, h),
+                                          'nearest', self.seg_pad_val)[..., 0]
+        return results
+
+
+@TRANSFORMS.register_module()
+class MultiImgFusedRandomCrop(MultiImgRandomCrop):
+    """Random crop the images & seg, all timestamps in one slice.
+
+    Same arguments and behaviour as :class:`MultiImgRandomCrop`. The crop is a
+    view of the channel stack, so chaining it after
+    :class:`MultiImgFusedRandomRotate` copies nothing.
+    """
+
+    def transform(self, results: dict) -> dict:
+        """Transform function to randomly crop images, semantic segmentation
+        maps.
+
+        Args:
+            results (dict): Result dict from loading pipeline.
+
+        Returns:
+            dict: Randomly cropped results, 'img_shape' key in result dict is
+                updated according to crop size.
+        """
+        if not is_stackable(results['img']):
+            return super().transform(results)
+
+        crop_bbox = self.crop_bbox(results)
+        channels = [img.shape[2] for img in results['img']]
+        unstack_imgs(results, self.crop(stack_imgs(results), crop_bbox),
+                     channels)
+        for key in results.get('seg_fields', []):
+            results[key] = self.crop(results[key], crop_bbox)
+        return results
+
+
+@TRANSFORMS.register_module()
+class MultiImgFusedRandomFlip(MultiImgRandomFlip):
+    """Flip the images & segmentation map, all timestamps in one view.
+
+    Same arguments and behaviour as :class:`MultiImgRandomFlip`.
+    """
+
+    _flip_axis = dict(horizontal=1, vertical=0, diagonal=(0, 1))
+
+    def transform(self, results: dict) -> dict:
+        """Transform function to flip images, semantic
+        segmentation map.
+
+        Args:
+            results (dict): Result dict from loading pipeline.
+
+        Returns:
+            dict: Flipped results, 'img', 'gt_seg_map',
+            'flip', and 'flip_direction' keys are
+            updated in result dict.
+        """
+        if not is_stackable(results['img']):
+            return super().transform(results)
+
+        cur_dir = self._choose_direction()
+        results['flip'] = cur_dir is not None
+        results['flip_direction'] = cur_dir
+        if cur_dir is None:
+            return results
+
+        axis = self._flip_axis[cur_dir]
+        channels = [img.shape[2] for img in results['img']]
+        unstack_imgs(results, np.flip(stack_imgs(results), axis=axis),
+                     channels)
+        for key in results.get('seg_fields', []):
+            # use copy() to make numpy stride positive
+            results[key] = np.flip(results[key], axis=axis).copy()
+        return results
+
+
+@TRANSFORMS.register_module()
+class MultiImgFusedPhotoMetricDistortion(MultiImgPhotoMetricDistortion):
+    """Photometric distortion vectorised over the timestamps.
+
+    Same arguments and random parameters as
+    :class:`MultiImgPhotoMetricDistortion`: every timestamp draws its own
+    brightness, contrast, saturation and hue changes. They are applied with
+    per-timestamp ``alpha``/``beta`` broadcast over the ``(H, W, N, 3)`` view
+    of the channel stack, and saturation and hue share a single BGR -> HSV ->
+    BGR round trip for all the timestamps instead of one round trip per
+    operation and image. Results differ from the per-image transform only by
+    the rounding of that skipped round trip.
+
+    Only 3-channel images are handled here, others fall back to the per-image
+    implementation.
+    """
+
+    def _convert(self, imgs: np.ndarray, alpha: np.ndarray,
+                 beta: np.ndarray) -> np.ndarray:
+        """:meth:`convert` with one ``alpha``/``beta`` per timestamp."""
+        imgs = imgs.astype(np.float32) * alpha + beta
+        np.clip(imgs, 0, 255, out=imgs)
+        return imgs.astype(np.uint8)
+
+    def _draw(self, num: int, low: float, high: float, neutral: float):
+        """Draw per-timestamp factors, ``neutral`` where not applied."""
+        apply = random.randint(2, size=num).astype(bool)
+        values = np.where(apply, random.uniform(low, high, size=num), neutral)
+        return apply, values.astype(np.float32)
+
+    def transform(self, results: dict) -> dict:
+        """Transform function to perform photometric distortion on images.
+
+        Args:
+            results (dict): Result dict from loading pipeline.
+
+        Returns:
+            dict: Result dict with images distorted.
+        """
+        if not is_stackable(results['img']) or \
+                results['img'][0].dtype != np.uint8 or \
+                any(img.shape[2] != 3 for img in results['img']):
+            return super().transform(results)
+
+        stack = stack_imgs(results)
+        h, w = stack.shape[:2]
+        num = len(results['img'])
+        imgs = stack.reshape(h, w, num, 3)
+
+        bright, beta = self._draw(num, -self.brightness_delta,
+                                  self.brightness_delta, 0.)
+        if self.consistent_contrast_mode:
+            mode = np.full(num, random.randint(2))
+        else:
+            mode = random.randint(2, size=num)
+        contrast, alpha = self._draw(num, self.contrast_lower,
+                                     self.contrast_upper, 1.)
+        saturation, sat_alpha = self._draw(num, self.saturation_lower,
+                                           self.saturation_upper, 1.)
+        hue = random.randint(2, size=num).astype(bool)
+        hue_delta = np.where(
+            hue, random.randint(-self.hue_delta, self.hue_delta, size=num), 0)
+
+        ones = np.ones(num, np.float32)
+        zeros = np.zeros(num, np.float32)
+        if bright.any():
+            imgs = self._convert(imgs, ones[:, None], beta[:, None])
+        # mode == 1 --> do random contrast first
+        first = contrast & (mode == 1)
+        if first.any():
+            imgs = self._convert(imgs,
+                                 np.where(first, alpha, 1.)[:, None],
+                                 zeros[:, None])
+
+        hsv_mask = saturation | hue
+        if hsv_mask.any():
+            imgs = np.ascontiguousarray(imgs)
+            # the timestamps sit side by side, so one conversion covers all
+            hsv = cv2.cvtColor(
+                imgs.reshape(h, w * num, 3),
+                cv2.COLOR_BGR2HSV).reshape(h, w, num, 3)
+            if saturation.any():
+                hsv[..., 1] = self._convert(hsv[..., 1], sat_alpha, zeros)
+            if hue.any():
+                hsv[..., 0] = (hsv[..., 0].astype(int) + hue_delta) % 180
+            bgr = cv2.cvtColor(hsv.reshape(h, w * num, 3),
+                               cv2.COLOR_HSV2BGR).reshape(h, w, num, 3)
+            # leave the untouched timestamps out of the lossy round trip
+            imgs = np.where(hsv_mask[:, None], bgr, imgs)
+
+        # mode == 0 --> do random contrast last
+        last = contrast & (mode == 0)
+        if last.any():
+            imgs = self._convert(imgs,
+                                 np.where(last, alpha, 1.)[:, None],
+                                 zeros[:, None])
+
+        unstack_imgs(results,
+                     np.ascontiguousarray(imgs).reshape(h, w, 3 * num),
+                     [3] * num)
+        return results
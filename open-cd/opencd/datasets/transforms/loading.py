@@ -1,6 +1,10 @@
 # Copyright (c) Open-CD. All rights reserved.
+import io
+import mmap
+import os.path as osp
 import warnings
-from typing import Dict, Optional, Union
+import zipfile
+from typing import Dict, Optional, Sequence, Union
 
 import mmcv
 import mmengine.fileio as fileio
@@ -11,6 +15,41 @@ from mmcv.transforms import LoadImageFromFile as MMCV_LoadImageFromFile
 
 from opencd.registry import TRANSFORMS
 
+try:
+    from rasterio.io import MemoryFile
+except ImportError:
+    MemoryFile = None
+
+# Shards of :class:`PackedCDDataset`, memory-mapped once per process.
+_packed_shards: Dict[str, mmap.mmap] = {}
+
+
+def _open_shard(shard: str) -> mmap.mmap:
+    buf = _packed_shards.get(shard)
+    if buf is None:
+        with open(shard, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _packed_shards[shard] = buf
+    return buf
+
+
+def get_packed_bytes(shard: str, span: Sequence[int]) -> memoryview:
+    """Get the encoded file stored at ``span`` (offset, length) of a packed
+    shard without copying it."""
+    offset, length = span
+    return memoryview(_open_shard(shard))[offset:offset + length]
+
+
+def get_packed_array(shard: str, span: Sequence) -> np.ndarray:
+    """Get the decoded uint8 image stored at ``span`` (offset, shape) of a
+    decoded cache. The result is a read-only view into the page cache."""
+    offset, shape = span
+    return np.frombuffer(
+        _open_shard(shard),
+        dtype=np.uint8,
+        count=int(np.prod(shape)),
+        offset=offset).reshape(shape)
+
 
 @TRANSFORMS.register_module()
 class MultiImgLoadImageFromFile(MMCV_LoadImageFromFile):
@@ -20,6 +59,12 @@ class MultiImgLoadImageFromFile(MMCV_LoadImageFromFile):
 
     - img_path
 
+    Optional Keys:
+
+    - packed (dict): Shard and spans set by :class:`PackedCDDataset`,
+      images are then decoded from the memory-mapped shard, or returned as
+      read-only views when the shard is a decoded cache.
+
     Modified Keys:
 
     - img
@@ -31,6 +76,9 @@ class MultiImgLoadImageFromFile(MMCV_LoadImageFromFile):
     def __init__(self, **kwargs) -> None:
          super().__init__(**kwargs)
 
+    def _to_float32(self, img: np.ndarray) -> np.ndarray:
+        return img.astype(np.float32) if self.to_float32 else img
+
     def transform(self, results: dict) -> Optional[dict]:
         """Functions to load image.
 
@@ -43,10 +91,19 @@ class MultiImgLoadImageFromFile(MMCV_LoadImageFromFile):
         """
 
         filenames = results['img_path']
+        packed = results.get('packed', None)
         imgs = []
         try:
-            for filename in filenames:
-                if self.file_client_args is not None:
+            for i, filename in enumerate(filenames):
+                if packed is not None and packed.get('decoded', False):
+                    # read-only view, transforms have to copy before writing
+                    imgs.append(self._to_float32(
+                        get_packed_array(packed['shard'], packed['img'][i])))
+                    continue
+                if packed is not None:
+                    img_bytes = get_packed_bytes(packed['shard'],
+                                                 packed['img'][i])
+                elif self.file_client_args is not None:
                     file_client = fileio.FileClient.infer_client(
                         self.file_client_args, filename)
                     img_bytes = file_client.get(filename)
@@ -55,9 +112,7 @@ class MultiImgLoadImageFromFile(MMCV_LoadImageFromFile):
                         filename, backend_args=self.backend_args)
                 img = mmcv.imfrombytes(
                 img_bytes, flag=self.color_type, backend=self.imdecode_backend)
-                if self.to_float32:
-                    img = img.astype(np.float32)
-                imgs.append(img)
+                imgs.append(self._to_float32(img))
         except Exception as e:
             if self.ignore_empty:
                 return None
@@ -70,6 +125,131 @@ class MultiImgLoadImageFromFile(MMCV_LoadImageFromFile):
         return results
 
 
+@TRANSFORMS.register_module()
+class MultiImgLoadMultispectralFromFile(BaseTransform):
+    """Load a multispectral image pair from GeoTIFF files or band archives.
+
+    Unlike :class:`MultiImgLoadImageFromFile`, the bands are read as stored
+    by the sensor instead of from 8-bit PNG renderings, so no band is
+    dropped and no per-image contrast stretch or quantisation happens
+    before the model. Each path of ``img_path`` is either
+
+    - a multi-band GeoTIFF, whose bands become the channels in file order
+      (or in ``band_indexes`` order), or
+    - a ``.zip`` holding one single-band GeoTIFF per band, as exported for
+      Sentinel-2 by the Copernicus Browser. The members are found by the
+      band names of ``bands`` in their file names.
+
+    The image is returned as ``(H, W, N)`` ``float16`` (or ``float32``),
+    multiplied by ``scale``. Half precision halves the memory of the
+    pipeline and of the dataloader queue, and keeps more precision than the
+    8-bit PNGs for any range of the reflectance.
+
+    Required Keys:
+
+    - img_path
+
+    Modified Keys:
+
+    - img
+    - img_shape
+    - ori_shape
+
+    Args:
+        bands (Sequence[str]): Names of the bands read from ``.zip``
+            archives, in channel order. Defaults to
+            ``('B02', 'B03', 'B04', 'B08')``, Sentinel-2 blue, green, red and
+            near infrared.
+        band_indexes (Sequence[int], optional): 1-based bands read from
+            GeoTIFF files, in channel order. Defaults to None, all bands.
+        scale (float): Factor applied to the raw values, e.g. ``1e-4`` for
+            Sentinel-2 L2A reflectance. Defaults to 1.
+        to_float16 (bool): Whether to return ``float16`` instead of
+            ``float32`` arrays. Defaults to True.
+        backend_args (dict): Arguments to instantiate a file backend.
+            See https://mmengine.readthedocs.io/en/latest/api/fileio.htm
+            for details. Defaults to None.
+    """
+
+    def __init__(self,
+                 bands: Sequence[str] = ('B02', 'B03', 'B04', 'B08'),
+                 band_indexes: Optional[Sequence[int]] = None,
+                 scale: float = 1.,
+                 to_float16: bool = True,
+                 backend_args: Optional[dict] = None) -> None:
+        if MemoryFile is None:
+            raise ImportError('Please run "pip install rasterio" to read '
+                              'multispectral images.')
+        self.bands = list(bands)
+        self.band_indexes = list(band_indexes) \
+            if band_indexes is not None else None
+        self.scale = scale
+        self.to_float16 = to_float16
+        self.backend_args = backend_args.copy() if backend_args else None
+
+    @staticmethod
+    def _read_tiff(content: bytes,
+                   indexes: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Decode a GeoTIFF to an ``(H, W, N)`` array."""
+        with MemoryFile(content) as memfile, memfile.open() as src:
+            img = src.read(indexes)
+        return img.transpose(1, 2, 0)
+
+    def _read_zip(self, content: bytes, filename: str) -> np.ndarray:
+        """Decode the ``bands`` of a band archive to an ``(H, W, N)`` array."""
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            members = [
+                name for name in archive.namelist()
+                if name.lower().endswith(('.tif', '.tiff'))
+            ]
+            channels = []
+            for band in self.bands:
+                member = next(
+                    (name for name in members if band in osp.basename(name)),
+                    None)
+                if member is None:
+                    raise FileNotFoundError(
+                        f'Band {band} not found in {filename}')
+                channels.append(self._read_tiff(archive.read(member), [1]))
+        return np.concatenate(channels, axis=2)
+
+    def transform(self, results: dict) -> dict:
+        """Functions to load the multispectral images.
+
+        Args:
+            results (dict): Result dict from
+                :class:`mmengine.dataset.BaseDataset`.
+
+        Returns:
+            dict: The dict contains loaded images and meta information.
+        """
+        imgs = []
+        for filename in results['img_path']:
+            content = fileio.get(filename, backend_args=self.backend_args)
+            if filename.lower().endswith('.zip'):
+                img = self._read_zip(content, filename)
+            else:
+                img = self._read_tiff(content, self.band_indexes)
+            img = img.astype(np.float32)
+            if self.scale != 1:
+                img *= self.scale
+            imgs.append(img.astype(np.float16) if self.to_float16 else img)
+
+        results['img'] = imgs
+        results['img_shape'] = imgs[0].shape[:2]
+        results['ori_shape'] = imgs[0].shape[:2]
+        return results
+
+    def __repr__(self) -> str:
+        repr_str = self.__class__.__name__
+        repr_str += f'(bands={self.bands}, '
+        repr_str += f'band_indexes={self.band_indexes}, '
+        repr_str += f'scale={self.scale}, '
+        repr_str += f'to_float16={self.to_float16}, '
+        repr_str += f'backend_args={self.backend_args})'
+        return repr_str
+
+
 @TRANSFORMS.register_module()
 class MultiImgLoadAnnotations(MMCV_LoadAnnotations):
     """Load annotations for change detection provided by dataset.
@@ -98,6 +278,10 @@ class MultiImgLoadAnnotations(MMCV_LoadAnnotations):
 
     - seg_map_path (str): Path of change detection ground truth file.
 
+    Optional Keys:
+
+    - packed (dict): Shard and spans set by :class:`PackedCDDataset`.
+
     Added Keys:
 
     - seg_fields (List)
@@ -148,11 +332,25 @@ class MultiImgLoadAnnotations(MMCV_LoadAnnotations):
             dict: The dict contains loaded semantic segmentation annotations.
         """
 
-        img_bytes = fileio.get(
-            results['seg_map_path'], backend_args=self.backend_args)
-        gt_semantic_seg = mmcv.imfrombytes(
-            img_bytes, flag='grayscale', # in mmseg: unchanged
-            backend=self.imdecode_backend).squeeze().astype(np.uint8)
+        packed = results.get('packed', None)
+        if packed is not None and packed['seg_map'] is not None:
+            if packed.get('decoded', False):
+                gt_semantic_seg = get_packed_array(packed['shard'],
+                                                   packed['seg_map'])
+            else:
+                gt_semantic_seg = mmcv.imfrombytes(
+                    get_packed_bytes(packed['shard'], packed['seg_map']),
+                    flag='grayscale',
+                    backend=self.imdecode_backend)
+        else:
+            img_bytes = fileio.get(
+                results['seg_map_path'], backend_args=self.backend_args)
+            gt_semantic_seg = mmcv.imfrombytes(
+                img_bytes, flag='grayscale', # in mmseg: unchanged
+                backend=self.imdecode_backend)
+        # `astype` copies, the label is modified in place below and must
+        # not alias a read-only cache view
+        gt_semantic_seg = gt_semantic_seg.squeeze().astype(np.uint8)
 
         # reduce zero_label
         if self.reduce_zero_label is None:
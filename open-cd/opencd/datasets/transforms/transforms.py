@@ -1,12 +1,14 @@
 # Copyright (c) Open-CD. All rights reserved.
 import copy
 import warnings
+import zlib
+from collections import OrderedDict
 from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
 import cv2
 import mmcv
 import numpy as np
-from mmcv.image.geometric import _scale_size
+from mmcv.image.geometric import _scale_size, cv2_interp_codes
 from mmcv.transforms.base import BaseTransform
 from mmcv.transforms.utils import cache_randomness
 from mmengine.utils import is_list_of, is_seq_of, is_str, is_tuple_of
@@ -189,6 +191,8 @@ class MultiImgCLAHE(BaseTransform):
         """
         
         def _clane(img):
+            if not img.flags.writeable:  # e.g. a decoded cache view
+                img = img.copy()
             for i in range(img.shape[2]):
                 img[:, :, i] = mmcv.clahe(
                     np.array(img[:, :, i], dtype=np.uint8),
@@ -206,6 +210,124 @@ class MultiImgCLAHE(BaseTransform):
         return repr_str
 
 
+def class_integrals(seg_map: np.ndarray,
+                    ignore_index: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Summed-area tables of every class present in ``seg_map``.
+
+    Args:
+        seg_map (np.ndarray): The label map.
+        ignore_index (int): The label index to be ignored.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The classes present, ``ignore_index``
+            excluded, and a ``(num_classes, H + 1, W + 1)`` int32 array, the
+            pixel count of each class above and left of every position.
+    """
+    classes = np.flatnonzero(np.bincount(seg_map.ravel()))
+    classes = classes[classes != ignore_index]
+    h, w = seg_map.shape[:2]
+    integrals = np.zeros((len(classes), h + 1, w + 1), dtype=np.int32)
+    for i, label in enumerate(classes):
+        np.cumsum(seg_map == label, axis=0, dtype=np.int32,
+                  out=integrals[i, 1:, 1:])
+        np.cumsum(integrals[i, 1:, 1:], axis=1, out=integrals[i, 1:, 1:])
+    return classes, integrals
+
+
+class IntegralCache:
+    """Per-worker LRU cache of :func:`class_integrals`, keyed by
+    ``seg_map_path``, so a label map's tables are built once and reused by
+    every later epoch that draws the same sample.
+
+    Each entry is validated against the content of the label map (shape,
+    dtype, ``ignore_index`` and a CRC32 of its bytes, far cheaper than the
+    tables), so a transform editing the map in place, e.g.
+    :class:`MultiImgRandomCutOut` with ``seg_fill_in``, gets fresh tables.
+    Every dataloader worker holds its own copy of the transform and thus of
+    the cache.
+
+    Args:
+        max_mb (float): Memory budget of the cached tables in MB, least
+            recently used entries are evicted beyond it. 0 keeps the tables
+            only within the ``results`` of a single call.
+    """
+
+    def __init__(self, max_mb: float):
+        self.max_bytes = int(max_mb * 2**20)
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def __call__(self, results: dict,
+                 ignore_index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """:func:`class_integrals` of ``results['gt_seg_map']``."""
+        seg_map = results['gt_seg_map']
+        key = (seg_map.shape, seg_map.dtype.str, ignore_index,
+               zlib.crc32(np.ascontiguousarray(seg_map)))
+        # transforms cropping the same label map within one call
+        cached = results.get('gt_seg_map_integrals', None)
+        if cached is not None and cached[0] == key:
+            return cached[1:]
+
+        path = results.get('seg_map_path', None)
+        path = str(path) if path is not None and self.max_bytes > 0 else None
+        entry = self._entries.get(path) if path is not None else None
+        if entry is not None and entry[0] == key:
+            self._entries.move_to_end(path)
+        else:
+            entry = (key, *class_integrals(seg_map, ignore_index))
+            if path is not None:
+                self._store(path, entry)
+        results['gt_seg_map_integrals'] = entry
+        return entry[1:]
+
+    def _store(self, path: str, entry: tuple) -> None:
+        old = self._entries.pop(path, None)
+        if old is not None:
+            self._bytes -= old[2].nbytes
+        if entry[2].nbytes > self.max_bytes:
+            return
+        self._entries[path] = entry
+        self._bytes += entry[2].nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted[2].nbytes
+
+
+def sample_crop_offset(classes: np.ndarray, integrals: np.ndarray,
+                       crop_size: Tuple[int, int], cat_max_ratio: float,
+                       positive: bool) -> Optional[Tuple[int, int]]:
+    """Draw the top left corner of a window satisfying ``cat_max_ratio`` and,
+    if ``positive``, containing change, from :func:`class_integrals`.
+
+    Starting from all windows, each constraint is applied only if some window
+    still satisfies it together with the ones applied before, so the draw is
+    uniform among all windows when none can be met. Returns None only when
+    the label map has a single class.
+    """
+    if len(classes) < 2:
+        # a single class, no window can satisfy cat_max_ratio or
+        # contain change next to the background
+        return None
+    h, w = integrals.shape[1] - 1, integrals.shape[2] - 1
+    crop_h, crop_w = min(crop_size[0], h), min(crop_size[1], w)
+    num_h, num_w = h - crop_h + 1, w - crop_w + 1
+    cnt = integrals[:, crop_h:, crop_w:] \
+        - integrals[:, :num_h, crop_w:] \
+        - integrals[:, crop_h:, :num_w] \
+        + integrals[:, :num_h, :num_w]
+    masks = []
+    if cat_max_ratio < 1.:
+        masks.append(((cnt > 0).sum(0) > 1)
+                     & (cnt.max(0) < cat_max_ratio * cnt.sum(0)))
+    if positive:
+        masks.append((cnt[classes != 0] > 0).any(0))
+    valid = np.ones((num_h, num_w), dtype=bool)
+    for mask in masks:
+        if (valid & mask).any():
+            valid = valid & mask
+    return divmod(int(np.random.choice(np.flatnonzero(valid))), num_w)
+
+
 @TRANSFORMS.register_module()
 class MultiImgRandomCrop(BaseTransform):
     """Random crop the image & seg.
@@ -227,14 +349,25 @@ class MultiImgRandomCrop(BaseTransform):
             with the format of (h, w). If set to an integer, then cropping
             width and height are equal to this integer.
         cat_max_ratio (float): The maximum ratio that single category could
-            occupy.
+            occupy. The window is drawn uniformly among the ones satisfying
+            it, found at once from per-class summed-area tables of the label
+            map, or uniformly among all windows when none does.
         ignore_index (int): The label index to be ignored. Default: 255
+        positive_ratio (float): Probability of drawing the window among the
+            ones containing change, i.e. any label other than 0 and
+            ``ignore_index``, when the label map has some. Pairs with
+            :class:`ChangeAwareSampler`. Default: 0.
+        integral_cache_mb (float): Memory budget in MB of the per-worker
+            cache of summed-area tables, see :class:`IntegralCache`.
+            Default: 1024.
     """
 
     def __init__(self,
                  crop_size: Union[int, Tuple[int, int]],
                  cat_max_ratio: float = 1.,
-                 ignore_index: int = 255):
+                 ignore_index: int = 255,
+                 positive_ratio: float = 0.,
+                 integral_cache_mb: float = 1024):
         super().__init__()
         assert isinstance(crop_size, int) or (
             isinstance(crop_size, tuple) and len(crop_size) == 2
@@ -247,6 +380,9 @@ class MultiImgRandomCrop(BaseTransform):
         self.crop_size = crop_size
         self.cat_max_ratio = cat_max_ratio
         self.ignore_index = ignore_index
+        assert 0 <= positive_ratio <= 1
+        self.positive_ratio = positive_ratio
+        self.integral_cache = IntegralCache(integral_cache_mb)
 
     @cache_randomness
     def crop_bbox(self, results: dict) -> tuple:
@@ -279,19 +415,39 @@ class MultiImgRandomCrop(BaseTransform):
             return crop_y1, crop_y2, crop_x1, crop_x2
 
         img = results['img'][0]
-        crop_bbox = generate_crop_bbox(img)
-        if self.cat_max_ratio < 1.:
-            # Repeat 10 times
-            for _ in range(10):
-                seg_temp = self.crop(results['gt_seg_map'], crop_bbox)
-                labels, cnt = np.unique(seg_temp, return_counts=True)
-                cnt = cnt[labels != self.ignore_index]
-                if len(cnt) > 1 and np.max(cnt) / np.sum(
-                        cnt) < self.cat_max_ratio:
-                    break
-                crop_bbox = generate_crop_bbox(img)
-
-        return crop_bbox
+        positive = self.positive_ratio > 0 and \
+            np.random.rand() < self.positive_ratio
+        if self.cat_max_ratio >= 1. and not positive:
+            return generate_crop_bbox(img)
+
+        # class counts of every candidate window from the summed-area tables
+        offset = sample_crop_offset(*self.class_integrals(results),
+                                    self.crop_size, self.cat_max_ratio,
+                                    positive)
+        if offset is None:
+            return generate_crop_bbox(img)
+
+        offset_h, offset_w = offset
+        crop_y1, crop_y2 = offset_h, offset_h + self.crop_size[0]
+        crop_x1, crop_x2 = offset_w, offset_w + self.crop_size[1]
+        return crop_y1, crop_y2, crop_x1, crop_x2
+
+    def class_integrals(self, results: dict) -> Tuple[np.ndarray, np.ndarray]:
+        """Summed-area tables of every class present in ``gt_seg_map``.
+
+        They are cached per ``seg_map_path`` for as long as the content of
+        ``gt_seg_map`` does not change, see :class:`IntegralCache`.
+
+        Args:
+            results (dict): Result dict holding ``gt_seg_map``.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The classes present,
+                ``ignore_index`` excluded, and a ``(num_classes, H + 1,
+                W + 1)`` int32 array, the pixel count of each class above and
+                left of every position.
+        """
+        return self.integral_cache(results, self.ignore_index)
 
     def crop(self, img: np.ndarray, crop_bbox: tuple) -> np.ndarray:
         """Crop from ``img``
@@ -435,6 +591,280 @@ class MultiImgRandomRotate(BaseTransform):
         return repr_str
 
 
+def rotation_matrix(img_shape: tuple,
+                    degree: float,
+                    center: Optional[tuple] = None,
+                    auto_bound: bool = False) -> Tuple[np.ndarray, tuple]:
+    """Get the affine matrix of ``mmcv.imrotate`` and its output size.
+
+    Args:
+        img_shape (tuple): Shape of the image to rotate.
+        degree (float): Rotation angle in degrees, clockwise.
+        center (tuple[float], optional): Center (w, h) of the rotation,
+            the image center when None. Default: None.
+        auto_bound (bool): Whether to enlarge the output to cover the whole
+            rotated image. Default: False.
+
+    Returns:
+        tuple[np.ndarray, tuple[int, int]]: The 2x3 matrix and the (w, h) of
+            the rotated image.
+    """
+    h, w = img_shape[:2]
+    if center is None:
+        center = ((w - 1) * 0.5, (h - 1) * 0.5)
+    matrix = cv2.getRotationMatrix2D(center, -degree, 1.0)
+    if auto_bound:
+        cos = np.abs(matrix[0, 0])
+        sin = np.abs(matrix[0, 1])
+        new_w = w * cos + h * sin
+        new_h = w * sin + h * cos
+        matrix[0, 2] += (new_w - w) * 0.5
+        matrix[1, 2] += (new_h - h) * 0.5
+        w = int(np.round(new_w))
+        h = int(np.round(new_h))
+    return matrix, (w, h)
+
+
+@TRANSFORMS.register_module()
+class MultiImgRandomRotateCrop(BaseTransform):
+    """Randomly rotate then crop the image & seg, rendering only the crop.
+
+    Equivalent to :class:`MultiImgRandomRotate` followed by
+    :class:`MultiImgRandomCrop`, with the same arguments. The crop window is
+    sampled first in the frame of the rotated image, then the rotation and
+    the crop offset are folded into one affine matrix so every image is
+    warped with a single ``cv2.warpAffine`` straight to the crop size. A
+    rotated 1024x1024 sample cropped to 256x256 thus warps 16 times fewer
+    pixels. With ``cat_max_ratio < 1`` or ``positive_ratio > 0`` the window
+    is drawn from per-class summed-area tables, see
+    :class:`MultiImgRandomCrop`: those of the label map itself (cached)
+    without rotation, or, when rotating, of the whole rotated label map,
+    rendered once with nearest interpolation.
+
+    Required Keys:
+
+    - img
+    - gt_seg_map
+
+    Modified Keys:
+
+    - img
+    - img_shape
+    - gt_seg_map
+
+    Args:
+        crop_size (Union[int, Tuple[int, int]]):  Expected size after cropping
+            with the format of (h, w). If set to an integer, then cropping
+            width and height are equal to this integer.
+        prob (float): The rotation probability.
+        degree (float, tuple[float]): Range of degrees to select from. If
+            degree is a number instead of tuple like (min, max),
+            the range of degree will be (``-degree``, ``+degree``)
+        cat_max_ratio (float): The maximum ratio that single category could
+            occupy.
+        ignore_index (int): The label index to be ignored. Default: 255
+        pad_val (float, optional): Padding value of image. Default: 0.
+        seg_pad_val (float, optional): Padding value of segmentation map.
+            Default: 255.
+        center (tuple[float], optional): Center point (w, h) of the rotation in
+            the source image. If not specified, the center of the image will be
+            used. Default: None.
+        auto_bound (bool): Whether to adjust the image size to cover the whole
+            rotated image before cropping. Default: False
+        positive_ratio (float): Probability of drawing the window among the
+            ones containing change, i.e. any label other than 0 and
+            ``ignore_index``. Like ``cat_max_ratio``, it is resolved at once
+            from per-class summed-area tables of the (rotated) label map, as
+            in :class:`MultiImgRandomCrop`. Default: 0.
+        integral_cache_mb (float): Memory budget in MB of the per-worker
+            cache of summed-area tables of the unrotated label maps, see
+            :class:`IntegralCache`. Default: 1024.
+    """
+
+    def __init__(self,
+                 crop_size: Union[int, Tuple[int, int]],
+                 prob: float,
+                 degree: Union[float, Tuple[float, float]],
+                 cat_max_ratio: float = 1.,
+                 ignore_index: int = 255,
+                 pad_val: float = 0,
+                 seg_pad_val: float = 255,
+                 center: Optional[tuple] = None,
+                 auto_bound: bool = False,
+                 positive_ratio: float = 0.,
+                 integral_cache_mb: float = 1024):
+        super().__init__()
+        assert isinstance(crop_size, int) or (
+            isinstance(crop_size, tuple) and len(crop_size) == 2
+        ), 'The expected crop_size is an integer, or a tuple containing two '
+        'intergers'
+        if isinstance(crop_size, int):
+            crop_size = (crop_size, crop_size)
+        assert crop_size[0] > 0 and crop_size[1] > 0
+        self.crop_size = crop_size
+        self.cat_max_ratio = cat_max_ratio
+        self.ignore_index = ignore_index
+
+        assert prob >= 0 and prob <= 1
+        self.prob = prob
+        if isinstance(degree, (float, int)):
+            assert degree > 0, f'degree {degree} should be positive'
+            self.degree = (-degree, degree)
+        else:
+            self.degree = degree
+        assert len(self.degree) == 2, f'degree {self.degree} should be a ' \
+                                      f'tuple of (min, max)'
+        assert not (auto_bound and center is not None), \
+            '`auto_bound` conflicts with `center`'
+        self.pad_val = pad_val
+        self.seg_pad_val = seg_pad_val
+        self.center = center
+        self.auto_bound = auto_bound
+        assert 0 <= positive_ratio <= 1
+        self.positive_ratio = positive_ratio
+        self.integral_cache = IntegralCache(integral_cache_mb)
+
+    @cache_randomness
+    def generate_degree(self):
+        return np.random.rand() < self.prob, np.random.uniform(
+            min(*self.degree), max(*self.degree))
+
+    def render(self,
+               img: np.ndarray,
+               matrix: Optional[np.ndarray],
+               crop_bbox: tuple,
+               interpolation: str = 'bilinear',
+               border_value: float = 0) -> np.ndarray:
+        """Render the ``crop_bbox`` window of ``img`` rotated by ``matrix``.
+
+        Args:
+            img (np.ndarray): The source image.
+            matrix (np.ndarray, optional): Rotation matrix, None for a plain
+                crop.
+            crop_bbox (tuple): Window in the rotated image.
+            interpolation (str): Interpolation method. Default: 'bilinear'.
+            border_value (float): Value of the pixels outside ``img``.
+                Default: 0.
+
+        Returns:
+            np.ndarray: The cropped image.
+        """
+        crop_y1, crop_y2, crop_x1, crop_x2 = crop_bbox
+        if matrix is None:
+            return img[crop_y1:crop_y2, crop_x1:crop_x2, ...]
+        window = matrix.copy()
+        window[0, 2] -= crop_x1
+        window[1, 2] -= crop_y1
+        out = cv2.warpAffine(
+            img,
+            window, (crop_x2 - crop_x1, crop_y2 - crop_y1),
+            flags=cv2_interp_codes[interpolation],
+            borderMode=cv2.BORDER_CONSTANT,
+            borderValue=border_value)
+        if img.ndim == 3 and out.ndim == 2:
+            out = out[..., None]
+        return out
+
+    @cache_randomness
+    def crop_bbox(self, results: dict, matrix: Optional[np.ndarray],
+                  rotated_shape: tuple) -> tuple:
+        """Get a crop bounding box in the rotated image.
+
+        Args:
+            results (dict): Result dict from loading pipeline.
+            matrix (np.ndarray, optional): Rotation matrix, None when not
+                rotating.
+            rotated_shape (tuple): (h, w) of the rotated image.
+
+        Returns:
+            tuple: Coordinates of the cropped image.
+        """
+
+        def generate_crop_bbox() -> tuple:
+            h, w = rotated_shape
+            margin_h = max(h - self.crop_size[0], 0)
+            margin_w = max(w - self.crop_size[1], 0)
+            offset_h = np.random.randint(0, margin_h + 1)
+            offset_w = np.random.randint(0, margin_w + 1)
+            # a window larger than the image is clipped, like slicing does
+            crop_y1, crop_y2 = offset_h, min(offset_h + self.crop_size[0], h)
+            crop_x1, crop_x2 = offset_w, min(offset_w + self.crop_size[1], w)
+            return crop_y1, crop_y2, crop_x1, crop_x2
+
+        positive = self.positive_ratio > 0 and \
+            np.random.rand() < self.positive_ratio
+        if self.cat_max_ratio >= 1. and not positive:
+            return generate_crop_bbox()
+
+        # class counts of every candidate window from the summed-area tables,
+        # of the label map itself (cached) or of its rotation
+        if matrix is None:
+            integrals = self.integral_cache(results, self.ignore_index)
+        else:
+            h, w = rotated_shape
+            rotated = self.render(results['gt_seg_map'], matrix, (0, h, 0, w),
+                                  'nearest', self.seg_pad_val)
+            integrals = class_integrals(rotated, self.ignore_index)
+        offset = sample_crop_offset(*integrals, self.crop_size,
+                                    self.cat_max_ratio, positive)
+        if offset is None:
+            return generate_crop_bbox()
+
+        h, w = rotated_shape
+        offset_h, offset_w = offset
+        # a window larger than the image is clipped, like slicing does
+        crop_y1, crop_y2 = offset_h, min(offset_h + self.crop_size[0], h)
+        crop_x1, crop_x2 = offset_w, min(offset_w + self.crop_size[1], w)
+        return crop_y1, crop_y2, crop_x1, crop_x2
+
+    def transform(self, results: dict) -> dict:
+        """Transform function to randomly rotate and crop images, semantic
+        segmentation maps.
+
+        Args:
+            results (dict): Result dict from loading pipeline.
+
+        Returns:
+            dict: Rotated and cropped results, 'img_shape' key in result dict
+                is updated according to crop size.
+        """
+        rotate, degree = self.generate_degree()
+        img_shape = results['img'][0].shape
+        if rotate:
+            matrix, (w, h) = rotation_matrix(img_shape, degree, self.center,
+                                             self.auto_bound)
+        else:
+            matrix, (h, w) = None, img_shape[:2]
+        crop_bbox = self.crop_bbox(results, matrix, (h, w))
+
+        imgs = [
+            self.render(img, matrix, crop_bbox, 'bilinear', self.pad_val)
+            for img in results['img']
+        ]
+        for key in results.get('seg_fields', []):
+            results[key] = self.render(results[key], matrix, crop_bbox,
+                                       'nearest', self.seg_pad_val)
+
+        results['img'] = imgs
+        results['img_shape'] = imgs[0].shape
+        return results
+
+    def __repr__(self):
+        cache_mb = self.integral_cache.max_bytes / 2**20
+        repr_str = self.__class__.__name__
+        repr_str += f'(crop_size={self.crop_size}, ' \
+                    f'prob={self.prob}, ' \
+                    f'degree={self.degree}, ' \
+                    f'cat_max_ratio={self.cat_max_ratio}, ' \
+                    f'pad_val={self.pad_val}, ' \
+                    f'seg_pad_val={self.seg_pad_val}, ' \
+                    f'center={self.center}, ' \
+                    f'auto_bound={self.auto_bound}, ' \
+                    f'positive_ratio={self.positive_ratio}, ' \
+                    f'integral_cache_mb={cache_mb})'
+        return repr_str
+
+
 @TRANSFORMS.register_module()
 class MultiImgRGB2Gray(BaseTransform):
     """Convert RGB image to grayscale image.
@@ -823,6 +1253,11 @@ class MultiImgRandomCutOut(BaseTransform):
         cutout, n_holes, x1_lst, y1_lst, index_lst = self.generate_patches(
             results)
         if cutout:
+            # holes are filled in place, copy read-only decoded cache views
+            results['img'] = [
+                img if img.flags.writeable else img.copy()
+                for img in results['img']
+            ]
             h, w, c = results['img'][0].shape
             for i in range(n_holes):
                 x1 = x1_lst[i]
@@ -1,4 +1,4 @@
 # Copyright (c) Open-CD. All rights reserved.
-from .hooks import CDVisualizationHook
+from .hooks import CDVisualizationHook, PredictionWriterHook
 
-__all__ = ['CDVisualizationHook']
+__all__ = ['CDVisualizationHook', 'PredictionWriterHook']
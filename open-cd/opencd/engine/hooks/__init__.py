@@ -1,4 +1,5 @@
 # Copyright (c) Open-CD. All rights reserved.
+from .prediction_writer_hook import PredictionWriterHook
 from .visualization_hook import CDVisualizationHook
 
-__all__ = ['CDVisualizationHook']
+__all__ = ['CDVisualizationHook', 'PredictionWriterHook']
@@ -0,0 +1,165 @@
+# Copyright (c) Open-CD. All rights reserved.
+import os
+import os.path as osp
+from typing import Optional, Sequence
+
+import cv2
+import numpy as np
+from mmengine.hooks import Hook
+from mmengine.runner import Runner
+
+from mmseg.structures import SegDataSample
+from opencd.registry import HOOKS
+from opencd.utils import get_async_writer
+
+try:
+    import rasterio
+    from rasterio.env import GDALVersion
+    from rasterio.errors import RasterioIOError
+except ImportError:
+    rasterio = None
+
+
+@HOOKS.register_module()
+class PredictionWriterHook(Hook):
+    """Write raw predictions to disk during testing.
+
+    Unlike :class:`CDVisualizationHook`, no visualizer is involved and the
+    source images are never read: ``pred_sem_seg`` is taken straight from
+    the data sample, converted to uint8 and encoded by the shared
+    :class:`AsyncWriter`, so encoding overlaps with the next forward pass.
+    For semantic change detection, ``pred_sem_seg_from`` and
+    ``pred_sem_seg_to`` are written as well, under ``binary``, ``from`` and
+    ``to`` sub-directories.
+
+    With ``file_format='tif'`` the predictions are written as Cloud Optimized
+    GeoTIFFs (tiled, lossless deflate, internal overviews), georeferenced
+    with the CRS and transform of the first source image when it is a
+    georeferenced raster of the same size. GIS tools and viewers can then
+    read windows or overview levels without decoding the whole mask.
+
+    Args:
+        out_dir (str): Directory where the predictions are written.
+        file_format (str): ``'png'`` for single channel uint8 images,
+            ``'tif'`` for Cloud Optimized GeoTIFFs (requires rasterio) or
+            ``'npz'`` for compressed numpy arrays. Defaults to 'png'.
+        filename_tmpl (str, optional): Template of the relative output path
+            without extension, formatted with the sample meta information
+            plus ``img_name`` (basename of the first image without suffix).
+            Defaults to None, which means ``'{img_name}'``.
+        scale (int): Factor applied to the predicted class indices before
+            saving, e.g. 255 to write binary masks as black/white PNGs.
+            Defaults to 1.
+    """
+
+    priority = 'LOW'
+
+    def __init__(self,
+                 out_dir: str,
+                 file_format: str = 'png',
+                 filename_tmpl: Optional[str] = None,
+                 scale: int = 1):
+        assert file_format in ('png', 'tif', 'npz'), \
+            '`file_format` should be "png", "tif" or "npz", ' \
+            f'but got {file_format}'
+        if file_format == 'tif' and rasterio is None:
+            raise ImportError('Please run "pip install rasterio" to write '
+                              'GeoTIFF predictions.')
+        self.out_dir = out_dir
+        self.file_format = file_format
+        self.filename_tmpl = filename_tmpl or '{img_name}'
+        self.scale = scale
+
+    def get_filename(self, data_sample: SegDataSample) -> str:
+        """Relative output path of a sample, without extension."""
+        metainfo = data_sample.metainfo
+        img_name = osp.splitext(osp.basename(
+            self.get_src_path(data_sample)))[0]
+        return self.filename_tmpl.format(img_name=img_name, **metainfo)
+
+    def get_src_path(self, data_sample: SegDataSample) -> str:
+        """Path of the first source image of a sample."""
+        img_path = data_sample.metainfo['img_path']
+        if isinstance(img_path, (list, tuple)):
+            img_path = img_path[0]
+        return img_path
+
+    @staticmethod
+    def _write_tif(pred: np.ndarray, out_file: str, src_file: str) -> None:
+        """Write ``pred`` as a COG, georeferenced like ``src_file``."""
+        height, width = pred.shape
+        crs = transform = None
+        if src_file is not None:
+            try:
+                with rasterio.open(src_file) as src:
+                    if (src.height, src.width) == (height, width):
+                        crs, transform = src.crs, src.transform
+            except RasterioIOError:
+                pass  # not a raster GDAL can open, e.g. a band archive
+        profile = dict(
+            width=width,
+            height=height,
+            count=1,
+            dtype='uint8',
+            crs=crs,
+            transform=transform)
+        if GDALVersion.runtime().at_least('3.1'):
+            # the COG driver is copy-only, rasterio buffers the mask in memory
+            profile.update(
+                driver='COG',
+                compress='deflate',
+                blocksize=256,
+                overview_resampling='nearest')
+        else:
+            profile.update(
+                driver='GTiff',
+                compress='deflate',
+                tiled=True,
+                blockxsize=256,
+                blockysize=256)
+        with rasterio.open(out_file, 'w', **profile) as dst:
+            dst.write(pred[None])
+
+    def _write(self,
+               pred: np.ndarray,
+               out_file: str,
+               src_file: Optional[str] = None) -> None:
+        os.makedirs(osp.dirname(out_file) or '.', exist_ok=True)
+        if self.file_format == 'png':
+            if not cv2.imwrite(out_file, pred):
+                raise IOError(f'Failed to write the prediction to {out_file}')
+        elif self.file_format == 'tif':
+            self._write_tif(pred, out_file, src_file)
+        else:
+            np.savez_compressed(out_file, pred=pred)
+
+    def after_test_iter(self,
+                        runner: Runner,
+                        batch_idx: int,
+                        data_batch: dict = None,
+                        outputs: Sequence[SegDataSample] = None) -> None:
+        for output in outputs:
+            filename = self.get_filename(output)
+            src_file = self.get_src_path(output)
+            if 'pred_sem_seg_from' in output and 'pred_sem_seg_to' in output:
+                preds = {
+                    'binary': output.pred_sem_seg,
+                    'from': output.pred_sem_seg_from,
+                    'to': output.pred_sem_seg_to
+                }
+            else:
+                preds = {'': output.pred_sem_seg}
+
+            for sub_dir, pred in preds.items():
+                pred = pred.data.squeeze(0).cpu().numpy()
+                if self.scale != 1:
+                    pred = pred * self.scale
+                pred = pred.clip(0, 255).astype(np.uint8)
+                out_file = osp.join(self.out_dir, sub_dir,
+                                    f'{filename}.{self.file_format}')
+                get_async_writer().submit(self._write, pred, out_file,
+                                          src_file)
+
+    def after_test(self, runner: Runner) -> None:
+        """Wait until every prediction has been written."""
+        get_async_writer().flush()
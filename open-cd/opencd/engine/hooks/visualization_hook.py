@@ -11,13 +11,16 @@ from mmengine.runner import Runner
 from mmseg.engine import SegVisualizationHook
 from mmseg.structures import SegDataSample
 from opencd.registry import HOOKS
+from opencd.utils import get_async_writer
 from opencd.visualization import CDLocalVisualizer
 
 
 @HOOKS.register_module()
 class CDVisualizationHook(SegVisualizationHook):
     """Change Detection Visualization Hook. Used to visualize validation and
-    testing process prediction results. 
+    testing process prediction results. Images are saved in the background
+    by the shared :class:`AsyncWriter`, which is flushed at the end of
+    validation and testing.
 
     Args:
         img_shape (tuple): if img_shape is given and `draw_on_from_to_img` is
@@ -112,3 +115,11 @@ class CDVisualizationHook(SegVisualizationHook):
                     wait_time=self.wait_time,
                     step=runner.iter,
                     draw_gt=False)
+
+    def after_val(self, runner: Runner) -> None:
+        """Wait until every visualization has been written."""
+        get_async_writer().flush()
+
+    def after_test(self, runner: Runner) -> None:
+        """Wait until every visualization has been written."""
+        get_async_writer().flush()
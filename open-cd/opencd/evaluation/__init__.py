@@ -1,4 +1,4 @@
 # Copyright (c) Open-CD. All rights reserved.
-from .metrics import SCDMetric
+from .metrics import SCDMetric, StreamingCDMetric
 
-__all__ = ['SCDMetric']
+__all__ = ['SCDMetric', 'StreamingCDMetric']
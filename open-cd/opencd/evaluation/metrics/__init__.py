@@ -1,4 +1,5 @@
 # Copyright (c) Open-CD. All rights reserved.
 from .scd_metric import SCDMetric
+from .streaming_cd_metric import StreamingCDMetric
 
-__all__ = ['SCDMetric']
+__all__ = ['SCDMetric', 'StreamingCDMetric']
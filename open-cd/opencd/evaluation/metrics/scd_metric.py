@@ -1,53 +1,70 @@
 # Copyright (c) Open-CD. All rights reserved.
-import copy
-import logging
 from collections import OrderedDict
-from typing import Any, Dict, List, Optional, Sequence, Union
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
 import torch
-from mmengine.dist import (broadcast_object_list, collect_results,
-                           is_main_process)
-from mmengine.evaluator.metric import _to_cpu
+from mmengine.dist import all_reduce, collect_results, is_main_process
+from mmengine.fileio import dump
 from mmengine.logging import MMLogger, print_log
 from prettytable import PrettyTable
 
 from mmseg.evaluation import IoUMetric
 from opencd.registry import METRICS
+from .streaming_cd_metric import confusion_matrix
 
 
 @METRICS.register_module()
 class SCDMetric(IoUMetric):
     """Change Detection evaluation metric.
 
+    A binary and a semantic confusion matrix are accumulated on the
+    prediction device, the semantic one over both ``from`` and ``to`` maps.
+    Only the two matrices are all-reduced and every metric, SeK included, is
+    computed from them in closed form, so memory does not depend on the
+    number of samples.
+
+    Per-sample statistics are optional: with ``per_image=True``,
+    :meth:`per_image_metrics` is called with the confusion matrices of each
+    sample and its results are gathered into ``self.per_image_results``
+    (and dumped to ``per_image_file`` if given). Override it to record
+    other statistics.
+
     Args:
         prefix (str, optional): The prefix that will be added in the metric
             names to disambiguate homonymous metrics of different evaluators.
             If prefix is not provided in the argument, self.default_prefix
             will be used instead. Defaults to 'binary'.
-        semantic_prefix (str, optional): The prefix that will be added in the 
-            metric names to disambiguate homonymous metrics of different 
+        semantic_prefix (str, optional): The prefix that will be added in the
+            metric names to disambiguate homonymous metrics of different
             evaluators. Defaults to 'semantic'.
-        cal_sek bool: Whether to calculate the separated kappa (SeK) 
+        cal_sek bool: Whether to calculate the separated kappa (SeK)
             coefficient. Defaults: False.
+        per_image (bool): Whether to compute per-sample statistics.
+            Defaults to False.
+        per_image_file (str, optional): Path of a json/yaml/pkl file the
+            per-sample statistics are dumped to. Defaults to None.
     """
 
     def __init__(self,
                  prefix: Optional[str] = 'binary',
                  semantic_prefix: Optional[str] = 'semantic',
                  cal_sek: bool = False,
+                 per_image: bool = False,
+                 per_image_file: Optional[str] = None,
                  **kwargs) -> None:
         super().__init__(prefix=prefix, **kwargs)
 
-        self.semantic_results: List[Any] = []
         self.semantic_prefix = semantic_prefix
         self.cal_sek = cal_sek
+        self.per_image = per_image or per_image_file is not None
+        self.per_image_file = per_image_file
+        self.binary_hist: Optional[torch.Tensor] = None
+        self.semantic_hist: Optional[torch.Tensor] = None
+        self.per_image_results: List[dict] = []
 
     def process(self, data_batch: dict, data_samples: Sequence[dict]) -> None:
-        """Process one batch of data and data_samples.
-
-        The processed results should be stored in ``self.results``, which will
-        be used to compute the metrics when all batches have been processed.
+        """Accumulate the confusion matrices of one batch.
 
         Args:
             data_batch (dict): A batch of data from the dataloader.
@@ -63,37 +80,79 @@ class SCDMetric(IoUMetric):
             pred_label_to = data_sample['pred_sem_seg_to']['data'].squeeze()
             label_to = data_sample['gt_sem_seg_to']['data'].squeeze().to(pred_label_to)
 
-            self.results.append(
-                self.intersect_and_union(pred_label, label, num_classes,
-                                         self.ignore_index))
+            binary_hist = confusion_matrix(pred_label, label, num_classes,
+                                           self.ignore_index)
             # for semantic pred
-            self.semantic_results.append(
-                self.intersect_and_union(pred_label_from, label_from, num_semantic_classes,
-                                         self.ignore_index))
-            self.semantic_results.append(
-                self.intersect_and_union(pred_label_to, label_to, num_semantic_classes,
-                                         self.ignore_index))
-
-    def get_sek(self, results: list) -> np.array:
-        """calculate the Sek value.
+            semantic_hist = confusion_matrix(
+                pred_label_from, label_from, num_semantic_classes,
+                self.ignore_index) + confusion_matrix(
+                    pred_label_to, label_to, num_semantic_classes,
+                    self.ignore_index)
+
+            if self.binary_hist is None:
+                self.binary_hist = binary_hist
+                self.semantic_hist = semantic_hist
+            else:
+                self.binary_hist += binary_hist
+                self.semantic_hist += semantic_hist
+
+            if self.per_image:
+                result = self.per_image_metrics(binary_hist, semantic_hist)
+                result['img_path'] = data_sample['img_path']
+                self.results.append(result)
+
+    def per_image_metrics(self, binary_hist: torch.Tensor,
+                          semantic_hist: torch.Tensor) -> dict:
+        """Statistics of a single sample, only called with ``per_image``.
 
         Args:
-            pre_eval_results (list[tuple[torch.Tensor]]): per image eval results
-            for computing evaluation metric
+            binary_hist (torch.Tensor): Binary confusion matrix of the sample.
+            semantic_hist (torch.Tensor): Semantic confusion matrix of the
+                sample, ``from`` and ``to`` maps summed.
 
         Returns:
-            [torch.tensor]: The Sek value.
+            dict: Plain python values, defaults to the changed-class IoU,
+                the semantic mIoU and, with ``cal_sek``, the SeK.
         """
-        assert len(results) == 4
+        intersect, union, _, _ = self.hist_to_areas(binary_hist)
+        result = dict(change_iou=(intersect[-1] / union[-1]).item())
+        intersect, union, _, _ = self.hist_to_areas(semantic_hist)
+        result['semantic_miou'] = float(np.nanmean((intersect / union).numpy()))
+        if self.cal_sek:
+            result['sek'] = float(self.get_sek(semantic_hist))
+        return result
 
-        hist_00 = sum(results[0])[0]
+    @staticmethod
+    def hist_to_areas(hist: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        """Convert a confusion matrix to the areas used by
+        ``total_area_to_metrics``.
+
+        Returns:
+            tuple[torch.Tensor]: The intersection, union, prediction and
+                ground truth areas of each class.
+        """
+        hist = hist.double().cpu()
+        area_intersect = hist.diag()
+        area_pred_label = hist.sum(0)
+        area_label = hist.sum(1)
+        area_union = area_pred_label + area_label - area_intersect
+        return area_intersect, area_union, area_pred_label, area_label
+
+    def get_sek(self, hist: torch.Tensor) -> np.array:
+        """calculate the Sek value.
 
-        hist_00_list = torch.zeros(len(results[0][0]))
-        hist_00_list[0] = hist_00
+        Args:
+            hist (torch.Tensor): Semantic confusion matrix, rows are ground
+                truth classes and columns predicted classes.
 
-        total_area_intersect = sum(results[0]) - hist_00_list
-        total_area_pred_label = sum(results[2]) - hist_00_list
-        total_area_label = sum(results[3]) - hist_00_list
+        Returns:
+            [torch.tensor]: The Sek value.
+        """
+        # true negatives (unchanged predicted as unchanged) are left out
+        hist = hist.double().cpu().clone()
+        hist[0, 0] = 0
+        total_area_intersect, _, total_area_pred_label, total_area_label = \
+            self.hist_to_areas(hist)
 
         # foreground
         fg_intersect_sum = total_area_label[1:].sum(
@@ -110,13 +169,14 @@ class SCDMetric(IoUMetric):
         sek = (kappa0 * torch.exp(iou_fg)) / torch.e
 
         return sek.numpy() # consistent with other metrics.
-    
-    def compute_metrics(self, binary_results: list, semantic_results: list) -> Dict[str, float]:
-        """Compute the metrics from processed results.
+
+    def compute_metrics(self, binary_hist: torch.Tensor,
+                        semantic_hist: torch.Tensor) -> Dict[str, float]:
+        """Compute the metrics from the reduced confusion matrices.
 
         Args:
-            binary_results (list): The processed results of each batch.
-            semantic_results (list): The semantic results of each batch
+            binary_hist (torch.Tensor): Binary confusion matrix.
+            semantic_hist (torch.Tensor): Semantic confusion matrix.
 
         Returns:
             Dict[str, float]: The computed metrics. The keys are the names of
@@ -126,21 +186,10 @@ class SCDMetric(IoUMetric):
         """
         logger: MMLogger = MMLogger.get_current_instance()
 
-        # convert list of tuples to tuple of lists, e.g.
-        # [(A_1, B_1, C_1, D_1), ...,  (A_n, B_n, C_n, D_n)] to
-        # ([A_1, ..., A_n], ..., [D_1, ..., D_n])
-        binary_results = tuple(zip(*binary_results))
-        semantic_results = tuple(zip(*semantic_results))
-        assert len(binary_results) == 4 and len(semantic_results) == 4
-
         # for binary results
-        binary_total_area_intersect = sum(binary_results[0])
-        binary_total_area_union = sum(binary_results[1])
-        binary_total_area_pred_label = sum(binary_results[2])
-        binary_total_area_label = sum(binary_results[3])
         binary_ret_metrics = self.total_area_to_metrics(
-            binary_total_area_intersect, binary_total_area_union, binary_total_area_pred_label,
-            binary_total_area_label, self.metrics, self.nan_to_num, self.beta)
+            *self.hist_to_areas(binary_hist), self.metrics, self.nan_to_num,
+            self.beta)
 
         binary_class_names = self.dataset_meta['classes']
 
@@ -172,13 +221,9 @@ class SCDMetric(IoUMetric):
         print_log('\n' + binary_class_table_data.get_string(), logger=logger)
 
         # for semantic results
-        semantic_total_area_intersect = sum(semantic_results[0])
-        semantic_total_area_union = sum(semantic_results[1])
-        semantic_total_area_pred_label = sum(semantic_results[2])
-        semantic_total_area_label = sum(semantic_results[3])
         semantic_ret_metrics = self.total_area_to_metrics(
-            semantic_total_area_intersect, semantic_total_area_union, semantic_total_area_pred_label,
-            semantic_total_area_label, self.metrics, self.nan_to_num, self.beta)
+            *self.hist_to_areas(semantic_hist), self.metrics,
+            self.nan_to_num, self.beta)
 
         semantic_class_names = self.dataset_meta['semantic_classes']
 
@@ -189,11 +234,11 @@ class SCDMetric(IoUMetric):
         })
         # for semantic change detection
         if self.cal_sek:
-            sek = self.get_sek(semantic_results)
+            sek = self.get_sek(semantic_hist)
             semantic_ret_metrics_summary.update({'Sek': np.round(sek * 100, 2)})
             semantic_ret_metrics_summary.update({'SCD_Score': \
                 np.round(0.3 * binary_ret_metrics_summary['IoU'] + 0.7 * sek * 100, 2)})
-        
+
         semantic_metrics = dict()
         for key, val in semantic_ret_metrics_summary.items():
             if key in ['aAcc', 'Sek', 'SCD_Score']:
@@ -223,59 +268,48 @@ class SCDMetric(IoUMetric):
         all batches.
 
         Args:
-            size (int): Length of the entire validation dataset. When batch
-                size > 1, the dataloader may pad some data samples to make
-                sure all ranks have the same length of dataset slice. The
-                ``collect_results`` function will drop the padded data based on
-                this size.
+            size (int): Length of the entire validation dataset. Only used to
+                drop padded samples from the per-sample statistics.
 
         Returns:
             dict: Evaluation metrics dict on the val dataset. The keys are the
             names of the metrics, and the values are corresponding results.
         """
-        if len(self.results) == 0:
-            print_log(
-                f'{self.__class__.__name__} got empty `self.results`. Please '
-                'ensure that the processed results are properly added into '
-                '`self.results` in `process` method.',
-                logger='current',
-                level=logging.WARNING)
-        if len(self.semantic_results) == 0:
-            print_log(
-                f'{self.__class__.__name__} got empty `self.semantic_results`. '
-                'Please ensure that the processed results are properly added '
-                'into `self.semantic_results` in `process` method.',
-                logger='current',
-                level=logging.WARNING)
-
-        binary_results = collect_results(self.results, size, self.collect_device)
-        semantic_results = collect_results(self.semantic_results, \
-                                           size * 2, self.collect_device)
-
-        if is_main_process():
-            # cast all tensors in results list to cpu
-            binary_results = _to_cpu(binary_results)
-            semantic_results = _to_cpu(semantic_results)
-            _binary_metrics, _semantic_metrics = \
-                self.compute_metrics(binary_results, semantic_results)  # type: ignore
-            # Add prefix to metric names
-            if self.prefix:
-                _binary_metrics = {
-                    '/'.join((self.prefix, k)): v
-                    for k, v in _binary_metrics.items()
-                }
-                _semantic_metrics = {
-                    '/'.join((self.semantic_prefix, k)): v
-                    for k, v in _semantic_metrics.items()
-                }
-                _metrics = {**_binary_metrics, **_semantic_metrics}
-            metrics = [_metrics]
-        else:
-            metrics = [None]  # type: ignore
-
-        broadcast_object_list(metrics)
-
-        # reset the results list
+        num_classes = len(self.dataset_meta['classes'])
+        num_semantic_classes = len(self.dataset_meta['semantic_classes'])
+        binary_hist, semantic_hist = self.binary_hist, self.semantic_hist
+        if binary_hist is None:
+            binary_hist = torch.zeros(
+                num_classes, num_classes, dtype=torch.int64)
+            semantic_hist = torch.zeros(
+                num_semantic_classes, num_semantic_classes,
+                dtype=torch.int64)
+        # every rank has to join the reductions, even with nothing processed
+        all_reduce(binary_hist)
+        all_reduce(semantic_hist)
+
+        _binary_metrics, _semantic_metrics = \
+            self.compute_metrics(binary_hist, semantic_hist)
+        # Add prefix to metric names
+        if self.prefix:
+            _binary_metrics = {
+                '/'.join((self.prefix, k)): v
+                for k, v in _binary_metrics.items()
+            }
+            _semantic_metrics = {
+                '/'.join((self.semantic_prefix, k)): v
+                for k, v in _semantic_metrics.items()
+            }
+        metrics = {**_binary_metrics, **_semantic_metrics}
+
+        if self.per_image:
+            self.per_image_results = collect_results(
+                self.results, size, self.collect_device) or []
+            if self.per_image_file and is_main_process():
+                dump(self.per_image_results, self.per_image_file)
+
+        # reset the accumulated state
+        self.binary_hist = None
+        self.semantic_hist = None
         self.results.clear()
-        self.semantic_results.clear()
-        return metrics[0]
+        return metrics
@@ -0,0 +1,194 @@
+# Copyright (c) Open-CD. All rights reserved.
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+from mmengine.dist import all_reduce
+from mmengine.evaluator import BaseMetric
+from mmengine.logging import MMLogger, print_log
+from prettytable import PrettyTable
+
+from opencd.registry import METRICS
+
+
+def confusion_matrix(pred_label: torch.Tensor, label: torch.Tensor,
+                     num_classes: int, ignore_index: int) -> torch.Tensor:
+    """Confusion matrix of one prediction, computed on its device.
+
+    Args:
+        pred_label (torch.Tensor): Prediction segmentation map.
+        label (torch.Tensor): Ground truth segmentation map, same shape as
+            ``pred_label``.
+        num_classes (int): Number of categories.
+        ignore_index (int): Index that will be ignored in evaluation.
+
+    Returns:
+        torch.Tensor: ``(num_classes, num_classes)`` int64 matrix, rows are
+            ground truth classes and columns predicted classes.
+    """
+    mask = label != ignore_index
+    index = label[mask].long() * num_classes + pred_label[mask].long()
+    return torch.bincount(
+        index, minlength=num_classes**2).view(num_classes, num_classes)
+
+
+def confusion_matrix_to_metrics(hist: torch.Tensor,
+                                beta: int = 1) -> Dict[str, np.ndarray]:
+    """Calculate evaluation metrics from a confusion matrix.
+
+    Args:
+        hist (torch.Tensor): ``(num_classes, num_classes)`` confusion matrix,
+            rows are ground truth classes and columns predicted classes.
+        beta (int): Determines the weight of recall in the F-score.
+            Default: 1.
+
+    Returns:
+        Dict[str, np.ndarray]: ``aAcc`` and ``Kappa`` as scalars, ``IoU``,
+            ``Acc``, ``Precision``, ``Recall`` and ``Fscore`` per class.
+    """
+    hist = hist.double().cpu()
+    total = hist.sum()
+    intersect = hist.diag()
+    area_label = hist.sum(1)
+    area_pred = hist.sum(0)
+    union = area_label + area_pred - intersect
+
+    precision = intersect / area_pred
+    recall = intersect / area_label
+    po = intersect.sum() / total
+    pe = (area_label * area_pred).sum() / total**2
+
+    ret_metrics = OrderedDict()
+    ret_metrics['aAcc'] = po
+    ret_metrics['Kappa'] = (po - pe) / (1 - pe)
+    ret_metrics['IoU'] = intersect / union
+    ret_metrics['Acc'] = recall
+    ret_metrics['Precision'] = precision
+    ret_metrics['Recall'] = recall
+    ret_metrics['Fscore'] = (1 + beta**2) * (precision * recall) / (
+        (beta**2 * precision) + recall)
+    return {k: v.numpy() for k, v in ret_metrics.items()}
+
+
+@METRICS.register_module()
+class StreamingCDMetric(BaseMetric):
+    """Change detection metric over a running confusion matrix.
+
+    Unlike ``mmseg.IoUMetric``, which stores four area tensors per sample and
+    gathers them with ``collect_results``, a single ``num_classes x
+    num_classes`` confusion matrix is accumulated on the prediction device
+    with ``bincount`` and only that matrix is all-reduced at the end, so
+    memory does not grow with the test set.
+
+    Note:
+        In distributed runs, samples padded by the sampler to even out the
+        ranks are counted as well. Use ``DefaultSampler`` with
+        ``round_up=False`` when exact numbers are needed.
+
+    Args:
+        ignore_index (int): Index that will be ignored in evaluation.
+            Default: 255.
+        nan_to_num (int, optional): If specified, NaN values will be replaced
+            by the numbers defined by the user. Default: None.
+        beta (int): Determines the weight of recall in the F-score.
+            Default: 1.
+        collect_device (str): Kept for interface compatibility, the
+            confusion matrix is reduced on the communication device.
+            Defaults to 'cpu'.
+        prefix (str, optional): The prefix that will be added in the metric
+            names to disambiguate homonymous metrics of different evaluators.
+            If prefix is not provided in the argument, self.default_prefix
+            will be used instead. Defaults to None.
+    """
+
+    def __init__(self,
+                 ignore_index: int = 255,
+                 nan_to_num: Optional[int] = None,
+                 beta: int = 1,
+                 collect_device: str = 'cpu',
+                 prefix: Optional[str] = None,
+                 **kwargs) -> None:
+        super().__init__(collect_device=collect_device, prefix=prefix)
+        self.ignore_index = ignore_index
+        self.nan_to_num = nan_to_num
+        self.beta = beta
+        self.hist: Optional[torch.Tensor] = None
+
+    def process(self, data_batch: dict, data_samples: Sequence[dict]) -> None:
+        """Accumulate the confusion matrix of one batch.
+
+        Args:
+            data_batch (dict): A batch of data from the dataloader.
+            data_samples (Sequence[dict]): A batch of outputs from the model.
+        """
+        num_classes = len(self.dataset_meta['classes'])
+        for data_sample in data_samples:
+            pred_label = data_sample['pred_sem_seg']['data'].squeeze()
+            label = data_sample['gt_sem_seg']['data'].squeeze().to(pred_label)
+            hist = confusion_matrix(pred_label, label, num_classes,
+                                    self.ignore_index)
+            self.hist = hist if self.hist is None else self.hist + hist
+
+    def compute_metrics(self, results: List[torch.Tensor]) -> Dict[str, float]:
+        """Compute the metrics from the reduced confusion matrix.
+
+        Args:
+            results (list[torch.Tensor]): A list holding the confusion matrix
+                summed over all ranks.
+
+        Returns:
+            Dict[str, float]: The computed metrics. The keys are aAcc, Kappa,
+                mIoU, mAcc, mFscore, mPrecision and mRecall.
+        """
+        logger: MMLogger = MMLogger.get_current_instance()
+        ret_metrics = confusion_matrix_to_metrics(results[0], self.beta)
+        if self.nan_to_num is not None:
+            ret_metrics = OrderedDict({
+                metric: np.nan_to_num(value, nan=self.nan_to_num)
+                for metric, value in ret_metrics.items()
+            })
+
+        # summary table
+        metrics = dict()
+        for key, val in ret_metrics.items():
+            val = np.round(np.nanmean(val) * 100, 2)
+            metrics[key if key in ('aAcc', 'Kappa') else 'm' + key] = val
+
+        # each class table
+        class_table_data = PrettyTable()
+        class_table_data.add_column('Class', self.dataset_meta['classes'])
+        for key, val in ret_metrics.items():
+            if key not in ('aAcc', 'Kappa'):
+                class_table_data.add_column(key, np.round(val * 100, 2))
+        print_log('per class results:', logger)
+        print_log('\n' + class_table_data.get_string(), logger=logger)
+
+        return metrics
+
+    def evaluate(self, size: int) -> dict:
+        """Reduce the confusion matrix over all ranks and compute the metrics.
+
+        Args:
+            size (int): Length of the entire validation dataset. Unused, the
+                confusion matrix does not depend on the sample order.
+
+        Returns:
+            dict: Evaluation metrics dict on the val dataset. The keys are the
+            names of the metrics, and the values are corresponding results.
+        """
+        num_classes = len(self.dataset_meta['classes'])
+        hist = self.hist
+        if hist is None:
+            hist = torch.zeros(num_classes, num_classes, dtype=torch.int64)
+        # every rank has to join the reduction, even with nothing processed
+        all_reduce(hist)
+
+        metrics = self.compute_metrics([hist])
+        if self.prefix:
+            metrics = {
+                '/'.join((self.prefix, k)): v
+                for k, v in metrics.items()
+            }
+        self.hist = None
+        return metrics
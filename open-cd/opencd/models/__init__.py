@@ -1,4 +1,5 @@
 from .backbones import *
+from .batch_augments import *
 from .change_detectors import *
 from .data_preprocessor import *
 from .decode_heads import *
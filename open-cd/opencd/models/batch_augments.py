@@ -0,0 +1,371 @@
+# Copyright (c) Open-CD. All rights reserved.
+"""Batch augmentations for :class:`DualInputSegDataPreProcessor`.
+
+They run on the device, on the stacked ``(N, T * C, H, W)`` float batch in
+pixel space (before normalization) and on the label maps of the data
+samples, with an independent random draw per sample. Geometric ops move the
+A and B images and all label maps together, and only accept batches that
+needed no padding. Use them as ``batch_augments``
+entries instead of the per-sample MultiImg transforms to take work off the
+dataloader workers, e.g.::
+
+    data_preprocessor = dict(
+        type='DualInputSegDataPreProcessor',
+        ...,
+        batch_augments=[
+            dict(type='BatchFlip', direction=['horizontal', 'vertical']),
+            dict(type='BatchRot90'),
+            dict(type='BatchPhotoMetricDistortion'),
+        ])
+"""
+import math
+from typing import List, Optional, Sequence, Tuple, Union
+
+import torch
+import torch.nn as nn
+from torch import Tensor
+
+from mmseg.utils import SampleList
+from opencd.registry import MODELS
+
+LABEL_KEYS = ('gt_sem_seg', 'gt_edge_map', 'gt_sem_seg_from', 'gt_sem_seg_to')
+
+
+def stack_labels(data_samples: SampleList) -> dict:
+    """Stack the label maps of ``data_samples`` into ``(N, 1, H, W)``."""
+    labels = dict()
+    for key in LABEL_KEYS:
+        if len(data_samples) > 0 and key in data_samples[0]:
+            labels[key] = torch.stack(
+                [data_sample.get(key).data for data_sample in data_samples])
+    return labels
+
+
+def unstack_labels(labels: dict, data_samples: SampleList) -> None:
+    """Write back label maps stacked by :func:`stack_labels`."""
+    for key, label in labels.items():
+        for data_sample, sample_label in zip(data_samples, label):
+            data_sample.get(key).data = sample_label
+
+
+def check_unpadded(data_samples: SampleList, name: str) -> None:
+    """Geometric ops need batches without the bottom/right padding of
+    :func:`stack_batch`, flipping or rotating would move it onto the top/left
+    while ``padding_size`` and :func:`fill_padding` still point to the old
+    place."""
+    for data_sample in data_samples:
+        padding_size = data_sample.metainfo.get('padding_size', (0, 0, 0, 0))
+        assert not any(padding_size), (
+            f'{name} needs unpadded batches, but got padding_size '
+            f'{tuple(padding_size)}; crop the samples to the same size '
+            '(e.g. `crop_size` equal to the data preprocessor `size`).')
+
+
+def select(mask: Tensor, if_true: Tensor, if_false: Tensor) -> Tensor:
+    """Per-sample ``torch.where`` with a ``(N, )`` boolean mask."""
+    mask = mask.view(-1, *([1] * (if_true.dim() - 1)))
+    return torch.where(mask, if_true, if_false)
+
+
+@MODELS.register_module()
+class BatchFlip(nn.Module):
+    """Flip the images and label maps of a batch.
+
+    Args:
+        prob (float): Probability of flipping a sample. Defaults to 0.5.
+        direction (str | list[str]): 'horizontal', 'vertical' or 'diagonal',
+            a list draws one of them per sample. Defaults to 'horizontal'.
+    """
+
+    _flip_dims = dict(horizontal=(-1, ), vertical=(-2, ), diagonal=(-2, -1))
+
+    def __init__(self,
+                 prob: float = 0.5,
+                 direction: Union[str, Sequence[str]] = 'horizontal'):
+        super().__init__()
+        assert 0 <= prob <= 1
+        if isinstance(direction, str):
+            direction = [direction]
+        assert set(direction).issubset(self._flip_dims)
+        self.prob = prob
+        self.direction = list(direction)
+
+    def forward(self, inputs: Tensor,
+                data_samples: SampleList) -> Tuple[Tensor, SampleList]:
+        check_unpadded(data_samples, self.__class__.__name__)
+        num = inputs.size(0)
+        flip = torch.rand(num, device=inputs.device) < self.prob
+        if not flip.any():
+            return inputs, data_samples
+        choice = torch.randint(
+            len(self.direction), (num, ), device=inputs.device)
+        labels = stack_labels(data_samples)
+        for i, direction in enumerate(self.direction):
+            mask = flip & (choice == i)
+            if not mask.any():
+                continue
+            dims = self._flip_dims[direction]
+            inputs = select(mask, inputs.flip(dims), inputs)
+            for key, label in labels.items():
+                labels[key] = select(mask, label.flip(dims), label)
+        unstack_labels(labels, data_samples)
+        return inputs, data_samples
+
+
+@MODELS.register_module()
+class BatchRot90(nn.Module):
+    """Rotate the images and label maps of a batch by multiples of 90°.
+
+    Quarter turns need square inputs, non-square batches are only rotated
+    by 180°.
+
+    Args:
+        prob (float): Probability of rotating a sample, by 90, 180 or 270
+            degrees with equal chance. Defaults to 0.5.
+    """
+
+    def __init__(self, prob: float = 0.5):
+        super().__init__()
+        assert 0 <= prob <= 1
+        self.prob = prob
+
+    def forward(self, inputs: Tensor,
+                data_samples: SampleList) -> Tuple[Tensor, SampleList]:
+        check_unpadded(data_samples, self.__class__.__name__)
+        num = inputs.size(0)
+        rotate = torch.rand(num, device=inputs.device) < self.prob
+        if not rotate.any():
+            return inputs, data_samples
+        square = inputs.size(-1) == inputs.size(-2)
+        turns = torch.randint(1, 4, (num, ), device=inputs.device) \
+            if square else torch.full((num, ), 2, device=inputs.device)
+        labels = stack_labels(data_samples)
+        for k in (1, 2, 3):
+            mask = rotate & (turns == k)
+            if not mask.any():
+                continue
+            inputs = select(mask, inputs.rot90(k, (-2, -1)), inputs)
+            for key, label in labels.items():
+                labels[key] = select(mask, label.rot90(k, (-2, -1)), label)
+        unstack_labels(labels, data_samples)
+        return inputs, data_samples
+
+
+@MODELS.register_module()
+class BatchPhotoMetricDistortion(nn.Module):
+    """Photometric jitter of a batch, independent for every timestamp.
+
+    The counterpart of :class:`MultiImgPhotoMetricDistortion`: brightness,
+    contrast, saturation and hue each change with probability 0.5, drawn per
+    sample and timestamp. Saturation blends with the channel mean and hue
+    rotates the colours around the grey axis, both linear in RGB, so no
+    colour space conversion is needed. Values are clamped to [0, 255].
+
+    Args:
+        brightness_delta (int): delta of brightness. Defaults to 32.
+        contrast_range (tuple): range of contrast. Defaults to (0.5, 1.5).
+        saturation_range (tuple): range of saturation.
+            Defaults to (0.5, 1.5).
+        hue_delta (int): delta of hue, in OpenCV units of 2 degrees.
+            Defaults to 18.
+        channels_per_img (int): Channels of each timestamp in the stacked
+            inputs, must be 3. Defaults to 3.
+    """
+
+    def __init__(self,
+                 brightness_delta: int = 32,
+                 contrast_range: Sequence[float] = (0.5, 1.5),
+                 saturation_range: Sequence[float] = (0.5, 1.5),
+                 hue_delta: int = 18,
+                 channels_per_img: int = 3):
+        super().__init__()
+        assert channels_per_img == 3, 'colour jitter needs 3-channel images'
+        self.brightness_delta = brightness_delta
+        self.contrast_lower, self.contrast_upper = contrast_range
+        self.saturation_lower, self.saturation_upper = saturation_range
+        self.hue_delta = hue_delta
+        self.channels_per_img = channels_per_img
+
+    def _draw(self, shape: tuple, low: float, high: float, neutral: float,
+              device: torch.device) -> Tensor:
+        """Uniform values in [low, high) applied with probability 0.5."""
+        apply = torch.rand(shape, device=device) < 0.5
+        values = torch.empty(shape, device=device).uniform_(low, high)
+        return torch.where(apply, values, torch.full_like(values, neutral))
+
+    def _hue_matrix(self, degrees: Tensor) -> Tensor:
+        """Matrices rotating RGB vectors by ``degrees`` around grey."""
+        theta = degrees * (math.pi / 180)
+        cos, sin = theta.cos(), theta.sin()
+        third, root = 1. / 3, math.sqrt(1. / 3)
+        a = cos + (1 - cos) * third
+        b = (1 - cos) * third - root * sin
+        c = (1 - cos) * third + root * sin
+        return torch.stack([
+            torch.stack([a, b, c], -1),
+            torch.stack([c, a, b], -1),
+            torch.stack([b, c, a], -1)
+        ], -2)
+
+    def forward(self, inputs: Tensor,
+                data_samples: SampleList) -> Tuple[Tensor, SampleList]:
+        num, channels, h, w = inputs.shape
+        times = channels // self.channels_per_img
+        imgs = inputs.reshape(num, times, 3, h, w)
+        shape, device = (num, times, 1, 1, 1), inputs.device
+
+        beta = self._draw(shape, -self.brightness_delta,
+                          self.brightness_delta, 0., device)
+        imgs = (imgs + beta).clamp(0, 255)
+
+        # mode == 1 --> do random contrast first
+        contrast_first = torch.rand(shape, device=device) < 0.5
+        alpha = self._draw(shape, self.contrast_lower, self.contrast_upper,
+                           1., device)
+        imgs = (imgs * torch.where(contrast_first, alpha,
+                                   torch.ones_like(alpha))).clamp(0, 255)
+
+        saturation = self._draw(shape, self.saturation_lower,
+                                self.saturation_upper, 1., device)
+        grey = imgs.mean(dim=2, keepdim=True)
+        imgs = (grey + saturation * (imgs - grey)).clamp(0, 255)
+
+        hue = self._draw((num, times), -self.hue_delta, self.hue_delta, 0.,
+                         device).round()
+        # OpenCV hue units are 2 degrees
+        imgs = torch.einsum('ntij,ntjhw->ntihw', self._hue_matrix(hue * 2),
+                            imgs).clamp(0, 255)
+
+        # mode == 0 --> do random contrast last
+        imgs = (imgs * torch.where(contrast_first, torch.ones_like(alpha),
+                                   alpha)).clamp(0, 255)
+        return imgs.reshape(num, channels, h, w), data_samples
+
+
+@MODELS.register_module()
+class BatchCutOut(nn.Module):
+    """Drop random regions of the images, at the same place in A and B.
+
+    Args:
+        prob (float): cutout probability.
+        n_holes (int | tuple[int, int]): Number of regions to be dropped.
+            If it is given as a tuple, number of holes will be randomly
+            selected from the closed interval [`n_holes[0]`, `n_holes[1]`].
+        cutout_shape (tuple[int, int] | list[tuple[int, int]]): The candidate
+            (w, h) of dropped regions.
+        cutout_ratio (tuple[float, float] | list[tuple[float, float]]): The
+            candidate (w, h) ratio of dropped regions. Only one of
+            `cutout_shape` and `cutout_ratio` can be given.
+        fill_in (Sequence[float]): The value of pixel to fill in the dropped
+            regions, per channel of a timestamp. Default: (0, 0, 0).
+        seg_fill_in (int, optional): The labels of pixel to fill in the
+            dropped regions. If seg_fill_in is None, skip. Default: None.
+    """
+
+    def __init__(self,
+                 prob: float,
+                 n_holes: Union[int, Tuple[int, int]],
+                 cutout_shape: Optional[Union[tuple, List[tuple]]] = None,
+                 cutout_ratio: Optional[Union[tuple, List[tuple]]] = None,
+                 fill_in: Sequence[float] = (0, 0, 0),
+                 seg_fill_in: Optional[int] = None):
+        super().__init__()
+        assert 0 <= prob <= 1
+        assert (cutout_shape is None) ^ (cutout_ratio is None), \
+            'Either cutout_shape or cutout_ratio should be specified.'
+        if isinstance(n_holes, tuple):
+            assert len(n_holes) == 2 and 0 <= n_holes[0] < n_holes[1]
+        else:
+            n_holes = (n_holes, n_holes)
+        self.prob = prob
+        self.n_holes = n_holes
+        self.seg_fill_in = seg_fill_in
+        self.with_ratio = cutout_ratio is not None
+        candidates = cutout_ratio if self.with_ratio else cutout_shape
+        if not isinstance(candidates, list):
+            candidates = [candidates]
+        self.register_buffer(
+            'candidates', torch.tensor(candidates, dtype=torch.float32),
+            False)
+        self.register_buffer(
+            'fill_in', torch.tensor(fill_in, dtype=torch.float32), False)
+
+    def forward(self, inputs: Tensor,
+                data_samples: SampleList) -> Tuple[Tensor, SampleList]:
+        num, channels, h, w = inputs.shape
+        device = inputs.device
+        cutout = torch.rand(num, device=device) < self.prob
+        if not cutout.any():
+            return inputs, data_samples
+        n_holes = torch.randint(
+            self.n_holes[0], self.n_holes[1] + 1, (num, ), device=device)
+        n_holes = torch.where(cutout, n_holes, torch.zeros_like(n_holes))
+
+        ys = torch.arange(h, device=device).view(1, h, 1)
+        xs = torch.arange(w, device=device).view(1, 1, w)
+        dropped = torch.zeros((num, h, w), dtype=torch.bool, device=device)
+        for hole in range(self.n_holes[1]):
+            index = torch.randint(
+                len(self.candidates), (num, ), device=device)
+            size = self.candidates[index]
+            if self.with_ratio:
+                size = size * size.new_tensor([w, h])
+            cutout_w, cutout_h = size.long().unbind(-1)
+            x1 = torch.randint(w, (num, ), device=device)
+            y1 = torch.randint(h, (num, ), device=device)
+            box = (ys >= y1.view(-1, 1, 1)) \
+                & (ys < (y1 + cutout_h).view(-1, 1, 1)) \
+                & (xs >= x1.view(-1, 1, 1)) \
+                & (xs < (x1 + cutout_w).view(-1, 1, 1))
+            dropped |= box & (hole < n_holes).view(-1, 1, 1)
+
+        fill_in = self.fill_in.to(inputs.dtype).repeat(
+            channels // len(self.fill_in)).view(1, channels, 1, 1)
+        inputs = torch.where(dropped.unsqueeze(1), fill_in, inputs)
+        if self.seg_fill_in is not None:
+            labels = stack_labels(data_samples)
+            for key, label in labels.items():
+                labels[key] = label.masked_fill(
+                    dropped.unsqueeze(1), self.seg_fill_in)
+            unstack_labels(labels, data_samples)
+        return inputs, data_samples
+
+
+@MODELS.register_module()
+class BatchExchangeTime(nn.Module):
+    """Swap the A and B images of a batch.
+
+    The ``from`` and ``to`` semantic label maps, when present, are swapped
+    too.
+
+    Args:
+        prob (float): probability of swapping a sample. Default: 0.5.
+    """
+
+    def __init__(self, prob: float = 0.5):
+        super().__init__()
+        assert 0 <= prob <= 1
+        self.prob = prob
+
+    def forward(self, inputs: Tensor,
+                data_samples: SampleList) -> Tuple[Tensor, SampleList]:
+        exchange = torch.rand(inputs.size(0), device=inputs.device) < self.prob
+        if not exchange.any():
+            return inputs, data_samples
+        img_from, img_to = inputs.chunk(2, dim=1)
+        inputs = select(exchange, torch.cat([img_to, img_from], dim=1),
+                        inputs)
+        for data_sample, swap in zip(data_samples, exchange.tolist()):
+            if swap and 'gt_sem_seg_from' in data_sample and \
+                    'gt_sem_seg_to' in data_sample:
+                seg_from = data_sample.gt_sem_seg_from.data
+                data_sample.gt_sem_seg_from.data = \
+                    data_sample.gt_sem_seg_to.data
+                data_sample.gt_sem_seg_to.data = seg_from
+        return inputs, data_samples
+
+
+__all__ = [
+    'BatchFlip', 'BatchRot90', 'BatchPhotoMetricDistortion', 'BatchCutOut',
+    'BatchExchangeTime'
+]
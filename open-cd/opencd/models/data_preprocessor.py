@@ -4,6 +4,7 @@ from typing import Any, Dict, List, Optional, Sequence, Union
 
 import numpy as np
 import torch
+import torch.nn as nn
 import torch.nn.functional as F
 from mmengine.model import BaseDataPreprocessor
 
@@ -112,6 +113,36 @@ def stack_batch(inputs: List[torch.Tensor],
     return torch.stack(padded_inputs, dim=0), padded_samples
 
 
+def fill_padding(inputs: torch.Tensor, data_samples: SampleList,
+                 pad_val: Union[int, float]) -> None:
+    """Set the padding added by :func:`stack_batch` to ``pad_val`` in place.
+
+    Used when the batch is padded before normalization, so the padding ends
+    up with the same value as when padding normalized inputs.
+    """
+    for _input, data_sample in zip(inputs, data_samples):
+        _, width, _, height = data_sample.padding_size
+        if height > 0:
+            _input[:, _input.size(-2) - height:, :] = pad_val
+        if width > 0:
+            _input[:, :, _input.size(-1) - width:] = pad_val
+
+
+def labels_to_long(data_samples: SampleList) -> None:
+    """Cast the label maps of ``data_samples`` to int64 in place.
+
+    Labels may be packed as uint8 to keep the dataloader traffic small, the
+    cast is done here once they are on the device.
+    """
+    for data_sample in data_samples:
+        for key in ('gt_sem_seg', 'gt_edge_map', 'gt_sem_seg_from',
+                    'gt_sem_seg_to'):
+            if key in data_sample:
+                label = data_sample.get(key)
+                if label.data.dtype != torch.int64:
+                    label.data = label.data.long()
+
+
 @MODELS.register_module()
 class DualInputSegDataPreProcessor(BaseDataPreprocessor):
     """Image pre-processor for change detection tasks.
@@ -120,7 +151,7 @@ class DualInputSegDataPreProcessor(BaseDataPreprocessor):
 
     1. It won't do normalization if ``mean`` is not specified.
     2. It does normalization and color space conversion after stacking batch.
-    3. It supports batch augmentations like mixup and cutmix.
+    3. It supports batch augmentations, see ``opencd.models.batch_augments``.
 
 
     It provides the data pre-processing as follows
@@ -130,8 +161,8 @@ class DualInputSegDataPreProcessor(BaseDataPreprocessor):
         with defined ``seg_pad_val``.
     - Stack inputs to batch_inputs.
     - Convert inputs from bgr to rgb if the shape of input is (3, H, W).
+    - Do batch augmentations during training, in pixel space.
     - Normalize image with defined std and mean.
-    - Do batch augmentations like Mixup and Cutmix during training.
 
     Args:
         mean (Sequence[Number], optional): The pixel mean of R, G, B channels.
@@ -150,10 +181,26 @@ class DualInputSegDataPreProcessor(BaseDataPreprocessor):
             Defaults to False.
         rgb_to_bgr (bool): whether to convert image from RGB to RGB.
             Defaults to False.
-        batch_augments (list[dict], optional): Batch-level augmentations
+        bands_per_timestamp (int): Number of channels of each timestamp in
+            the concatenated input, e.g. 4 for B, G, R and NIR bands. The
+            channel conversion swaps the first 3 channels of every
+            timestamp and leaves the extra bands in place. Defaults to 3.
+        batch_augments (list[dict], optional): Batch-level augmentations,
+            built from the ``MODELS`` registry and applied in order on the
+            stacked batch during training, before normalization. Flips and
+            rotations need batches that are not padded by ``size`` or
+            ``size_divisor``.
         test_cfg (dict, optional): The padding size config in testing, if not
             specify, will use `size` and `size_divisor` params as default.
             Defaults to None, only supports keys `size` or `size_divisor`.
+        non_blocking (bool): Whether to copy the data to the device
+            asynchronously, useful with ``pin_memory=True`` dataloaders.
+            Defaults to False.
+
+    Note:
+        Images may arrive as uint8 and label maps as uint8 (see
+        ``MultiImgPackSegInputs(compact_labels=True)``); both are cast, to
+        float and int64 respectively, only after they reach the device.
     """
 
     def __init__(
@@ -166,10 +213,12 @@ class DualInputSegDataPreProcessor(BaseDataPreprocessor):
         seg_pad_val: Number = 255,
         bgr_to_rgb: bool = False,
         rgb_to_bgr: bool = False,
+        bands_per_timestamp: int = 3,
         batch_augments: Optional[List[dict]] = None,
         test_cfg: dict = None,
+        non_blocking: bool = False,
     ):
-        super().__init__()
+        super().__init__(non_blocking=non_blocking)
         self.size = size
         self.size_divisor = size_divisor
         self.pad_val = pad_val
@@ -178,6 +227,14 @@ class DualInputSegDataPreProcessor(BaseDataPreprocessor):
         assert not (bgr_to_rgb and rgb_to_bgr), (
             '`bgr2rgb` and `rgb2bgr` cannot be set to True at the same time')
         self.channel_conversion = rgb_to_bgr or bgr_to_rgb
+        assert bands_per_timestamp >= 3, \
+            '`bands_per_timestamp` must be at least 3'
+        self.bands_per_timestamp = bands_per_timestamp
+        # reverse the colour channels of both timestamps, keep the others
+        order = list(range(2 * bands_per_timestamp))
+        for start in (0, bands_per_timestamp):
+            order[start:start + 3] = order[start:start + 3][::-1]
+        self.conversion_order = order
 
         if mean is not None:
             assert std is not None, 'To enable the normalization in ' \
@@ -192,8 +249,11 @@ class DualInputSegDataPreProcessor(BaseDataPreprocessor):
         else:
             self._enable_normalize = False
 
-        # TODO: support batch augmentations.
-        self.batch_augments = batch_augments
+        if batch_augments is not None:
+            self.batch_augments = nn.ModuleList(
+                [MODELS.build(aug) for aug in batch_augments])
+        else:
+            self.batch_augments = None
 
         # Support different padding methods in testing
         self.test_cfg = test_cfg
@@ -212,11 +272,32 @@ class DualInputSegDataPreProcessor(BaseDataPreprocessor):
         data = self.cast_data(data)  # type: ignore
         inputs = data['inputs']
         data_samples = data.get('data_samples', None)
+        if data_samples is not None:
+            labels_to_long(data_samples)
         # TODO: whether normalize should be after stack_batch
-        if self.channel_conversion and inputs[0].size(0) == 6:
-            inputs = [_input[[2, 1, 0, 5, 4, 3], ...] for _input in inputs]
+        if self.channel_conversion and \
+                inputs[0].size(0) == 2 * self.bands_per_timestamp:
+            inputs = [_input[self.conversion_order, ...] for _input in inputs]
 
         inputs = [_input.float() for _input in inputs]
+        if training and self.batch_augments is not None:
+            assert data_samples is not None, \
+                'During training, `data_samples` must be defined.'
+            # augment in pixel space, then normalize the whole batch
+            inputs, data_samples = stack_batch(
+                inputs=inputs,
+                data_samples=data_samples,
+                size=self.size,
+                size_divisor=self.size_divisor,
+                pad_val=0,
+                seg_pad_val=self.seg_pad_val)
+            for batch_aug in self.batch_augments:
+                inputs, data_samples = batch_aug(inputs, data_samples)
+            if self._enable_normalize:
+                inputs = (inputs - self.mean) / self.std
+            fill_padding(inputs, data_samples, self.pad_val)
+            return dict(inputs=inputs, data_samples=data_samples)
+
         if self._enable_normalize:
             inputs = [(_input - self.mean) / self.std for _input in inputs]
 
@@ -230,10 +311,6 @@ class DualInputSegDataPreProcessor(BaseDataPreprocessor):
                 size_divisor=self.size_divisor,
                 pad_val=self.pad_val,
                 seg_pad_val=self.seg_pad_val)
-
-            if self.batch_augments is not None:
-                inputs, data_samples = self.batch_augments(
-                    inputs, data_samples)
         else:
             assert len(inputs) == 1, (
                 'Batch inference is not support currently, '
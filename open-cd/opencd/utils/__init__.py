@@ -0,0 +1,4 @@
+# Copyright (c) Open-CD. All rights reserved.
+from .async_writer import AsyncWriter, get_async_writer
+
+__all__ = ['AsyncWriter', 'get_async_writer']
@@ -0,0 +1,86 @@
+# Copyright (c) Open-CD. All rights reserved.
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Set
+
+
+class AsyncWriter:
+    """Bounded background writer shared by everything that saves results.
+
+    Write jobs (image encoding, ``np.savez`` ...) run on a small thread pool
+    so they overlap with the next forward pass. At most ``max_pending`` jobs
+    may be queued or running at once; :meth:`submit` blocks beyond that,
+    which keeps memory bounded when the disk is slower than the model.
+    Errors raised by a job are re-raised by the next :meth:`submit` or
+    :meth:`flush` call.
+
+    Args:
+        num_workers (int): Number of writer threads. Defaults to 4.
+        max_pending (int): Maximum number of queued or running jobs.
+            Defaults to 64.
+    """
+
+    def __init__(self, num_workers: int = 4, max_pending: int = 64) -> None:
+        assert num_workers > 0 and max_pending > 0
+        self.num_workers = num_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix='opencd_writer')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending: Set[Future] = set()
+        self._errors: List[BaseException] = []
+
+    def _on_done(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+            if not future.cancelled() and future.exception() is not None:
+                self._errors.append(future.exception())
+        self._slots.release()
+
+    def _raise_errors(self) -> None:
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Schedule ``fn(*args, **kwargs)``, blocking while the queue is
+        full."""
+        self._raise_errors()
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def flush(self) -> None:
+        """Block until every submitted job has finished."""
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            for future in pending:
+                future.exception()
+        self._raise_errors()
+
+
+_writer: Optional[AsyncWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_async_writer(num_workers: int = 4,
+                     max_pending: int = 64) -> AsyncWriter:
+    """Return the process-wide :class:`AsyncWriter`, creating it on first
+    use. The arguments only take effect on that first call."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AsyncWriter(num_workers, max_pending)
+        return _writer
@@ -7,6 +7,7 @@ from mmengine.dist import master_only
 from mmseg.structures import SegDataSample
 from mmseg.visualization import SegLocalVisualizer
 from opencd.registry import VISUALIZERS
+from opencd.utils import get_async_writer
 
 
 @VISUALIZERS.register_module()
@@ -37,7 +38,8 @@ class CDLocalVisualizer(SegLocalVisualizer):
         the images will be displayed in a local window.
         - If ``out_file`` is specified, the drawn image will be
         saved to ``out_file``. it is usually used when the display
-        is not available.
+        is not available. The file is written in the background by the
+        shared :class:`AsyncWriter`.
 
         Args:
             name (str): The image identifier.
@@ -166,9 +168,11 @@ class CDLocalVisualizer(SegLocalVisualizer):
         if out_file is not None:
             if drawn_img_from is not None and drawn_img_to is not None:
                 drawn_img_cat = np.concatenate((drawn_img, drawn_img_from, drawn_img_to), axis=0)
-                mmcv.imwrite(mmcv.bgr2rgb(drawn_img_cat), out_file)
+                get_async_writer().submit(
+                    mmcv.imwrite, mmcv.bgr2rgb(drawn_img_cat), out_file)
             else:
-                mmcv.imwrite(mmcv.bgr2rgb(drawn_img), out_file)
+                get_async_writer().submit(
+                    mmcv.imwrite, mmcv.bgr2rgb(drawn_img), out_file)
         else:
             self.add_image(name, drawn_img, drawn_img_from, drawn_img_to, step)
 
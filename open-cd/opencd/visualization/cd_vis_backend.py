@@ -6,6 +6,8 @@ import numpy as np
 from mmengine.registry import VISBACKENDS
 from mmengine.visualization.vis_backend import LocalVisBackend, force_init_env
 
+from opencd.utils import get_async_writer
+
 
 @VISBACKENDS.register_module()
 class CDLocalVisBackend(LocalVisBackend):
@@ -18,7 +20,8 @@ class CDLocalVisBackend(LocalVisBackend):
                   image_to: np.array = None,
                   step: int = 0,
                   **kwargs) -> None:
-        """Record the image to disk.
+        """Record the image to disk. Encoding and writing are handed to the
+        shared :class:`AsyncWriter`, so they overlap with the next iteration.
 
         Args:
             name (str): The image identifier.
@@ -31,6 +34,8 @@ class CDLocalVisBackend(LocalVisBackend):
         os.makedirs(self._img_save_dir, exist_ok=True)
         save_file_name = f'{name}.png'
 
+        writer = get_async_writer()
+
         if image_from is not None and image_to is not None:
             assert image_from.dtype == np.uint8 and image_to.dtype == np.uint8
             drawn_image_from = cv2.cvtColor(image_from, cv2.COLOR_RGB2BGR)
@@ -38,8 +43,8 @@ class CDLocalVisBackend(LocalVisBackend):
             for sub_dir in ['binary', 'from', 'to']:
                 os.makedirs(osp.join(self._img_save_dir, sub_dir), exist_ok=True)
 
-            cv2.imwrite(osp.join(self._img_save_dir, 'binary', save_file_name), drawn_image)
-            cv2.imwrite(osp.join(self._img_save_dir, 'from', save_file_name), drawn_image_from)
-            cv2.imwrite(osp.join(self._img_save_dir, 'to', save_file_name), drawn_image_to)
+            writer.submit(cv2.imwrite, osp.join(self._img_save_dir, 'binary', save_file_name), drawn_image)
+            writer.submit(cv2.imwrite, osp.join(self._img_save_dir, 'from', save_file_name), drawn_image_from)
+            writer.submit(cv2.imwrite, osp.join(self._img_save_dir, 'to', save_file_name), drawn_image_to)
         else:       
-            cv2.imwrite(osp.join(self._img_save_dir, save_file_name), drawn_image)
\ No newline at end of file
+            writer.submit(cv2.imwrite, osp.join(self._img_save_dir, save_file_name), drawn_image)
\ No newline at end of file
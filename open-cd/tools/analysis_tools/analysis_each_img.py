@@ -1,73 +1,182 @@
+# Copyright (c) Open-CD. All rights reserved.
+import argparse
 import csv
 import os
 import os.path as osp
-import sys
-from pathlib import Path
+from functools import partial
+from multiprocessing import Pool
 
 import cv2
 import numpy as np
 from tqdm import tqdm
 
+# Label2 masks are written with the viridis colormap, unchanged pixels take
+# its first color (RGB 68, 1, 84), stored here in BGR order as read by cv2.
+LABEL2_BACKGROUND = (84, 1, 68)
+IMG_SUFFIXES = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+FIELDS = [
+    'file_name', 'F1', 'precision', 'recall', 'iou', 'TP', 'TN', 'FP', 'FN'
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Per-image metrics of binary change masks')
+    parser.add_argument('pred_dir', help='directory of predicted masks')
+    parser.add_argument('label_dir', help='directory of ground truth masks')
+    parser.add_argument(
+        '--pred-format',
+        default='binary',
+        choices=['binary', 'label2', 'index'],
+        help='how to decode predictions: `binary` thresholds the gray level '
+        'at 128, `label2` treats every non-background viridis color as '
+        'change, `index` reads class indices as stored')
+    parser.add_argument(
+        '--label-format',
+        default='binary',
+        choices=['binary', 'label2', 'index'],
+        help='how to decode ground truth masks, see --pred-format')
+    parser.add_argument(
+        '--num-classes', type=int, default=2, help='number of classes')
+    parser.add_argument(
+        '--out',
+        default='score.csv',
+        help='per-image output file, `.csv` or `.parquet`. The aggregate is '
+        'written next to it with an `_aggregate` suffix')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=os.cpu_count(),
+        help='number of decoding processes')
+    parser.add_argument(
+        '--chunksize',
+        type=int,
+        default=32,
+        help='number of images sent to a worker at once')
+    args = parser.parse_args()
+    return args
+
 
 def get_metrics(total_mat):
     """
     total_mat: a total confusion matrix
     """
-    all_acc = np.diag(total_mat).sum() / total_mat.sum()
-    iou = np.diag(total_mat) / (total_mat.sum(axis=1) + total_mat.sum(axis=0) - np.diag(total_mat))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        all_acc = np.diag(total_mat).sum() / total_mat.sum()
+        iou = np.diag(total_mat) / (total_mat.sum(axis=1) + total_mat.sum(axis=0) - np.diag(total_mat))
 
-    precision = np.diag(total_mat) / total_mat.sum(axis=0)
-    recall = np.diag(total_mat) / total_mat.sum(axis=1)
-    F1 = 2*precision*recall / (precision + recall)
+        precision = np.diag(total_mat) / total_mat.sum(axis=0)
+        recall = np.diag(total_mat) / total_mat.sum(axis=1)
+        F1 = 2*precision*recall / (precision + recall)
 
     return all_acc, iou[1], precision[1], recall[1], F1[1]
 
 
-def read_img(file_name):
-    img = cv2.imread(file_name, cv2.IMREAD_UNCHANGED)
-    img[img < 128] = 0
-    img[img >= 128] = 1
-    return img
+def change_counts(mat):
+    """TP, TN, FP and FN of the change class (class 1)."""
+    TP = mat[1, 1]
+    FP = mat[:, 1].sum() - TP
+    FN = mat[1].sum() - TP
+    TN = mat.sum() - TP - FP - FN
+    return [TP, TN, FP, FN]
+
+
+def read_img(file_name, fmt):
+    """Decode a mask into class indices."""
+    if fmt == 'label2':
+        img = cv2.imread(file_name, cv2.IMREAD_COLOR)
+        return (img != LABEL2_BACKGROUND).any(axis=-1).astype(np.uint8)
+    if fmt == 'binary':
+        img = cv2.imread(file_name, cv2.IMREAD_GRAYSCALE)
+        return (img >= 128).astype(np.uint8)
+    return cv2.imread(file_name, cv2.IMREAD_UNCHANGED)
+
+
+def list_masks(root):
+    """Relative paths of all masks below ``root``, e.g. the
+    ``{zone}/{date_a}_{date_b}.png`` layout of Label and Label2."""
+    files = []
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(osp.join(root, rel_dir)) as it:
+            for entry in it:
+                rel_path = osp.join(rel_dir, entry.name)
+                if entry.is_dir():
+                    stack.append(rel_path)
+                elif entry.name.lower().endswith(IMG_SUFFIXES):
+                    files.append(rel_path)
+    return sorted(files)
+
+
+def init_worker():
+    # one decoding thread per process, parallelism comes from the pool
+    cv2.setNumThreads(1)
+
+
+def confusion_matrix(rel_path, pred_dir, label_dir, pred_format,
+                     label_format, num_classes):
+    pred = read_img(osp.join(pred_dir, rel_path), pred_format)
+    gt = read_img(osp.join(label_dir, rel_path), label_format)
+    if pred.shape != gt.shape:
+        pred = cv2.resize(
+            pred, gt.shape[::-1], interpolation=cv2.INTER_NEAREST)
+
+    mask = gt < num_classes
+    mat = np.bincount(
+        num_classes * gt[mask].astype(np.int64) + pred[mask],
+        minlength=num_classes**2).reshape(num_classes, num_classes)
+    return rel_path, mat
+
+
+def write_rows(out_file, rows):
+    if out_file.endswith('.parquet'):
+        import pandas as pd
+        pd.DataFrame(rows, columns=FIELDS).to_parquet(out_file, index=False)
+    else:
+        with open(out_file, 'w', encoding='UTF8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            writer.writerows(rows)
+
+
+def main():
+    args = parse_args()
+    assert args.num_classes >= 2
+
+    names = [
+        name for name in list_masks(args.pred_dir)
+        if osp.isfile(osp.join(args.label_dir, name))
+    ]
+    print(f'{len(names)} masks with ground truth in {args.label_dir}')
+
+    worker = partial(
+        confusion_matrix,
+        pred_dir=args.pred_dir,
+        label_dir=args.label_dir,
+        pred_format=args.pred_format,
+        label_format=args.label_format,
+        num_classes=args.num_classes)
+
+    rows = []
+    total_mat = np.zeros((args.num_classes, args.num_classes), dtype=np.int64)
+    with Pool(args.workers, initializer=init_worker) as pool:
+        results = pool.imap(worker, names, chunksize=args.chunksize)
+        for img_name, mat in tqdm(results, total=len(names)):
+            total_mat += mat
+            _, iou, precision, recall, F1 = get_metrics(mat)
+            rows.append([img_name, F1, precision, recall, iou] +
+                        change_counts(mat))
+
+    write_rows(args.out, rows)
+
+    all_acc, iou, precision, recall, F1 = get_metrics(total_mat)
+    stem, ext = osp.splitext(args.out)
+    aggregate = ['all', F1, precision, recall, iou] + change_counts(total_mat)
+    write_rows(f'{stem}_aggregate{ext}', [aggregate])
+
+    print(f"all_acc: {all_acc},\niou: {iou},\nprecision: {precision},\nrecall: {recall}, \nF1: {F1}")
 
 
 if __name__ == '__main__':
-    pred_root = '/home/dml307/exp/likyoo/result_data/result_opencd_baseline/infer_res'
-    label_root = '/home/dml307/data/cd_dataset/LEVIR-CD/test/label'
-    
-    # total_mat = np.zeros((2, 2), dtype=float)
-    # num_classes = 2
-    # for img_name in tqdm(os.listdir(pred_root)):
-        
-    #     pred = read_img(osp.join(pred_root, img_name))
-    #     gt = read_img(osp.join(label_root, img_name))
-        
-    #     mask = (gt >= 0) & (gt < num_classes)
-    #     mat = np.bincount(2 * gt[mask].astype(int) + pred[mask],
-    #                        minlength=num_classes**2).reshape(num_classes, num_classes)
-
-    #     total_mat += mat
-        
-    # all_acc, iou, precision, recall, F1 = get_metrics(total_mat)
-    
-    # print(f"all_acc: {all_acc},\niou: {iou},\nprecision: {precision},\nrecall: {recall}, \nF1: {F1}")
-    
-    FILE_METRIC_LIST = []
-    num_classes = 2
-    for img_name in tqdm(os.listdir(pred_root)):
-        
-        pred = read_img(osp.join(pred_root, img_name))
-        gt = read_img(osp.join(label_root, img_name))
-        
-        mask = (gt >= 0) & (gt < num_classes)
-        mat = np.bincount(num_classes * gt[mask].astype(int) + pred[mask],
-                           minlength=num_classes**2).reshape(num_classes, num_classes)
-        
-        FP, FN = mat[0, 1], mat[1, 0]
-        all_acc, iou, precision, recall, F1 = get_metrics(mat)
-        FILE_METRIC_LIST.append([img_name, F1, precision, recall, iou, FP, FN])
-        
-    with open('score.csv', 'w', encoding='UTF8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['file_name', 'F1', 'precision', 'recall', 'iou', 'FT', 'FN'])
-        writer.writerows(FILE_METRIC_LIST)
-        
\ No newline at end of file
+    main()
@@ -0,0 +1,122 @@
+# Copyright (c) Open-CD. All rights reserved.
+import argparse
+import os
+import os.path as osp
+import tempfile
+import time
+
+import mmengine.fileio as fileio
+from mmengine.registry import init_default_scope
+
+from opencd.datasets import LEVIR_CD_Dataset
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the construction time of a change detection '
+        'dataset listed from directories')
+    parser.add_argument(
+        '--num-pairs', type=int, default=100000, help='number of pairs')
+    parser.add_argument(
+        '--num-zones',
+        type=int,
+        default=100,
+        help='number of sub-directories the pairs are spread over')
+    parser.add_argument(
+        '--work-dir',
+        default=None,
+        help='where to create the dummy dataset, a temporary directory by '
+        'default')
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='runs of each measurement')
+    args = parser.parse_args()
+    return args
+
+
+class LegacyLEVIR_CD_Dataset(LEVIR_CD_Dataset):
+    """Directory listing as done before ``index_cache``: three
+    ``list_dir_or_file`` walks and a sort of the data infos."""
+
+    def load_data_list(self):
+        data_list = []
+        img_dir_from = self.data_prefix.get('img_path_from', None)
+        img_dir_to = self.data_prefix.get('img_path_to', None)
+        ann_dir = self.data_prefix.get('seg_map_path', None)
+        list_kwargs = dict(
+            list_dir=False,
+            suffix=self.img_suffix,
+            recursive=True,
+            backend_args=self.backend_args)
+        file_list_from = fileio.list_dir_or_file(img_dir_from, **list_kwargs)
+        file_list_to = fileio.list_dir_or_file(img_dir_to, **list_kwargs)
+        assert sorted(list(file_list_from)) == sorted(list(file_list_to))
+        for img in fileio.list_dir_or_file(img_dir_from, **list_kwargs):
+            data_info = dict(img_path=[
+                osp.join(img_dir_from, img),
+                osp.join(img_dir_to, img)
+            ])
+            seg_map = img.replace(self.img_suffix, self.seg_map_suffix)
+            data_info['seg_map_path'] = osp.join(ann_dir, seg_map)
+            data_info['label_map'] = self.label_map
+            data_info['format_seg_map'] = self.format_seg_map
+            data_info['reduce_zero_label'] = self.reduce_zero_label
+            data_info['seg_fields'] = []
+            data_list.append(data_info)
+        return sorted(data_list, key=lambda x: x['img_path'])
+
+
+def make_pairs(root, zones, pairs_per_zone, start=0):
+    """Create empty A/B/label files, only the listing is benchmarked."""
+    for zone in zones:
+        for sub_dir in ('A', 'B', 'label'):
+            zone_dir = osp.join(root, sub_dir, zone)
+            os.makedirs(zone_dir, exist_ok=True)
+            for i in range(start, start + pairs_per_zone):
+                open(osp.join(zone_dir, f'{i:06d}.png'), 'wb').close()
+
+
+def build(dataset_type, root, **kwargs):
+    return dataset_type(
+        data_root=root,
+        data_prefix=dict(
+            img_path_from='A', img_path_to='B', seg_map_path='label'),
+        **kwargs)
+
+
+def timeit(name, repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        dataset = fn()
+        times.append(time.perf_counter() - start)
+    print(f'{name:<40}{min(times):>8.2f} s  ({len(dataset)} pairs)')
+    return dataset
+
+
+def main():
+    args = parse_args()
+    init_default_scope('opencd')
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as root:
+        pairs_per_zone = args.num_pairs // args.num_zones
+        zones = [f'zone_{z:04d}' for z in range(args.num_zones)]
+        print(f'creating {pairs_per_zone * args.num_zones} pairs in {root}')
+        make_pairs(root, zones, pairs_per_zone)
+        cache = osp.join(root, 'index_cache.pkl')
+
+        timeit('legacy listing', args.repeat,
+               lambda: build(LegacyLEVIR_CD_Dataset, root))
+        timeit('scandir, no cache', args.repeat,
+               lambda: build(LEVIR_CD_Dataset, root))
+        timeit('scandir, cold cache', 1,
+               lambda: build(LEVIR_CD_Dataset, root, index_cache=cache))
+        timeit('scandir, warm cache', args.repeat,
+               lambda: build(LEVIR_CD_Dataset, root, index_cache=cache))
+
+        # a new acquisition date in one zone, only that directory is listed
+        make_pairs(root, zones[:1], 100, start=pairs_per_zone)
+        timeit('scandir, cache after adding 100 pairs', 1,
+               lambda: build(LEVIR_CD_Dataset, root, index_cache=cache))
+
+
+if __name__ == '__main__':
+    main()
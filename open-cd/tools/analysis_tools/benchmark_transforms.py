@@ -0,0 +1,106 @@
+# Copyright (c) Open-CD. All rights reserved.
+import argparse
+import time
+
+import numpy as np
+from mmcv.transforms import Compose
+from mmengine.registry import init_default_scope
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the throughput of the bi-temporal training '
+        'augmentations, per-image against fused transforms')
+    parser.add_argument(
+        '--img-size', type=int, default=1024, help='size of the A/B images')
+    parser.add_argument(
+        '--crop-size', type=int, default=256, help='size of the random crop')
+    parser.add_argument(
+        '--num-samples',
+        type=int,
+        default=200,
+        help='number of samples pushed through each pipeline')
+    parser.add_argument(
+        '--seed', type=int, default=0, help='seed of the random images')
+    args = parser.parse_args()
+    return args
+
+
+def augmentations(crop_size, fused, rotate_crop=False):
+    """The augmentations of the BAN LEVIR-CD training pipeline."""
+    prefix = 'MultiImgFused' if fused else 'MultiImg'
+    if rotate_crop:
+        geometric = [
+            dict(
+                type='MultiImgRandomRotateCrop',
+                crop_size=(crop_size, crop_size),
+                prob=0.5,
+                degree=180,
+                cat_max_ratio=0.75)
+        ]
+    else:
+        geometric = [
+            dict(type=f'{prefix}RandomRotate', prob=0.5, degree=180),
+            dict(
+                type=f'{prefix}RandomCrop',
+                crop_size=(crop_size, crop_size),
+                cat_max_ratio=0.75)
+        ]
+    return geometric + [
+        dict(type=f'{prefix}RandomFlip', prob=0.5, direction='horizontal'),
+        dict(type=f'{prefix}RandomFlip', prob=0.5, direction='vertical'),
+        dict(
+            type=f'{prefix}PhotoMetricDistortion',
+            brightness_delta=10,
+            contrast_range=(0.8, 1.2),
+            saturation_range=(0.8, 1.2),
+            hue_delta=10),
+        dict(type='MultiImgPackSegInputs', compact_labels=True)
+    ]
+
+
+def make_sample(size, rng):
+    """A decoded sample, as left by the loading transforms."""
+    label = np.zeros((size, size), dtype=np.uint8)
+    label[size // 4:size // 2, size // 4:size // 2] = 1
+    return dict(
+        img=[
+            rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+            for _ in range(2)
+        ],
+        img_path=['a.png', 'b.png'],
+        seg_map_path='label.png',
+        img_shape=(size, size),
+        ori_shape=(size, size),
+        gt_seg_map=label,
+        seg_fields=['gt_seg_map'])
+
+
+def measure(pipeline, sample, num_samples):
+    pipeline(dict(sample, img=list(sample['img'])))  # warm up
+    start = time.perf_counter()
+    for _ in range(num_samples):
+        pipeline(dict(sample, img=list(sample['img'])))
+    return num_samples / (time.perf_counter() - start)
+
+
+def main():
+    args = parse_args()
+    init_default_scope('opencd')
+    sample = make_sample(args.img_size, np.random.default_rng(args.seed))
+
+    # a single process, so this is the rate of one dataloader worker
+    print(f'{args.img_size}x{args.img_size} pairs cropped to '
+          f'{args.crop_size}x{args.crop_size}, samples/s per worker:')
+    rates = dict()
+    for name, fused, rotate_crop in (('per-image', False, False),
+                                     ('fused', True, False),
+                                     ('rotate-crop', True, True)):
+        pipeline = Compose(augmentations(args.crop_size, fused, rotate_crop))
+        rates[name] = measure(pipeline, sample, args.num_samples)
+        speedup = rates[name] / rates['per-image']
+        print(f'{name:<14}{rates[name]:>10.1f}{speedup:>8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# Copyright (c) Open-CD. All rights reserved.
+import argparse
+import glob
+import json
+import os.path as osp
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compare how fast training runs reach a validation '
+        'metric, from the scalars logged in their work dirs')
+    parser.add_argument('work_dirs', nargs='+', help='work dirs of the runs')
+    parser.add_argument(
+        '--metric', default='mFscore', help='validation metric to compare')
+    parser.add_argument(
+        '--target',
+        type=float,
+        default=None,
+        help='report the first validated iteration reaching this value')
+    args = parser.parse_args()
+    return args
+
+
+def load_curve(work_dir, metric):
+    """(iteration, value) of ``metric`` in the latest run of ``work_dir``."""
+    scalars = sorted(
+        glob.glob(osp.join(work_dir, '*', 'vis_data', 'scalars.json')))
+    if not scalars:
+        raise FileNotFoundError(f'no vis_data/scalars.json in {work_dir}')
+    curve = []
+    with open(scalars[-1]) as f:
+        for line in f:
+            record = json.loads(line)
+            if metric in record:
+                curve.append((record['step'], record[metric]))
+    return curve
+
+
+def main():
+    args = parse_args()
+    print(f'{"run":<40}{"best":>10}{"at iter":>10}{"target at":>12}')
+    for work_dir in args.work_dirs:
+        curve = load_curve(work_dir, args.metric)
+        if not curve:
+            print(f'{work_dir:<40}{"-":>10}{"-":>10}{"-":>12}')
+            continue
+        best_iter, best = max(curve, key=lambda point: point[1])
+        reached = '-'
+        if args.target is not None:
+            reached = next((str(step) for step, value in curve
+                            if value >= args.target), 'never')
+        print(f'{work_dir:<40}{best:>10.2f}{best_iter:>10}{reached:>12}')
+
+
+if __name__ == '__main__':
+    main()
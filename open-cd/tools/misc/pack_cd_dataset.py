@@ -0,0 +1,209 @@
+# Copyright (c) Open-CD. All rights reserved.
+import argparse
+import io
+import os
+import os.path as osp
+import tarfile
+
+import mmcv
+import mmengine
+import mmengine.fileio as fileio
+import numpy as np
+from mmengine.config import Config, DictAction
+from mmengine.registry import init_default_scope
+from mmengine.utils import ProgressBar
+
+from opencd.registry import DATASETS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Pack a change detection dataset into large shards '
+        'read by PackedCDDataset')
+    parser.add_argument('config', help='config file of the dataset')
+    parser.add_argument('out_dir', help='directory of the shards and index')
+    parser.add_argument(
+        '--split',
+        default='train',
+        choices=['train', 'val', 'test'],
+        help='which dataloader of the config to pack')
+    parser.add_argument(
+        '--format',
+        default='bin',
+        choices=['bin', 'tar', 'decoded'],
+        help='`bin` writes raw byte blobs, `tar` WebDataset style archives '
+        'with `{key}.from`, `{key}.to` and `{key}.label` members, `decoded` '
+        'a single file of decoded uint8 images that is never re-decoded')
+    parser.add_argument(
+        '--shard-size',
+        type=int,
+        default=1024,
+        help='approximate size of a shard in MB, ignored for `decoded`')
+    parser.add_argument(
+        '--cfg-options',
+        nargs='+',
+        action=DictAction,
+        help='override some settings in the used config, the key-value pair '
+        'in xxx=yyy format will be merged into config file. If the value to '
+        'be overwritten is a list, it should be like key="[a,b]" or key=a,b '
+        'It also allows nested list/tuple values, e.g. key="[(a,b),(c,d)]" '
+        'Note that the quotation marks are necessary and that no white space '
+        'is allowed.')
+    args = parser.parse_args()
+    return args
+
+
+class BinShardWriter:
+    """Concatenate files into a raw shard, returning their byte spans."""
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.size = 0
+
+    def add(self, name, content):
+        span = [self.size, len(content)]
+        self.file.write(content)
+        self.size += len(content)
+        return span
+
+    def close(self):
+        self.file.close()
+
+
+class TarShardWriter:
+    """Write files as members of a tar shard, returning their byte spans.
+
+    Tar stores every member contiguously right after its header, so the
+    span of the data can be read back without the tarfile module.
+    """
+
+    def __init__(self, path):
+        self.tar = tarfile.open(path, 'w', format=tarfile.USTAR_FORMAT)
+
+    @property
+    def size(self):
+        return self.tar.offset
+
+    def add(self, name, content):
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        header = info.tobuf(self.tar.format, self.tar.encoding,
+                            self.tar.errors)
+        span = [self.tar.offset + len(header), len(content)]
+        self.tar.addfile(info, io.BytesIO(content))
+        return span
+
+    def close(self):
+        self.tar.close()
+
+
+class DecodedShardWriter(BinShardWriter):
+    """Append decoded uint8 images, returning their (offset, shape)."""
+
+    def add(self, name, content):
+        content = np.ascontiguousarray(content, dtype=np.uint8)
+        span = [self.size, list(content.shape)]
+        content.tofile(self.file)
+        self.size += content.nbytes
+        return span
+
+
+def find_transform(pipeline, type_name):
+    for transform in pipeline:
+        if transform['type'] == type_name:
+            return transform
+    return dict()
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
+    init_default_scope(cfg.get('default_scope', 'opencd'))
+
+    dataset_cfg = cfg[f'{args.split}_dataloader'].dataset
+    pipeline = dataset_cfg.pipeline
+    dataset_cfg.pipeline = []
+    dataset = DATASETS.build(dataset_cfg)
+    backend_args = dataset_cfg.get('backend_args', None)
+
+    # decode exactly like the loading transforms of the pipeline would
+    img_loader = find_transform(pipeline, 'MultiImgLoadImageFromFile')
+    ann_loader = find_transform(pipeline, 'MultiImgLoadAnnotations')
+
+    def read_img(path):
+        content = fileio.get(path, backend_args=backend_args)
+        if args.format != 'decoded':
+            return content
+        return mmcv.imfrombytes(
+            content,
+            flag=img_loader.get('color_type', 'color'),
+            backend=img_loader.get('imdecode_backend', 'cv2'))
+
+    def read_seg_map(path):
+        content = fileio.get(path, backend_args=backend_args)
+        if args.format != 'decoded':
+            return content
+        return mmcv.imfrombytes(
+            content,
+            flag='grayscale',
+            backend=ann_loader.get('imdecode_backend', 'pillow'))
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    writer_type = dict(
+        bin=BinShardWriter, tar=TarShardWriter,
+        decoded=DecodedShardWriter)[args.format]
+    shard_bytes = args.shard_size * 1024**2
+    if args.format == 'decoded':
+        # a single file, so every image is one slice of the same mapping
+        shard_bytes = float('inf')
+    shards, samples = [], []
+    writer = None
+
+    progress_bar = ProgressBar(len(dataset))
+    for idx in range(len(dataset)):
+        if writer is None or writer.size >= shard_bytes:
+            if writer is not None:
+                writer.close()
+            shards.append(f'shard_{len(shards):05d}.{args.format}')
+            writer = writer_type(osp.join(args.out_dir, shards[-1]))
+
+        data_info = dataset.get_data_info(idx)
+        key = f'{idx:08d}'
+        sample = dict(
+            img_path=data_info['img_path'],
+            shard=len(shards) - 1,
+            img=[
+                writer.add(f'{key}.{suffix}{osp.splitext(path)[1]}',
+                           read_img(path))
+                for suffix, path in zip(('from', 'to'),
+                                        data_info['img_path'])
+            ])
+        seg_map_path = data_info.get('seg_map_path', None)
+        if seg_map_path is not None:
+            sample['seg_map_path'] = seg_map_path
+            sample['seg_map'] = writer.add(
+                f'{key}.label{osp.splitext(seg_map_path)[1]}',
+                read_seg_map(seg_map_path))
+        samples.append(sample)
+        progress_bar.update()
+    if writer is not None:
+        writer.close()
+
+    metainfo = dataset.metainfo
+    meta = dict(
+        metainfo=dict(
+            classes=list(metainfo['classes']),
+            palette=[list(c) for c in metainfo['palette']]),
+        format_seg_map=dataset.format_seg_map,
+        format=args.format)
+    mmengine.dump(
+        dict(meta=meta, shards=shards, samples=samples),
+        osp.join(args.out_dir, 'index.json'))
+    print(f'\n{len(samples)} samples packed into {len(shards)} shards '
+          f'in {args.out_dir}')
+
+
+if __name__ == '__main__':
+    main()